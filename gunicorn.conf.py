@@ -0,0 +1,100 @@
+'''
+gunicorn.conf.py - settings for the web server.
+
+gunicorn reads this file automatically when it starts from the project
+folder (Procfile: `web: gunicorn`). Anything set here can still be
+overridden on the command line.
+
+WORKERS: class, count and threads come from plottwist/serverconfig.py
+- worked out from the CPU count unless set with GUNICORN_WORKER_CLASS,
+WEB_CONCURRENCY, GUNICORN_THREADS. Compare the options on your own
+data with `python manage.py benchmark gunicorn`.
+
+FAST, READY WORKERS:
+- preload_app = True: Django is loaded ONCE, in the gunicorn master,
+  before any worker exists. Workers are forked from it ready-made,
+  instead of each importing everything again - faster boots and less
+  memory (the workers share the master's copy).
+- when_ready: the master warms up the URL patterns and serializers
+  (plottwist/warmup.py) before the first worker is forked.
+- post_worker_init: a sync worker opens its own database connection
+  before it accepts requests. gthread / uvicorn workers don't: Django
+  connections belong to a thread, and no request thread would ever use
+  (or close) one opened here - the pool's min_size pre-connects instead.
+
+The catch with preload_app: code changes need a full restart (not a
+HUP) - which is what a deploy does anyway.
+'''
+
+import os
+
+from plottwist.serverconfig import profile
+
+# ============================================================
+# WORKERS - worked out from the CPU count, overridable by env
+# ============================================================
+_profile = profile()
+worker_class = _profile['worker_class']
+wsgi_app = _profile['wsgi_app'] # so the Procfile can just say `gunicorn`
+workers = _profile['workers']
+threads = _profile['threads']
+# settings.py sizes each worker's database pool from these - make sure it sees what we picked
+os.environ['GUNICORN_WORKER_CLASS'] = _profile['name']
+os.environ['GUNICORN_THREADS'] = str(threads)
+
+# ============================================================
+# RECYCLING - against slow memory growth
+# ============================================================
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = max_requests // 10
+"""
+A worker is replaced by a fresh one after max_requests requests, so
+memory a long-running process slowly accumulates is given back. The
+jitter (a random 0-100 extra per worker) stops every worker restarting
+at the same moment. 0 = never recycle.
+"""
+
+# ============================================================
+# TIMEOUTS
+# ============================================================
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 28))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 20))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+"""
+- timeout: a worker silent for this long is killed and replaced. Just
+  under Heroku's 30 s router limit - past that the client has already
+  been given an error anyway.
+- graceful_timeout: on a restart or deploy, workers get this long to
+  finish the requests they're serving (Heroku sends SIGKILL after 30 s).
+- keepalive: seconds an idle client connection is held open
+  (gthread / uvicorn only).
+"""
+
+# ============================================================
+# START-UP
+# ============================================================
+preload_app = True
+
+
+def when_ready(server):
+    """Runs in the master once the app is loaded, before workers are forked."""
+    if server.cfg.preload_app:
+        from plottwist import warmup
+        server.log.info('Warm-up done (ms): %s', warmup.warm_up())
+
+
+def pre_fork(server, worker):
+    # Nothing should have opened a connection in the master, but if it did,
+    # close it: a socket shared by two processes corrupts both sides' traffic
+    if server.cfg.preload_app:
+        from django.db import connections
+        connections.close_all()
+
+
+def post_worker_init(worker):
+    """Runs in each worker once it has the app, before it accepts requests."""
+    from plottwist import warmup
+    if not worker.cfg.preload_app:
+        warmup.warm_up()
+    if worker.cfg.worker_class_str == 'sync':
+        warmup.connect_databases()  # the one thread that will serve every request
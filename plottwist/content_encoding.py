@@ -0,0 +1,89 @@
+'''
+content_encoding.py - the response compression codecs CompressionMiddleware can use.
+
+gzip is always available (standard library). brotli and zstd are used
+only when their optional packages are installed:
+    pip install brotli       → "br"
+    pip install zstandard    → "zstd"  (built in from Python 3.14)
+'''
+
+import gzip
+
+try:
+    import brotli
+except ImportError:  # optional
+    brotli = None
+
+try:
+    from compression import zstd as _stdlib_zstd  # Python 3.14+
+except ImportError:
+    _stdlib_zstd = None
+
+try:
+    import zstandard
+except ImportError:  # optional
+    zstandard = None
+
+
+def _zstd_compress(data):
+    if _stdlib_zstd is not None:
+        return _stdlib_zstd.compress(data, level=6)
+    # A compressor object is not thread-safe, so make one per call
+    return zstandard.ZstdCompressor(level=6).compress(data)
+
+
+def _gzip_compress(data):
+    # mtime=0 → the same input always gives the same bytes (cache friendly)
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+
+def _brotli_compress(data):
+    # Quality 5 is a good speed/size balance for dynamic responses (11 = max, slow)
+    return brotli.compress(data, quality=5)
+
+
+# Server preference order: best compression first
+CODECS = {}
+if brotli is not None:
+    CODECS['br'] = _brotli_compress
+if _stdlib_zstd is not None or zstandard is not None:
+    CODECS['zstd'] = _zstd_compress
+CODECS['gzip'] = _gzip_compress
+
+
+def choose_encoding(accept_encoding):
+    """
+    Pick the codec the client likes best (highest q=), or None.
+    When the client likes several equally, our order in CODECS decides.
+    q=0 means "never send me this".
+
+    'gzip, deflate, br;q=0.9'  → 'gzip' (the client prefers it)
+    'gzip, br'                 → 'br' (if installed) else 'gzip'
+    'gzip;q=0, identity'       → None
+    '*;q=0.5, gzip;q=0'        → 'br' or 'zstd' if installed, else None
+    """
+    accepted = {}
+    for part in accept_encoding.split(','):
+        name, *params = part.split(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params:
+            key, _, value = param.strip().partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = min(max(float(value), 0.0), 1.0)
+                except ValueError:
+                    quality = 0.0
+        accepted[name] = quality
+    best, best_quality = None, 0.0
+    for encoding in CODECS:
+        quality = accepted.get(encoding, accepted.get('*', 0.0))
+        if quality > best_quality:  # strictly better - on a tie the earlier (preferred) codec stays
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(encoding, data):
+    return CODECS[encoding](data)
@@ -0,0 +1,75 @@
+'''
+db_routers.py - decides WHICH database each query goes to.
+
+With read replicas configured (DATABASE_REPLICA_URLS), safe GET/HEAD
+requests read from a replica while every write goes to the primary
+('default'). Once a request writes, or when the client wrote recently
+(see ReplicaRoutingMiddleware), reads stick to the primary so nobody
+reads stale data right after saving it.
+
+Outside a web request (shell, management commands, migrations)
+everything uses the primary.
+'''
+
+import contextvars
+import random
+
+from django.conf import settings
+from django.db import connections
+
+PRIMARY = 'default'
+
+
+class _RequestRouting:
+    """Routing state for the request currently being handled."""
+    def __init__(self, use_primary):
+        self.use_primary = use_primary
+        self.wrote = False
+
+
+_current = contextvars.ContextVar('plottwist_db_routing', default=None)
+
+
+def start_request(use_primary):
+    """Called by the middleware when a request comes in. Returns a token for end_request()."""
+    return _current.set(_RequestRouting(use_primary))
+
+
+def end_request(token):
+    """Called by the middleware when the request is done. Returns True if the request wrote."""
+    state = _current.get()
+    _current.reset(token)
+    return bool(state and state.wrote)
+
+
+class PrimaryReplicaRouter:
+    """
+    Django database router: reads → a random replica, writes → primary.
+
+    Enabled in settings.py only when DATABASE_REPLICA_URLS is set.
+    """
+    def db_for_read(self, model, **hints):
+        state = _current.get()
+        if state is None or state.use_primary or not settings.DATABASE_REPLICAS:
+            return PRIMARY
+        if connections[PRIMARY].in_atomic_block:
+            # Inside a transaction: read what the transaction can see
+            return PRIMARY
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        state = _current.get()
+        if state is not None:
+            # From now on this request must read its own writes
+            state.use_primary = True
+            state.wrote = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary, so relations across them are fine
+        allowed = {PRIMARY, *settings.DATABASE_REPLICAS}
+        return obj1._state.db in allowed and obj2._state.db in allowed
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive schema changes through replication, never directly
+        return db == PRIMARY
@@ -0,0 +1,46 @@
+'''
+dbconfig.py - helpers settings.py uses to build the DATABASES setting.
+
+Kept out of settings.py so the sizing rules are in one readable place.
+'''
+
+import importlib.util
+
+# How many requests can run at the same time INSIDE one gunicorn worker
+WORKER_CONCURRENCY = {
+    'sync': lambda threads: 1,            # one request at a time
+    'gthread': lambda threads: threads,   # one request per thread
+    'uvicorn': lambda threads: 10,        # async: many requests share one worker
+}
+
+
+def pool_available():
+    """Django's built-in pool needs psycopg 3 + psycopg_pool (pip install "psycopg[binary,pool]")."""
+    return (
+        importlib.util.find_spec('psycopg') is not None
+        and importlib.util.find_spec('psycopg_pool') is not None
+    )
+
+
+def pool_options(worker_class, threads, min_size=None, max_size=None, timeout=10):
+    """
+    Pool sizes for ONE gunicorn worker process.
+
+    Every worker process gets its own pool, so the sizes are per worker:
+    - sync     → max 1 (+1 spare for management work)
+    - gthread  → max = threads (+1 spare)
+    - uvicorn  → max 10 (+1 spare)
+
+    Remember: total connections = workers × max_size.
+    Heroku's hobby Postgres allows 20, so keep an eye on it!
+    """
+    concurrency = WORKER_CONCURRENCY.get(worker_class, WORKER_CONCURRENCY['sync'])(threads)
+    if max_size is None:
+        max_size = concurrency + 1
+    if min_size is None:
+        min_size = min(concurrency, max_size)
+    return {
+        'min_size': min_size,
+        'max_size': max_size,
+        'timeout': timeout,  # seconds to wait for a free connection before erroring
+    }
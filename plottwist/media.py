@@ -0,0 +1,208 @@
+'''
+media.py - stores and serves uploads (project images) from MEDIA_ROOT
+when Cloudinary isn't configured, so a self-hosted server without a CDN
+can serve them properly, not just in DEBUG.
+
+HASHED NAMES:
+HashedMediaStorage names every upload after its content, the way
+WhiteNoise names static files:
+
+    project_images/cover.jpg → project_images/cover.3f9a1c0b7e42.jpg
+
+A name can then never point at different bytes, so browsers and proxies
+are told to keep the file for a year without asking again (immutable).
+A new image gets a new name - and the API hands out the new URL. Uploading
+the same image twice stores it once.
+
+SERVING (serve):
+- ETag / Last-Modified, and 304 Not Modified when the browser has it already
+- Range requests (206 Partial Content), so big files can be resumed / seeked
+- MEDIA_ACCEL hands the actual sending to the web server in front of
+  Django, so no Django worker is tied up while a file downloads:
+
+    MEDIA_ACCEL = 'nginx'     X-Accel-Redirect: MEDIA_ACCEL_PREFIX + name
+    MEDIA_ACCEL = 'sendfile'  X-Sendfile: /full/path  (Apache mod_xsendfile, lighttpd)
+
+  nginx needs an internal location pointing at MEDIA_ROOT:
+
+    location /protected-media/ {
+        internal;
+        alias /app/media/;
+    }
+
+Without MEDIA_ACCEL Django sends the file itself; under gunicorn a whole
+file still goes out with the kernel's sendfile(), not through Python.
+'''
+
+import hashlib
+import mimetypes
+import os
+import posixpath
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotAllowed
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+HASH_LENGTH = 12
+
+# "cover.3f9a1c0b7e42.jpg" → "3f9a1c0b7e42"
+HASHED_NAME = re.compile(r'\.([0-9a-f]{%d})(\.[^./]*)?$' % HASH_LENGTH)
+
+# Only single ranges are served as 206; anything else gets the whole file (allowed by RFC 9110)
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+ONE_YEAR = 365 * 24 * 60 * 60
+BLOCK_SIZE = 64 * 1024
+
+
+class HashedMediaStorage(FileSystemStorage):
+    """FileSystemStorage that names each file after a hash of its content."""
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+
+        directory, filename = posixpath.split(name.replace('\\', '/'))
+        stem, extension = posixpath.splitext(filename)
+        stem = re.sub(r'\.[0-9a-f]{%d}$' % HASH_LENGTH, '', stem)  # re-saving an already hashed file
+        suffix = f'.{digest.hexdigest()[:HASH_LENGTH]}{extension}'
+        if max_length:
+            # Shorten the readable part, never the hash
+            stem = stem[:max(max_length - len(directory) - 1 - len(suffix), 1)]
+        name = posixpath.join(directory, stem + suffix)
+        if self.exists(name):
+            return name  # same name = same bytes, already stored
+        return super().save(name, content, max_length=max_length)
+
+
+def content_hash(name):
+    """The hash in a HashedMediaStorage name, or None for older uploads."""
+    match = HASHED_NAME.search(name)
+    return match.group(1) if match else None
+
+
+def byte_range(header, size):
+    """
+    'bytes=0-499' → (first, last) byte offsets, both inclusive.
+    None = serve the whole file (no header, several ranges or a malformed one),
+    False = nothing of this file is in the range (416).
+    """
+    match = RANGE.match(header.strip()) if header else None
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:  # bytes=-500 → the last 500 bytes
+        length = int(last)
+        return (max(size - length, 0), size - 1) if length and size else False
+    first, last = int(first), int(last) if last else None
+    if last is not None and last < first:
+        return None
+    if first >= size:
+        return False
+    return first, size - 1 if last is None else min(last, size - 1)
+
+
+class _Slice:
+    """A file that reads no further than `length` bytes from where it is."""
+    def __init__(self, file, length):
+        self.file, self.remaining = file, length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def serve(request, path):
+    """GET /media/<path> - one file from MEDIA_ROOT."""
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        info = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError, ValueError):
+        raise Http404('No such file')
+    if not stat.S_ISREG(info.st_mode):
+        raise Http404('No such file')
+
+    hashed = content_hash(path)
+    etag = f'"{hashed}"' if hashed else f'"{int(info.st_mtime):x}-{info.st_size:x}"'
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(info.st_mtime),
+        'Cache-Control': (
+            f'public, max-age={ONE_YEAR}, immutable' if hashed
+            else f'public, max-age={settings.MEDIA_MAX_AGE}'
+        ),
+    }
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(info.st_mtime))
+    if not_modified is not None:  # 304, or 412 for a failed If-Match
+        for header, value in headers.items():
+            not_modified[header] = value
+        return not_modified
+
+    content_type, encoding = mimetypes.guess_type(full_path)
+    if encoding:  # e.g. .gz - sent as is, not decompressed by the browser
+        content_type = None
+    content_type = content_type or 'application/octet-stream'
+
+    if settings.MEDIA_ACCEL:
+        # The server in front sends the file (and answers Range requests itself)
+        response = HttpResponse(content_type=content_type)
+        if settings.MEDIA_ACCEL == 'nginx':
+            response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX + quote(path)
+        else:
+            response['X-Sendfile'] = full_path
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+    size = info.st_size
+    wanted = byte_range(request.META.get('HTTP_RANGE'), size)
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if wanted is not None and if_range and if_range != etag and parse_http_date_safe(if_range) != int(info.st_mtime):
+        wanted = None  # the browser's partial copy is of an older file - start again
+
+    if wanted is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    first, last = wanted or (0, size - 1)
+    length = last - first + 1 if size else 0
+    if request.method == 'HEAD':
+        response = HttpResponse(content_type=content_type, status=206 if wanted else 200)
+    else:
+        file = open(full_path, 'rb')
+        if wanted:
+            file.seek(first)
+            response = FileResponse(_Slice(file, length), content_type=content_type, status=206)
+        else:
+            response = FileResponse(file, content_type=content_type)
+        response.block_size = BLOCK_SIZE
+    if wanted:
+        response['Content-Range'] = f'bytes {first}-{last}/{size}'
+    response['Content-Length'] = str(length)
+    response['Accept-Ranges'] = 'bytes'
+    for header, value in headers.items():
+        response[header] = value
+    return response
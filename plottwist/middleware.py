@@ -0,0 +1,110 @@
+'''
+middleware.py - project-wide request/response "checkpoints".
+
+See the MIDDLEWARE list in settings.py for where each one sits.
+'''
+
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import patch_vary_headers
+
+from . import content_encoding, db_routers
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Tells the database router whether this request may read from a replica.
+
+    - Safe requests (GET/HEAD/OPTIONS) read from replicas...
+    - ...unless the same client wrote within the last REPLICA_STICKY_SECONDS,
+      so "create project → open project page" never shows stale data
+      while the replica catches up.
+    - Everything else (POST/PUT/DELETE) uses the primary for the whole request.
+
+    "Same client" = same auth token, or same IP address when logged out.
+    The token is hashed before it is used as a cache key.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        pin_key = self.pin_key(request)
+        is_write = request.method not in SAFE_METHODS
+        token = db_routers.start_request(use_primary=is_write or bool(cache.get(pin_key)))
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = db_routers.end_request(token)
+        if is_write or wrote:
+            cache.set(pin_key, True, settings.REPLICA_STICKY_SECONDS)
+        return response
+
+    @staticmethod
+    def pin_key(request):
+        client = request.META.get('HTTP_AUTHORIZATION') or request.META.get('REMOTE_ADDR', '')
+        return 'replica-pin:' + hashlib.sha256(client.encode()).hexdigest()
+
+
+class CompressionMiddleware:
+    """
+    Compresses large text/JSON responses with the best encoding the client
+    accepts: brotli ("br") or zstd if installed, otherwise gzip.
+
+    Story text compresses to a fraction of its size, but compressing a
+    big story on EVERY request wastes CPU. So compressed bodies are kept
+    in the cache, keyed by encoding + a hash of the uncompressed body:
+    the first reader of a story version pays for compression, everyone
+    after that gets the stored bytes. When the story changes, its body
+    (and so its hash) changes, and the new version is compressed once.
+
+    Small responses (< COMPRESSION_MIN_SIZE bytes) are left alone - they
+    don't gain much, and skipping them keeps short secrets such as
+    login tokens out of compressed responses.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if (
+            response.streaming
+            or response.status_code != 200
+            or response.has_header('Content-Encoding')
+            or len(response.content) < settings.COMPRESSION_MIN_SIZE
+            or response.get('Content-Type', '').split(';')[0].strip() not in settings.COMPRESSION_CONTENT_TYPES
+        ):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = content_encoding.choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+
+        body = response.content
+        cache_key = None
+        compressed = None
+        if len(body) >= settings.COMPRESSION_CACHE_MIN_SIZE:
+            cache_key = f'compressed:{encoding}:' + hashlib.blake2b(body, digest_size=20).hexdigest()
+            compressed = cache.get(cache_key)
+        if compressed is None:
+            compressed = content_encoding.compress(encoding, body)
+            if cache_key:
+                cache.set(cache_key, compressed, settings.COMPRESSION_CACHE_SECONDS)
+        if len(compressed) >= len(body):
+            return response
+
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        # The compressed bytes differ from the original, so a strong ETag would lie
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
@@ -0,0 +1,95 @@
+'''
+serverconfig.py - helpers gunicorn.conf.py uses to size the web server.
+
+Kept out of gunicorn.conf.py so the sizing rules can be imported (and
+compared) by `python manage.py benchmark gunicorn` without starting a
+server.
+
+WORKER CLASSES:
+- sync     one request at a time per worker process. Simple, but a
+           request waiting on the database blocks its whole worker.
+- gthread  each worker runs several threads; while one waits on the
+           database, the others keep serving. Good fit for this API.
+- uvicorn  async worker running plottwist.asgi. Needs the optional
+           `uvicorn` package (pip install uvicorn).
+
+Any value can be forced with an environment variable; everything not
+set is worked out from the number of CPUs.
+'''
+
+import importlib.util
+import os
+
+from plottwist.dbconfig import WORKER_CONCURRENCY
+
+WORKER_CLASSES = {
+    'sync': 'sync',
+    'gthread': 'gthread',
+    'uvicorn': 'uvicorn.workers.UvicornWorker',
+}
+
+# gunicorn's app path for each worker class (uvicorn speaks ASGI, the others WSGI)
+APPS = {
+    'sync': 'plottwist.wsgi:application',
+    'gthread': 'plottwist.wsgi:application',
+    'uvicorn': 'plottwist.asgi:application',
+}
+
+DEFAULT_THREADS = 4
+
+
+def uvicorn_available():
+    return importlib.util.find_spec('uvicorn') is not None
+
+
+def default_workers(worker_class, cpus):
+    """
+    Processes per machine:
+    - sync: 2 × CPUs + 1 (the classic rule - workers spend much of their time waiting)
+    - gthread: CPUs + 1 (the threads do the waiting)
+    - uvicorn: one per CPU (one process already serves many requests)
+    """
+    if worker_class == 'sync':
+        return 2 * cpus + 1
+    if worker_class == 'gthread':
+        return cpus + 1
+    return max(cpus, 1)
+
+
+def profile(env=None, cpus=None):
+    """
+    The gunicorn worker settings for this machine:
+    {'worker_class', 'wsgi_app', 'workers', 'threads'}
+
+    Environment variables (all optional):
+        GUNICORN_WORKER_CLASS  sync | gthread | uvicorn   (default gthread)
+        GUNICORN_THREADS       threads per gthread worker (default 4)
+        WEB_CONCURRENCY        number of workers (Heroku sets this per dyno size)
+        GUNICORN_MAX_WORKERS   upper limit for the worked-out number (default 12)
+        DB_MAX_CONNECTIONS     the database's connection limit - workers are
+                               capped so they can't open more than this
+    """
+    env = os.environ if env is None else env
+    cpus = cpus or os.cpu_count() or 1
+    name = env.get('GUNICORN_WORKER_CLASS', 'gthread')
+    if name not in WORKER_CLASSES:
+        raise ValueError(f"GUNICORN_WORKER_CLASS must be one of {', '.join(WORKER_CLASSES)}, not {name!r}")
+    if name == 'uvicorn' and not uvicorn_available():
+        raise ValueError('GUNICORN_WORKER_CLASS=uvicorn needs the uvicorn package: pip install uvicorn')
+    threads = int(env.get('GUNICORN_THREADS', DEFAULT_THREADS if name == 'gthread' else 1))
+
+    if env.get('WEB_CONCURRENCY'):
+        workers = int(env['WEB_CONCURRENCY'])
+    else:
+        workers = min(default_workers(name, cpus), int(env.get('GUNICORN_MAX_WORKERS', 12)))
+        if env.get('DB_MAX_CONNECTIONS'):
+            # Each worker may hold one connection per concurrent request, +1 spare (see dbconfig.py)
+            per_worker = WORKER_CONCURRENCY[name](threads) + 1
+            workers = min(workers, max(int(env['DB_MAX_CONNECTIONS']) // per_worker, 1))
+    return {
+        'worker_class': WORKER_CLASSES[name],
+        'wsgi_app': APPS[name],
+        'workers': max(workers, 1),
+        'threads': threads,
+        'name': name,
+    }
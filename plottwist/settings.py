@@ -16,17 +16,23 @@ Generated by 'django-admin startproject' using Django 5.1.
 from pathlib import Path
 import os
 import dj_database_url
-from dotenv import load_dotenv
+from django.core.exceptions import ImproperlyConfigured
+from plottwist.dbconfig import pool_available, pool_options
 
 
 # ============================================================
 # ENVIRONMENT VARIABLES
 # ============================================================
 
-load_dotenv("../.env")
+DOTENV_PATH = "../.env"
+if os.path.exists(DOTENV_PATH):
+    from dotenv import load_dotenv # only imported when there's a file to read
+    load_dotenv(DOTENV_PATH)
 
 """
 Loads secret values from a .env file (which is NOT in git!)
+On Heroku there is no .env - config vars are already in the environment -
+so the file check saves importing python-dotenv on every boot.
 
 Your .env file might look like:
     DJANGO_SECRET_KEY=some-super-secret-key
@@ -114,12 +120,30 @@ CORS_ALLOW_HEADERS = [
     "accept",
     "authorization", # Important! Allows your auth token to be sent
     "content-type",
+    "idempotency-key", # lets the frontend retry POSTs safely (projects/idempotency.py)
+    "if-match", # "only save if nobody else changed it" (projects/concurrency.py)
     "user-agent",
 ]
 
+CORS_EXPOSE_HEADERS = [
+    "etag", # the version of a project / pledge, to send back as If-Match
+    "idempotent-replayed", # "true" when a retried POST got its stored response back
+    "retry-after", # sent with 429 (throttled) and 409 (still processing)
+] # Response headers the frontend's JavaScript is allowed to read
+
 # ============================================================
 # INSTALLED APPS - What's "plugged in" to Django
 # ============================================================
+USE_CLOUDINARY = bool(
+    os.environ.get('CLOUDINARY_URL')
+    or (os.environ.get('CLOUDINARY_CLOUD_NAME') and os.environ.get('CLOUDINARY_API_KEY') and os.environ.get('CLOUDINARY_API_SECRET'))
+)
+"""
+Cloudinary (and the HTTP libraries it pulls in) is only imported when
+its credentials are set. Without them - local development, CI, the
+release step - uploads are stored on disk in MEDIA_ROOT instead.
+"""
+
 INSTALLED_APPS = [
     # YOUR APPS (custom code)
     'projects.apps.ProjectsConfig', # Your projects app
@@ -129,8 +153,8 @@ INSTALLED_APPS = [
     'rest_framework',  # Django REST Framework - for building APIs
     'rest_framework.authtoken', # Token authentication
     'corsheaders', # CORS handling
-    'cloudinary_storage', # Cloudinary integration (BEFORE staticfiles!)
-    'cloudinary', # Cloudinary base package
+    *(['cloudinary_storage', 'cloudinary'] if USE_CLOUDINARY else []),
+    # Cloudinary integration (BEFORE staticfiles!) - only loaded when configured, see below
 
     # DJANGO BUILT-IN APPS
     'django.contrib.admin', # Admin panel at /admin/
@@ -160,7 +184,12 @@ This is why we created CustomUser in users/models.py
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.TokenAuthentication',
-    ]
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'projects.renderers.FastJSONRenderer', # JSONRenderer, but uses orjson if installed
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 1)),
 }
 """
 TOKEN AUTHENTICATION:
@@ -174,17 +203,28 @@ How it works:
 5. Django checks the token to identify the user
 
 This is standard for APIs that serve mobile apps or SPAs (React).
+
+NUM_PROXIES:
+How many proxies sit in front of Django (Heroku's router = 1). Each one
+adds the address it got the request from to the END of X-Forwarded-For,
+so the client's real IP is that many entries from the end - anything
+before it was written by the client and can be made up. The per-IP
+write throttle (projects/throttling.py) keys on that real IP. Set
+NUM_PROXIES=0 when nothing is in front (then REMOTE_ADDR is used), 2 if
+e.g. Cloudflare is in front of the router.
 """
 # ============================================================
 # MIDDLEWARE - Request/Response Processing Pipeline
 # ============================================================
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'plottwist.middleware.CompressionMiddleware', # gzip/brotli/zstd for big JSON responses
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware', # CORS - must be high up!
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'plottwist.middleware.ReplicaRoutingMiddleware', # Reads → replicas, writes → primary
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware', # Serves static files
@@ -196,14 +236,37 @@ Every response passes back through in reverse order.
 
 Think of it like airport security - each checkpoint does one thing:
 - SecurityMiddleware: HTTPS, security headers
+- CompressionMiddleware: Compress big responses (on the way OUT, so it sits high up)
 - SessionMiddleware: Session handling
 - CorsMiddleware: Add CORS headers
 - CommonMiddleware: URL normalization
 - CsrfViewMiddleware: CSRF protection
 - AuthenticationMiddleware: Attach user to request
+- ReplicaRoutingMiddleware: Pick primary or read replica for this request
 - WhiteNoiseMiddleware: Serve static files efficiently
 """
 
+# ============================================================
+# RESPONSE COMPRESSION
+# ============================================================
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))
+COMPRESSION_CACHE_MIN_SIZE = int(os.environ.get('COMPRESSION_CACHE_MIN_SIZE', '16384'))
+COMPRESSION_CACHE_SECONDS = int(os.environ.get('COMPRESSION_CACHE_SECONDS', '3600'))
+COMPRESSION_CONTENT_TYPES = {
+    'application/json',
+    'text/html',
+    'text/plain',
+    'text/markdown',
+}
+"""
+RESPONSE COMPRESSION (plottwist/middleware.py → CompressionMiddleware):
+- Responses smaller than COMPRESSION_MIN_SIZE bytes are sent as they are
+- Responses of COMPRESSION_CACHE_MIN_SIZE bytes or more (big stories!)
+  are compressed once per version and kept in the cache for
+  COMPRESSION_CACHE_SECONDS
+- Install `brotli` and/or `zstandard` to offer those encodings; gzip always works
+"""
+
 # ============================================================
 # URL & TEMPLATE CONFIGURATION
 # ============================================================
@@ -237,7 +300,8 @@ WSGI_APPLICATION = 'plottwist.wsgi.application'
 DATABASES = {
     'default': dj_database_url.config(
         default=f'sqlite:///{BASE_DIR}/db.sqlite3',
-        conn_max_age=600
+        conn_max_age=int(os.environ.get('DB_CONN_MAX_AGE', '600')),
+        conn_health_checks=True,
     )
 }
 """
@@ -251,6 +315,111 @@ Heroku automatically provides a PostgreSQL database and sets DATABASE_URL.
 So locally you use SQLite, on Heroku you use PostgreSQL - same code!
 
 conn_max_age=600: Keep database connections open for 10 minutes (performance)
+conn_health_checks=True: Before REUSING a kept-open connection at the start of
+    a request, Django checks it still works. Without this, a connection the
+    database dropped (restart, idle timeout) fails the first request that uses it.
+"""
+
+# ============================================================
+# DATABASE CONNECTION POOL (optional, PostgreSQL only)
+# ============================================================
+GUNICORN_WORKER_CLASS = os.environ.get('GUNICORN_WORKER_CLASS', 'sync')
+GUNICORN_THREADS = int(os.environ.get('GUNICORN_THREADS', '1'))
+DATABASE_POOL = os.environ.get('DATABASE_POOL', 'false').lower() in ('1', 'true', 'yes')
+
+if DATABASE_POOL and DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    if not pool_available():
+        raise ImproperlyConfigured(
+            'DATABASE_POOL=true needs psycopg 3 with the pool extra: pip install "psycopg[binary,pool]"'
+        )
+    DATABASES['default']['CONN_MAX_AGE'] = 0  # the pool replaces persistent connections
+    DATABASES['default'].setdefault('OPTIONS', {})['pool'] = pool_options(
+        GUNICORN_WORKER_CLASS,
+        GUNICORN_THREADS,
+        min_size=int(os.environ['DB_POOL_MIN_SIZE']) if 'DB_POOL_MIN_SIZE' in os.environ else None,
+        max_size=int(os.environ['DB_POOL_MAX_SIZE']) if 'DB_POOL_MAX_SIZE' in os.environ else None,
+        timeout=float(os.environ.get('DB_POOL_TIMEOUT', '10')),
+    )
+"""
+CONNECTION POOLING:
+
+Opening a PostgreSQL connection costs a TCP + TLS + auth round trip.
+Persistent connections (conn_max_age) help, but each request still
+holds a connection for its whole lifetime, and bursts open new ones.
+
+With DATABASE_POOL=true each gunicorn worker keeps a small pool of ready
+connections (Django 5.1+ built-in pool, psycopg 3 only):
+    DATABASE_POOL=true
+    GUNICORN_WORKER_CLASS=gthread   # sync | gthread | uvicorn - sizes the pool
+    GUNICORN_THREADS=4
+    DB_POOL_MIN_SIZE / DB_POOL_MAX_SIZE / DB_POOL_TIMEOUT  # optional overrides
+
+Measure the difference with:
+    python manage.py benchmark connections
+"""
+
+# ============================================================
+# READ REPLICAS (optional)
+# ============================================================
+DATABASE_REPLICAS = []
+for number, replica_url in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_URLS', '').split(',')), start=1):
+    alias = f'replica_{number}'
+    DATABASES[alias] = dj_database_url.parse(
+        replica_url.strip(),
+        conn_max_age=DATABASES['default']['CONN_MAX_AGE'],
+        conn_health_checks=True,
+    )
+    if 'pool' in DATABASES['default'].get('OPTIONS', {}):
+        DATABASES[alias].setdefault('OPTIONS', {})['pool'] = DATABASES['default']['OPTIONS']['pool']
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}  # tests: replicas are the same DB
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['plottwist.db_routers.PrimaryReplicaRouter'] if DATABASE_REPLICAS else []
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', '10'))
+"""
+READ REPLICAS:
+
+Comma-separated database URLs, e.g.
+    DATABASE_REPLICA_URLS=postgres://...replica1,postgres://...replica2
+
+become the databases 'replica_1', 'replica_2', ...
+
+- GET requests (/projects/, /projects/pledges/ ...) read from a random replica
+- Writes ALWAYS go to 'default' (the primary)
+- After a client writes, its reads stay on the primary for
+  REPLICA_STICKY_SECONDS so it sees its own changes
+
+Try it locally with two SQLite files:
+    cp db.sqlite3 replica.sqlite3
+    DATABASE_REPLICA_URLS=sqlite:///replica.sqlite3 python manage.py runserver
+
+See plottwist/db_routers.py and plottwist/middleware.py.
+"""
+
+# ============================================================
+# CACHE
+# ============================================================
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+"""
+CACHE:
+Shared memory for small, short-lived values (e.g. "this client just wrote").
+
+- With REDIS_URL set (Heroku Redis add-on), all workers share one cache
+  (needs: pip install redis).
+- Without it, each worker process has its own in-memory cache,
+  which is fine for development.
 """
 
 
@@ -307,7 +476,8 @@ MEDIA_ROOT = BASE_DIR / 'media'
 """
 MEDIA FILES: User-uploaded content (like project images)
 - These settings are somewhat overridden by Cloudinary now
-- But kept for local development fallback
+- But used whenever Cloudinary isn't configured: uploads are saved in
+  MEDIA_ROOT and served from MEDIA_URL by plottwist/media.py
 """
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -333,7 +503,10 @@ API_SECRET: Private key (keep secret!)
 
 STORAGES = {
     "default": {
-        "BACKEND": "cloudinary_storage.storage.MediaCloudinaryStorage",
+        "BACKEND": (
+            "cloudinary_storage.storage.MediaCloudinaryStorage" if USE_CLOUDINARY
+            else "plottwist.media.HashedMediaStorage"
+        ),
     },
     "staticfiles": {
         "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage",
@@ -344,9 +517,152 @@ STORAGES (Django 5+ way):
 
 "default" = Where to store MEDIA files (user uploads)
 → Uses Cloudinary! All ImageFields automatically upload to Cloudinary.
+  (Falls back to the local disk when Cloudinary isn't configured - USE_CLOUDINARY -
+   with content-hashed file names, see plottwist/media.py)
 
 "staticfiles" = Where to store STATIC files (CSS, JS, admin assets)
 → Uses WhiteNoise for efficient serving
 
 THIS IS THE KEY SETTING that makes Cloudinary work automatically!
-"""
\ No newline at end of file
+"""
+# ============================================================
+# PLOT TWIST FEATURE SETTINGS
+# ============================================================
+FACET_REFRESH_SECONDS = int(os.environ.get('FACET_REFRESH_SECONDS', '30'))
+"""
+FACET_REFRESH_SECONDS: how often each worker reloads the genre/content-type
+counts (projects/facets.py) from the database. Browse pages read them
+from memory in between.
+"""
+
+TRENDING_HALF_LIFE_HOURS = float(os.environ.get('TRENDING_HALF_LIFE_HOURS', '24'))
+TRENDING_PROGRESS_WEIGHT = float(os.environ.get('TRENDING_PROGRESS_WEIGHT', '1.0'))
+"""
+TRENDING (projects/trending.py):
+- TRENDING_HALF_LIFE_HOURS: after this long a pledge counts half as much
+- TRENDING_PROGRESS_WEIGHT: how much being close to the goal helps
+  (1.0 = a project at its goal scores up to 2× one with no progress)
+Run `python manage.py recompute_trending` after changing either.
+"""
+
+FEED_FANOUT_LIMIT = int(os.environ.get('FEED_FANOUT_LIMIT', '1000'))
+"""
+FEED_FANOUT_LIMIT (projects/feed.py): projects with more followers than this
+don't copy each pledge into every follower's feed; their pledges are
+merged in when a feed is read instead.
+"""
+
+WRITE_THROTTLE_RATES = {
+    'pledge_user': os.environ.get('THROTTLE_PLEDGE_USER', '20/min'),
+    'pledge_ip': os.environ.get('THROTTLE_PLEDGE_IP', '60/min'),
+    'pledge_project': os.environ.get('THROTTLE_PLEDGE_PROJECT', '60/min'),
+    'project_user': os.environ.get('THROTTLE_PROJECT_USER', '10/hour'),
+    'project_ip': os.environ.get('THROTTLE_PROJECT_IP', '30/hour'),
+}
+"""
+WRITE THROTTLES (projects/throttling.py):
+"20/min" = a burst of up to 20 writes, then one more every 3 seconds.
+Going over returns 429 Too Many Requests with a Retry-After header.
+- pledge_*: creating pledges, per user / per IP / per project
+- project_*: creating projects, per user / per IP
+Set a value to an empty string to switch that limit off.
+Buckets are rows in the ThrottleBucket table, shared by all workers;
+`python manage.py prune_throttle_buckets` deletes the ones that are full again.
+"""
+
+IDEMPOTENCY_KEY_TTL_HOURS = int(os.environ.get('IDEMPOTENCY_KEY_TTL_HOURS', 24))
+"""
+IDEMPOTENCY KEYS (projects/idempotency.py):
+How long a POST's Idempotency-Key and stored response are remembered.
+A retry within this window replays the original response; older keys
+are deleted by `python manage.py prune_idempotency_keys`.
+"""
+
+REVISION_SNAPSHOT_EVERY = int(os.environ.get('REVISION_SNAPSHOT_EVERY', 20))
+"""
+STORY REVISIONS (projects/revisions.py):
+Every Nth revision of a story is stored in full; the ones in between
+store only the lines that changed. Higher = less storage, but fetching
+an old revision may have to apply up to N-1 changes.
+"""
+
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', 90))
+ARCHIVE_CACHE_SECONDS = int(os.environ.get('ARCHIVE_CACHE_SECONDS', 3600))
+"""
+ARCHIVAL (projects/archive.py):
+- ARCHIVE_AFTER_DAYS: `python manage.py archive_projects` packs away the
+  text of projects closed at least this long
+- ARCHIVE_CACHE_SECONDS: how long an unpacked archive is kept in the
+  cache after someone reads that story
+"""
+
+STATS_REFRESH_DAYS = int(os.environ.get('STATS_REFRESH_DAYS', 2))
+"""
+ANALYTICS ROLLUPS (projects/rollups.py):
+Besides the days with new pledges / projects, `python manage.py build_rollups`
+always recounts the last N days (today included), so late changes like
+moderation approvals and deletes show up in /stats/.
+"""
+
+READING_WORDS_PER_MINUTE = int(os.environ.get('READING_WORDS_PER_MINUTE', 230))
+"""
+READING TIME (/projects/1/stats/):
+Average silent reading speed used to turn a story's word count into
+"a 45 min read". About 230 words a minute for adult fiction.
+"""
+
+MEDIA_ACCEL = os.environ.get('MEDIA_ACCEL', '')
+MEDIA_ACCEL_PREFIX = os.environ.get('MEDIA_ACCEL_PREFIX', '/protected-media/')
+MEDIA_MAX_AGE = int(os.environ.get('MEDIA_MAX_AGE', 3600))
+"""
+LOCAL MEDIA SERVING (plottwist/media.py - only when Cloudinary isn't configured):
+- MEDIA_ACCEL: '' = Django sends the file itself,
+  'nginx' = answer with X-Accel-Redirect and let nginx send it,
+  'sendfile' = answer with X-Sendfile (Apache mod_xsendfile, lighttpd)
+- MEDIA_ACCEL_PREFIX: nginx's `internal` location for MEDIA_ROOT
+- MEDIA_MAX_AGE: browser cache time (seconds) for uploads saved before
+  file names were hashed. Hashed names are cached for a year.
+"""
+if MEDIA_ACCEL not in ('', 'nginx', 'sendfile'):
+    raise ImproperlyConfigured("MEDIA_ACCEL must be '', 'nginx' or 'sendfile'")
+
+# ============================================================
+# LOGGING
+# ============================================================
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', '0.01'))
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {'()': 'plottwist.log.JsonFormatter'},
+        'text': {'format': '%(asctime)s %(levelname)s %(name)s: %(message)s'},
+    },
+    'filters': {
+        'sample': {'()': 'plottwist.log.SampleFilter', 'rate': LOG_SAMPLE_RATE},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': LOG_FORMAT},
+    },
+    'root': {'handlers': ['console'], 'level': 'WARNING'},
+    'loggers': {
+        'django': {'handlers': ['console'], 'level': 'WARNING', 'propagate': False},
+        'projects': {'handlers': ['console'], 'level': LOG_LEVEL, 'propagate': False},
+        'users': {'handlers': ['console'], 'level': LOG_LEVEL, 'propagate': False},
+        # One line per pledge is too many - keep a sample (warnings and errors are all kept)
+        'projects.signals': {'filters': ['sample']},
+    },
+}
+"""
+LOGGING (plottwist/log.py):
+Everything goes to the console (stdout/stderr), which is where Heroku
+and docker collect logs from.
+- LOG_LEVEL: lowest level written for our own apps (DEBUG, INFO, WARNING...)
+- LOG_FORMAT: 'json' = one JSON object per line, searchable by field;
+  'text' = plain lines, easier to read while developing
+- LOG_SAMPLE_RATE: share of the per-pledge INFO lines (projects.signals)
+  that are written - 0.01 = 1 in 100, 1 = all of them
+Django's own loggers only write warnings and errors (including the
+traceback of every 500).
+"""
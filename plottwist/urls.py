@@ -9,8 +9,9 @@ from django.contrib import admin
 from django.urls import path, include
 from django.http import HttpResponse
 from django.conf import settings
-from django.conf.urls.static import static
 from users.views import CustomAuthToken  # Make sure this import is correct
+from projects.views import SiteStats
+from plottwist import media
 
 def home(request):
     """Simple homepage - just returns a welcome message"""
@@ -39,6 +40,8 @@ urlpatterns = [
     # And /projects/1/ shows project #1
     path('users/', include('users.urls')),
     # /users/... → Handled by users/urls.py
+    path('stats/', SiteStats.as_view(), name='site-stats'),
+    # GET /stats/ → Daily pledge / project numbers (from the rollup tables)
     
     # ============================================================
     # AUTHENTICATION
@@ -50,12 +53,16 @@ urlpatterns = [
 ]
 
 # ============================================================
-# SERVE MEDIA FILES IN DEVELOPMENT
+# SERVE MEDIA FILES (when Cloudinary isn't configured)
 # ============================================================
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+if not settings.USE_CLOUDINARY and settings.MEDIA_URL.startswith('/'):
+    urlpatterns += [
+        path(settings.MEDIA_URL.lstrip('/') + '<path:path>', media.serve, name='media'),
+    ]
 """
-In development (DEBUG=True), Django will serve uploaded media files.
-In production, Cloudinary handles this instead.
+With Cloudinary, uploads are served by Cloudinary's CDN.
+Without it they're on our own disk (MEDIA_ROOT), and plottwist/media.py
+serves them - in production too - with year-long caching for hashed
+names, Range requests, and X-Accel-Redirect / X-Sendfile so nginx or
+Apache can do the sending (settings.MEDIA_ACCEL).
 """
-
@@ -0,0 +1,80 @@
+'''
+warmup.py - gets a freshly started server ready BEFORE it takes traffic.
+
+A lot of Django's work happens lazily, on the first request that needs
+it: importing every view and serializer (the URLconf isn't imported
+until the first request), compiling each URL pattern's regex, building
+each serializer's field list, opening the database connection. After a
+scale-up, real users pay for all of that.
+
+gunicorn.conf.py calls these before the workers accept connections:
+
+- warm_up() runs ONCE in the gunicorn master (preload_app = True), so
+  every worker forked from it starts with the work already done and
+  shares that memory with the master.
+- connect_databases() runs in EACH sync worker after the fork - a
+  database connection must never be shared between processes. Only
+  sync workers: Django connections are per THREAD, so in a gthread or
+  uvicorn worker a connection opened on the main thread would never
+  serve a request, and never be closed (request_finished doesn't fire
+  there) - it would just hold a database slot.
+
+`python manage.py startup_profile --target warm` shows what it costs.
+'''
+
+import time
+
+from django.apps import apps
+from django.db import connections
+from django.urls import get_resolver
+from rest_framework.serializers import ModelSerializer
+
+
+def prime_urls():
+    """Import the URLconf (and with it every view) and compile every URL pattern's regex."""
+    resolver = get_resolver()
+    resolver.reverse_dict  # builds reverse() lookups for the whole tree
+
+    def compile_patterns(patterns):
+        for pattern in patterns:
+            pattern.pattern.regex  # compiled on first access, then cached
+            if hasattr(pattern, 'url_patterns'):
+                compile_patterns(pattern.url_patterns)
+
+    compile_patterns(resolver.url_patterns)
+
+
+def prime_serializers():
+    """Build every model's field cache and every API serializer's field list."""
+    for model in apps.get_models():
+        model._meta.get_fields()
+    from projects import serializers as project_serializers
+    from projects import views as project_views
+    from users import serializers as user_serializers
+    for module in (project_serializers, user_serializers):
+        for serializer_class in vars(module).values():
+            if (
+                isinstance(serializer_class, type)
+                and issubclass(serializer_class, ModelSerializer)
+                and serializer_class.__module__ == module.__name__
+            ):
+                serializer_class().fields
+    # The list endpoints' fast path works out its column plan once - do it now
+    project_views.compact_projects.plan
+    project_views.compact_pledges.plan
+
+
+def connect_databases():
+    """Open the CALLING THREAD's database connections now, not on the first request."""
+    for alias in connections:
+        connections[alias].ensure_connection()
+
+
+def warm_up():
+    """Everything that is safe to do before forking. Returns {step: milliseconds}."""
+    timings = {}
+    for name, step in (('urls', prime_urls), ('serializers', prime_serializers)):
+        start = time.perf_counter()
+        step()
+        timings[name] = round((time.perf_counter() - start) * 1000, 1)
+    return timings
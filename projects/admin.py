@@ -1,5 +1,143 @@
+'''
+admin.py - the Django admin pages for projects and pledges, tuned for big tables.
+
+What makes a changelist page slow on a table with millions of rows, and
+what we do about it:
+
+- a query per row for __str__ / foreign keys → list_select_related
+- loading every story's full text just to show its title → the text
+  columns are deferred on list pages (only the edit page loads them)
+- SELECT COUNT(*) over the whole table → EstimatedCountPaginator reads
+  PostgreSQL's own row estimate instead, and show_full_result_count=False
+  skips the second count Django runs when a filter is active
+- <select> boxes listing every user / project on the edit page →
+  raw_id_fields (a plain id box with a lookup popup)
+- filters → only on indexed columns; the genre filter lists the small
+  Genre table instead of SELECT DISTINCT over every project
+
+ARCHIVED projects (archive.py) have empty text columns. Their edit pages
+show the archived text (hydrated in memory only); saving one puts the
+story back in the hot tables first, exactly like an edit through the API.
+'''
+
 from django.contrib import admin
-from .models import Project, Pledge
+from django.contrib.admin.views.main import ChangeList
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+from .models import Genre, Project, Pledge
+from . import archive, moderation
+
+# Below this many rows an exact COUNT(*) is cheap enough - use it
+ESTIMATE_COUNT_ABOVE = 100_000
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    For an UNFILTERED list on PostgreSQL, the page count comes from the
+    planner's estimate (pg_class.reltuples, refreshed by autovacuum)
+    rather than counting every row. Filtered lists - and other
+    databases - are counted exactly as usual.
+    """
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql' and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                    [queryset.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+            if row and row[0] >= ESTIMATE_COUNT_ABOVE:
+                return row[0]
+        return super().count
+
+
+class DeferredTextChangeList(ChangeList):
+    """The changelist's queryset, minus the big text columns it never displays."""
+    def get_queryset(self, request, exclude_parameters=None):
+        queryset = super().get_queryset(request, exclude_parameters)
+        return queryset.defer(*self.model_admin.changelist_defer)
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+    changelist_defer = ()
+
+    def get_changelist(self, request, **kwargs):
+        return DeferredTextChangeList
+
+
+class GenreFilter(admin.SimpleListFilter):
+    """Genres from the small Genre table; filters on the indexed genre_key."""
+    title = 'genre'
+    parameter_name = 'genre_key'
+
+    def lookups(self, request, model_admin):
+        return Genre.objects.order_by('name').values_list('key', 'name')
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(genre_key=self.value())
+        return queryset
+
+
+@admin.register(Project)
+class ProjectAdmin(LargeTableAdmin):
+    list_display = ('id', 'title', 'owner', 'genre', 'content_type', 'is_open', 'pledge_count', 'date_created')
+    list_select_related = ('owner',)
+    list_filter = ('is_open', 'content_type', 'moderation', GenreFilter)
+    search_fields = ('title',)
+    raw_id_fields = ('owner',)
+    readonly_fields = ('pledge_count', 'follower_count', 'version', 'date_closed', 'archived_at')
+    changelist_defer = ('description', 'starting_content', 'current_content')
+
+    def get_object(self, request, object_id, from_field=None):
+        project = super().get_object(request, object_id, from_field)
+        return archive.hydrate(project, with_pledges=False) if project is not None else None
+
+    def save_model(self, request, obj, form, change):
+        if change and archive.unarchive(obj.pk):
+            obj.archived_at = None  # obj already holds the text - the form showed it hydrated
+        super().save_model(request, obj, form, change)
+
+
+@admin.register(Pledge)
+class PledgeAdmin(LargeTableAdmin):
+    list_display = ('id', 'project', 'supporter', 'amount', 'anonymous', 'status', 'date_created')
+    list_select_related = ('project', 'supporter')
+    list_filter = ('status', 'anonymous')
+    raw_id_fields = ('project', 'supporter')
+    readonly_fields = ('position', 'version', 'status')
+    actions = ('approve_selected', 'reject_selected')
+    changelist_defer = (
+        'add_content', 'comment',
+        'project__description', 'project__starting_content', 'project__current_content',
+    )
+
+    def get_object(self, request, object_id, from_field=None):
+        pledge = super().get_object(request, object_id, from_field)
+        return archive.hydrate_pledge(pledge) if pledge is not None else None
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            return super().save_model(request, obj, form, change)
+        archive.unarchive(obj.project_id)
+        # Only what the form changed - never the position / offsets loaded with the page (content.py moves those)
+        obj.save(update_fields=form.changed_data)
+
+    # Status changes go through moderation.py, never a plain edit, so the story text follows along
+    @admin.action(description='Approve selected pledges')
+    def approve_selected(self, request, queryset):
+        approved = moderation.approve(queryset.only('id', 'project_id'), moderator=request.user)
+        self.message_user(request, f'{len(approved)} pledge(s) approved.')
 
-admin.site.register(Project)
-admin.site.register(Pledge)
\ No newline at end of file
+    @admin.action(description='Reject selected pledges')
+    def reject_selected(self, request, queryset):
+        rejected = moderation.reject(queryset.only('id', 'project_id'), moderator=request.user)
+        self.message_user(request, f'{len(rejected)} pledge(s) rejected.')
@@ -0,0 +1,265 @@
+'''
+analytics.py - exports projects, pledges and users as files for offline analysis.
+
+`python manage.py export_analytics exports/` writes one folder per format
+and table, split into monthly partitions by creation date:
+
+    exports/csv/pledges/month=2025-03/part-000000048212-000000051904.csv
+    exports/parquet/pledges/month=2025-03/part-000000048212-000000051904.parquet
+
+That "month=..." layout is what pandas, DuckDB, Spark and BigQuery expect,
+so `pd.read_parquet('exports/parquet/pledges')` reads the whole table and
+a query for one month only opens that month's files.
+
+Parquet (compressed, typed columns - much smaller and faster to load
+than CSV) needs pyarrow, which is OPTIONAL: pip install pyarrow.
+Without it, only CSV is written.
+
+INCREMENTAL:
+A Watermark per table (export.pledges, ...) remembers the highest id
+already exported. Each run only exports rows above it, as NEW part files
+- old files are never rewritten. --full starts the table again from
+scratch (use it now and then to refresh columns that change after a row
+is created, like pledge_count or a pledge's moderation status); it only
+deletes the folders of the formats it is writing.
+
+LOW MEMORY:
+Rows are streamed from the database in chunks (values_list + iterator(),
+no model objects) and written out as they arrive, so memory use doesn't
+grow with the size of the table. A month's files are closed as soon as
+the rows have moved on to a later month, so it doesn't grow with the
+number of months either.
+
+Only columns that are safe to hand to an analyst are exported: no story
+text, no emails or passwords, and no supporter id on anonymous pledges.
+'''
+
+import csv
+import os
+import shutil
+
+from django.contrib.auth import get_user_model
+from django.db.models import Max
+
+from .models import Pledge, Project, Watermark
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # optional
+    pyarrow = None
+
+FORMATS = ('csv', 'parquet')
+
+# table → (column, type) in file order; the last column is what the files are partitioned by
+COLUMNS = {
+    'projects': (
+        ('id', 'int'), ('owner_id', 'int'), ('title', 'str'), ('genre_key', 'str'),
+        ('content_type', 'str'), ('goal', 'int'), ('is_open', 'bool'), ('moderation', 'str'),
+        ('pledge_count', 'int'), ('follower_count', 'int'), ('date_closed', 'timestamp'),
+        ('date_created', 'timestamp'),
+    ),
+    'pledges': (
+        ('id', 'int'), ('project_id', 'int'), ('supporter_id', 'int'), ('amount', 'int'),
+        ('anonymous', 'bool'), ('status', 'str'), ('position', 'int'), ('segment_length', 'int'),
+        ('date_created', 'timestamp'),
+    ),
+    'users': (
+        ('id', 'int'), ('username', 'str'), ('date_joined', 'timestamp'),
+    ),
+}
+
+# Rows per Parquet row group - bigger compresses better, smaller uses less memory
+ROW_GROUP_SIZE = 50_000
+
+
+def parquet_available():
+    return pyarrow is not None
+
+
+def _queryset(table):
+    return {
+        'projects': Project.objects.all,
+        'pledges': Pledge.objects.all,
+        'users': get_user_model().objects.all,
+    }[table]()
+
+
+def _clean(table, row):
+    """A row as it may leave the database."""
+    if table == 'pledges' and row[4]:  # anonymous
+        row = (row[0], row[1], None, *row[3:])
+    return row
+
+
+def _arrow_schema(columns):
+    types = {
+        'int': pyarrow.int64(),
+        'str': pyarrow.string(),
+        'bool': pyarrow.bool_(),
+        'timestamp': pyarrow.timestamp('us', tz='UTC'),
+    }
+    return pyarrow.schema([(name, types[kind]) for name, kind in columns])
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+class _Partition:
+    """
+    The files of one run for one month of one table (one per format).
+    Written under a .tmp name and renamed when complete, so a crashed run
+    never leaves a half-written file that looks finished.
+    """
+    def __init__(self, output, table, month, stem, columns, formats):
+        self.output, self.table, self.month, self.stem = output, table, month, stem
+        self.rows = 0
+        self.paths = []
+        self._csv_file = self._csv = None
+        self._parquet = None
+        self._pending = []
+        if 'csv' in formats:
+            self._csv_file = open(self._tmp('csv'), 'w', newline='', encoding='utf-8')
+            self._csv = csv.writer(self._csv_file)
+            self._csv.writerow([name for name, _ in columns])
+        if 'parquet' in formats:
+            self._schema = _arrow_schema(columns)
+            self._parquet = pyarrow.parquet.ParquetWriter(self._tmp('parquet'), self._schema, compression='zstd')
+
+    def _tmp(self, extension):
+        directory = os.path.join(self.output, extension, self.table, f'month={self.month}')
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'{self.stem}.{extension}')
+        self.paths.append(path)
+        return path + '.tmp'
+
+    def add(self, row):
+        self.rows += 1
+        if self._csv is not None:
+            self._csv.writerow([_csv_value(value) for value in row])
+        if self._parquet is not None:
+            self._pending.append(row)
+            if len(self._pending) >= ROW_GROUP_SIZE:
+                self._flush()
+
+    def _flush(self):
+        if self._pending:
+            columns = list(zip(*self._pending))
+            self._parquet.write_table(pyarrow.Table.from_arrays(
+                [pyarrow.array(values, type=field.type) for values, field in zip(columns, self._schema)],
+                schema=self._schema,
+            ))
+            self._pending.clear()
+
+    def discard(self):
+        """Stop and delete the unfinished files."""
+        if self._csv_file is not None:
+            self._csv_file.close()
+        if self._parquet is not None:
+            self._parquet.close()
+        for path in self.paths:
+            if os.path.exists(path + '.tmp'):
+                os.remove(path + '.tmp')
+
+    def remove(self):
+        """Delete the finished files again (the run they belong to failed)."""
+        for path in self.paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def close(self):
+        """Finish the files and give them their real names. Returns their paths."""
+        if self._csv_file is not None:
+            self._csv_file.close()
+        if self._parquet is not None:
+            self._flush()
+            self._parquet.close()
+        for path in self.paths:
+            os.replace(path + '.tmp', path)
+        return self.paths
+
+
+def export_table(table, output, formats=FORMATS, full=False, chunk_size=5000):
+    """
+    Export one table's new rows under output/<format>/<table>/.
+    Returns {'rows': rows written, 'files': [paths]}.
+    """
+    columns = COLUMNS[table]
+    # Only the formats being written - --full --format csv leaves the Parquet files alone
+    directories = [os.path.join(output, extension, table) for extension in formats]
+    mark, _ = Watermark.objects.get_or_create(name=f'export.{table}')
+    after = 0 if full else mark.value
+    if full:
+        for directory in directories:
+            if os.path.isdir(directory):
+                shutil.rmtree(directory)
+    queryset = _queryset(table)
+    # Read the top FIRST: rows added while we export are left for the next run
+    top = queryset.aggregate(top=Max('id'))['top'] or 0
+    if top <= after:
+        return {'rows': 0, 'files': []}
+
+    stem = f'part-{after + 1:012d}-{top:012d}'
+    # A run that crashed before saving its watermark may have left files for this same range
+    for directory in directories:
+        _remove_stale(directory, f'part-{after + 1:012d}-')
+    rows = (
+        queryset.filter(pk__gt=after, pk__lte=top)
+        .order_by('pk')
+        .values_list(*(name for name, _ in columns))
+        .iterator(chunk_size=chunk_size)
+    )
+    # Rows come in id order, so months come (almost) in order too: once rows have moved on
+    # to a later month, the earlier months' files are finished and closed - only about one
+    # month's files are open and buffering Parquet rows at a time. A late row for a month
+    # that's already closed starts another file for it: <stem>-1, <stem>-2...
+    open_partitions, closed, files_per_month = {}, [], {}
+    newest = None
+    try:
+        for row in rows:
+            created = row[-1]
+            month = created.strftime('%Y-%m') if created else 'unknown'
+            partition = open_partitions.get(month)
+            if partition is None:
+                count = files_per_month.get(month, 0)
+                files_per_month[month] = count + 1
+                name = f'{stem}-{count}' if count else stem
+                partition = open_partitions[month] = _Partition(output, table, month, name, columns, formats)
+            partition.add(_clean(table, row))
+            if newest is None or month > newest:
+                newest = month
+                for earlier in [key for key in open_partitions if key < month]:
+                    done = open_partitions.pop(earlier)
+                    done.close()
+                    closed.append(done)
+    except BaseException:
+        for partition in open_partitions.values():
+            partition.discard()
+        for partition in closed:
+            partition.remove()
+        raise
+    for partition in open_partitions.values():
+        partition.close()
+        closed.append(partition)
+    Watermark.objects.filter(name=mark.name).update(value=top)
+    return {
+        'rows': sum(partition.rows for partition in closed),
+        'files': [path for partition in closed for path in partition.paths],
+    }
+
+
+def _remove_stale(directory, prefix):
+    if not os.path.isdir(directory):
+        return
+    for month in os.listdir(directory):
+        month_dir = os.path.join(directory, month)
+        for name in os.listdir(month_dir) if os.path.isdir(month_dir) else ():
+            if name.startswith(prefix):
+                os.remove(os.path.join(month_dir, name))
@@ -0,0 +1,232 @@
+'''
+archive.py - moves the text of long-finished stories out of the hot tables.
+
+A closed story is rarely read, but its starting_content, current_content
+and pledge texts stay in projects_project / projects_pledge, making every
+scan, vacuum and backup of those tables bigger. After a project has been
+closed for ARCHIVE_AFTER_DAYS, `python manage.py archive_projects`:
+
+1. packs the story text and every pledge's add_content / comment into
+   one zlib-compressed ProjectArchive row
+2. empties those columns in the project and pledge rows and stamps
+   project.archived_at
+
+The rows themselves stay (a "stub"): ids, titles, counters, feeds and
+follows all keep working, they're just small now.
+
+READING: hydrate() / hydrate_pledge() put the text back on the objects
+in memory (not in the database) before they're serialized, so API
+clients see exactly what they saw before. Unpacked archives are cached
+for ARCHIVE_CACHE_SECONDS.
+
+Lists do the same for a whole page at once - hydrate_pledges() for
+Pledge objects, hydrate_rows() for plain dicts (compact.py, feeds) - with
+one query to find the archived projects and one for their archives, not
+one per row.
+
+WRITING: anything that changes an archived story (an owner edit, a new
+pledge, reopening it) calls unarchive() first, which puts the text back
+in the hot tables for good.
+'''
+
+import json
+import zlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Project, Pledge, ProjectArchive
+
+ARCHIVED_PLEDGE_FIELDS = ('add_content', 'comment')
+
+
+def _cache_key(project_id):
+    return f'project-archive:{project_id}'
+
+
+def archivable_projects(days=None):
+    """Closed, not yet archived, and closed for at least `days` days."""
+    days = settings.ARCHIVE_AFTER_DAYS if days is None else days
+    return Project.objects.filter(
+        is_open=False,
+        archived_at__isnull=True,
+        date_closed__lte=timezone.now() - timedelta(days=days),
+    )
+
+
+def archive_project(project_id):
+    """Move one project's text into a ProjectArchive. Returns the archive, or None if it no longer qualifies."""
+    with transaction.atomic():
+        project = (
+            Project.objects.select_for_update()
+            .filter(pk=project_id, is_open=False, archived_at__isnull=True)
+            .only('starting_content', 'current_content')
+            .first()
+        )
+        if project is None:
+            return None  # reopened or archived by someone else meanwhile
+        pledges = Pledge.objects.filter(project_id=project_id).values_list('id', *ARCHIVED_PLEDGE_FIELDS)
+        payload = {
+            'starting_content': project.starting_content,
+            'current_content': project.current_content,
+            'pledges': {str(pledge_id): dict(zip(ARCHIVED_PLEDGE_FIELDS, texts)) for pledge_id, *texts in pledges},
+        }
+        raw = json.dumps(payload, separators=(',', ':')).encode()
+        archived = ProjectArchive.objects.create(
+            project_id=project_id,
+            data=zlib.compress(raw, 9),
+            raw_size=len(raw),
+        )
+        # Queryset updates: no save() signals, so no revision or version bump - the story hasn't changed
+        Project.objects.filter(pk=project_id).update(starting_content='', current_content='', archived_at=timezone.now())
+        Pledge.objects.filter(project_id=project_id).update(add_content='', comment='')
+    cache.delete(_cache_key(project_id))
+    return archived
+
+
+def load(project_id, remember=True):
+    """
+    The archived text of a project: {'starting_content', 'current_content', 'pledges': {id: {...}}}.
+    remember=False skips the cache (for one-off bulk reads like exports).
+    """
+    payload = cache.get(_cache_key(project_id)) if remember else None
+    if payload is None:
+        data = ProjectArchive.objects.filter(project_id=project_id).values_list('data', flat=True).first()
+        if data is None:
+            return None
+        payload = json.loads(zlib.decompress(bytes(data)))
+        if remember:
+            cache.set(_cache_key(project_id), payload, settings.ARCHIVE_CACHE_SECONDS)
+    return payload
+
+
+def _chunks(ids, size=500):
+    """Split a long id list, so `IN (...)` stays under the database's parameter limit."""
+    ids = list(ids)
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def archived_ids(project_ids):
+    """The archived ones among project_ids."""
+    archived = set()
+    for chunk in _chunks(set(project_ids)):
+        archived.update(Project.objects.filter(pk__in=chunk, archived_at__isnull=False).values_list('pk', flat=True))
+    return archived
+
+
+def load_many(project_ids, remember=True):
+    """{project id: load(project id)} for several projects - one cache lookup and one query for the rest."""
+    project_ids = set(project_ids)
+    payloads = {}
+    if remember and project_ids:
+        cached = cache.get_many([_cache_key(project_id) for project_id in project_ids])
+        payloads = {project_id: cached[_cache_key(project_id)] for project_id in project_ids if _cache_key(project_id) in cached}
+    fresh = {}
+    for chunk in _chunks(project_ids - set(payloads)):
+        for project_id, data in ProjectArchive.objects.filter(project_id__in=chunk).values_list('project_id', 'data'):
+            fresh[project_id] = json.loads(zlib.decompress(bytes(data)))
+    if remember and fresh:
+        cache.set_many({_cache_key(project_id): payload for project_id, payload in fresh.items()}, settings.ARCHIVE_CACHE_SECONDS)
+    payloads.update(fresh)
+    return payloads
+
+
+def _fill_pledge(pledge, payload):
+    texts = payload['pledges'].get(str(pledge.pk), {})
+    for field in ARCHIVED_PLEDGE_FIELDS:
+        if field in pledge.__dict__:  # skip deferred fields - setting them would load them
+            setattr(pledge, field, texts.get(field, ''))
+    pledge._loaded_content = pledge.add_content if 'add_content' in pledge.__dict__ else None
+
+
+def hydrate(project, with_pledges=True, remember=True):
+    """
+    Put an archived project's text back on the object (in memory only).
+    Also fills project.pledges.all() unless with_pledges=False.
+    Does nothing for projects that aren't archived.
+    """
+    if project.archived_at is None:
+        return project
+    payload = load(project.pk, remember=remember)
+    if payload is None:
+        return project
+    project.starting_content = payload['starting_content']
+    project.current_content = payload['current_content']
+    project._loaded_content = {'starting_content': project.starting_content, 'current_content': project.current_content}
+    if with_pledges:
+        pledges = project.pledges.all()
+        for pledge in pledges:
+            _fill_pledge(pledge, payload)
+        # What prefetch_related would do - serializers calling project.pledges.all() get these objects
+        project._prefetched_objects_cache = getattr(project, '_prefetched_objects_cache', {})
+        project._prefetched_objects_cache['pledges'] = pledges
+    return project
+
+
+def hydrate_pledge(pledge):
+    """Put an archived pledge's add_content / comment back on the object."""
+    if pledge.add_content:
+        return pledge  # archived pledges are the only ones with no text
+    return hydrate_pledges([pledge])[0]
+
+
+def hydrate_pledges(pledges):
+    """hydrate_pledge() for a list of pledges, with two queries however many there are."""
+    payloads = load_many(archived_ids(pledge.project_id for pledge in pledges))
+    for pledge in pledges:
+        if pledge.project_id in payloads:
+            _fill_pledge(pledge, payloads[pledge.project_id])
+    return pledges
+
+
+def hydrate_rows(rows, project_key, pledge_key=None):
+    """
+    Put archived text back into list rows (plain dicts), in place.
+
+    Rows of projects:  hydrate_rows(rows, 'id')
+    Rows of pledges:   hydrate_rows(rows, 'project', 'id')   - keys naming the project / pledge id
+
+    Only the text fields a row already has are filled in.
+    """
+    payloads = load_many(archived_ids(row[project_key] for row in rows))
+    if not payloads:
+        return rows
+    for row in rows:
+        payload = payloads.get(row[project_key])
+        if payload is None:
+            continue
+        if pledge_key is None:
+            texts, fields = payload, ('starting_content', 'current_content')
+        else:
+            texts, fields = payload['pledges'].get(str(row[pledge_key]), {}), ARCHIVED_PLEDGE_FIELDS
+        for field in fields:
+            if field in row:
+                row[field] = texts.get(field, '')
+    return rows
+
+
+def unarchive(project_id):
+    """Move the text back into the project and pledge rows. Returns True if it was archived."""
+    with transaction.atomic():
+        project = Project.objects.select_for_update().filter(pk=project_id, archived_at__isnull=False).first()
+        if project is None:
+            return False
+        payload = load(project_id, remember=False)
+        Project.objects.filter(pk=project_id).update(
+            starting_content=payload['starting_content'],
+            current_content=payload['current_content'],
+            archived_at=None,
+        )
+        pledges = list(Pledge.objects.filter(project_id=project_id).only('id'))
+        for pledge in pledges:
+            texts = payload['pledges'].get(str(pledge.pk), {})
+            for field in ARCHIVED_PLEDGE_FIELDS:
+                setattr(pledge, field, texts.get(field, ''))
+        Pledge.objects.bulk_update(pledges, ARCHIVED_PLEDGE_FIELDS, batch_size=500)
+        ProjectArchive.objects.filter(project_id=project_id).delete()
+    cache.delete(_cache_key(project_id))
+    return True
@@ -0,0 +1,159 @@
+'''
+assembly.py - puts a story together from its pledges INSIDE the database.
+
+The story a reader sees is stored ready-made in current_content (see
+content.py). This module builds the same text straight from the pledges
+- the opening followed by every approved pledge in `position` order,
+joined with "\\n\\n" - without loading a single Pledge into Python:
+
+    PostgreSQL: string_agg(btrim(add_content, ...), '\\n\\n' ORDER BY position)
+    SQLite:     group_concat(trim(add_content, ...), '\\n\\n' ORDER BY position)
+
+One query returns the text of as many projects as you ask for. It's
+what the text SHOULD be if the owner never edited it by hand, so
+`python manage.py check_stories` uses it to find stories whose
+current_content differs from their pledges - and, with --rebuild, to
+put them back (rebuild_story()).
+
+assemble_in_python() is the same thing done the ordinary way - load the
+pledges, strip and join them. projects/tests.py checks the two always
+agree; `python manage.py benchmark assembly` times them.
+
+Archived projects (archive.py) have no text left in their rows, so they
+are skipped here; hydrate() them instead.
+'''
+
+import sqlite3
+
+from django.db import connection, transaction
+
+from .content import segment_text
+from .models import APPROVED, Pledge, Project, story_text, text_counts
+from .revisions import note_change
+
+SEPARATOR = '\n\n'
+
+# Everything Python's str.strip() removes, so the database trims exactly like segment_text()
+WHITESPACE = (
+    '\t\n\x0b\x0c\r\x1c\x1d\x1e\x1f \x85\xa0\u1680'
+    '\u2000\u2001\u2002\u2003\u2004\u2005\u2006\u2007\u2008\u2009\u200a'
+    '\u2028\u2029\u202f\u205f\u3000'
+)
+
+
+def available():
+    """True if this database can assemble stories itself (PostgreSQL or SQLite)."""
+    return connection.vendor in ('postgresql', 'sqlite')
+
+
+def _trim():
+    return 'btrim' if connection.vendor == 'postgresql' else 'trim'
+
+
+def _segments_sql():
+    """
+    SQL for one row per project: (project_id, its pledges' segments joined
+    in position order, where the first segment starts in current_content).
+    """
+    pledge, trim = Pledge._meta.db_table, _trim()
+    in_story = "status = %s AND segment_length > 0 AND current_offset IS NOT NULL"
+    if connection.vendor == 'postgresql':
+        return (
+            f"SELECT project_id, string_agg({trim}(add_content, %s), %s ORDER BY \"position\") AS segments, "
+            f"MIN(current_offset) AS first_offset FROM {pledge} WHERE {in_story} GROUP BY project_id"
+        )
+    if sqlite3.sqlite_version_info >= (3, 44):
+        return (
+            f"SELECT project_id, group_concat({trim}(add_content, %s), %s ORDER BY \"position\") AS segments, "
+            f"MIN(current_offset) AS first_offset FROM {pledge} WHERE {in_story} GROUP BY project_id"
+        )
+    # Older SQLite has no ORDER BY inside group_concat - it joins rows in the order an ordered subquery gives them
+    return (
+        f"SELECT project_id, group_concat(segment, %s) AS segments, MIN(current_offset) AS first_offset FROM ("
+        f"SELECT project_id, trim(add_content, %s) AS segment, current_offset FROM {pledge} "
+        f"WHERE {in_story} ORDER BY project_id, \"position\") GROUP BY project_id"
+    )
+
+
+def _segments_params():
+    if connection.vendor == 'sqlite' and sqlite3.sqlite_version_info < (3, 44):
+        return [SEPARATOR, WHITESPACE, APPROVED]
+    return [WHITESPACE, SEPARATOR, APPROVED]
+
+
+def assembled_stories(project_ids):
+    """
+    {project id: story text} for the given projects, in ONE query.
+    Archived projects and ids that don't exist are left out.
+    """
+    project_ids = list(project_ids)
+    if not project_ids:
+        return {}
+    project = Project._meta.db_table
+    sql = (
+        f"SELECT p.id, CASE "
+        # No pledges in the story: what story_text() shows
+        f"WHEN s.segments IS NULL THEN CASE WHEN {_trim()}(p.current_content, %s) <> '' THEN p.current_content ELSE p.starting_content END "
+        # The opening is whatever comes before the first pledge (and its "\n\n") in current_content
+        f"WHEN s.first_offset > 2 THEN substr(p.current_content, 1, s.first_offset - 2) || %s || s.segments "
+        f"ELSE s.segments END "
+        f"FROM {project} p LEFT JOIN ({_segments_sql()}) s ON s.project_id = p.id "
+        f"WHERE p.archived_at IS NULL AND p.id IN ({', '.join(['%s'] * len(project_ids))})"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [WHITESPACE, SEPARATOR, *_segments_params(), *project_ids])
+        return {project_id: text or '' for project_id, text in cursor.fetchall()}
+
+
+def assembled_story(project_id):
+    """One project's story, assembled by the database (None if archived or missing)."""
+    return assembled_stories([project_id]).get(project_id)
+
+
+def story_pledges(project_id):
+    """The approved pledges that are part of the story text, in story order."""
+    return Pledge.objects.filter(
+        project_id=project_id, status=APPROVED, segment_length__gt=0, current_offset__isnull=False,
+    ).order_by('position')
+
+
+def assemble_in_python(project):
+    """The same text as assembled_story(), built by loading the pledges and joining them here."""
+    pledges = list(story_pledges(project.pk))
+    if not pledges:
+        return story_text(project)
+    first = min(pledge.current_offset for pledge in pledges)
+    opening = (project.current_content or '')[:first - 2] if first > 2 else ''
+    return SEPARATOR.join([opening] * bool(opening) + [segment_text(pledge.add_content) for pledge in pledges])
+
+
+def rebuild_story(project_id, user_id=None):
+    """
+    Replace a live project's current_content with the text its pledges
+    assemble to, and move each pledge's current_offset to match.
+    Returns True if the text changed. The old text stays in the
+    revision history.
+    """
+    with transaction.atomic():
+        project = Project.objects.select_for_update().filter(pk=project_id, archived_at__isnull=True).first()
+        if project is None:
+            return False
+        pledges = list(story_pledges(project_id).only('id', 'add_content', 'segment_length', 'current_offset'))
+        text = assembled_story(project_id)
+        if not pledges or text == project.current_content:
+            return False  # no pledges in the story = nothing to rebuild it from
+        # Where each segment lands: after the opening (if any), then one after another.
+        # Measured from the text itself, in case segment_length has drifted too.
+        first = min(pledge.current_offset for pledge in pledges)
+        offset = first if first > 2 else 0
+        for pledge in pledges:
+            pledge.current_offset, pledge.segment_length = offset, len(segment_text(pledge.add_content))
+            offset += pledge.segment_length + len(SEPARATOR)
+        Pledge.objects.bulk_update(pledges, ['current_offset', 'segment_length'], batch_size=500)
+
+        project.current_content = text
+        project.word_count, project.char_count = text_counts(story_text(project))
+        note_change(project, 'rebuilt', user_id)
+        project.version += 1  # an editor holding the old text gets a 412 instead of undoing this
+        project.save(update_fields=['current_content', 'version', 'word_count', 'char_count'])
+    return True
@@ -0,0 +1,605 @@
+'''
+benchmarks.py - small, repeatable performance measurements.
+
+Run them with:
+    python manage.py benchmark --list
+    python manage.py benchmark connections
+
+Each suite is a function registered with @suite('name'). It receives the
+number of iterations and returns a list of result rows (dicts) that the
+management command prints as a table.
+'''
+
+import statistics
+import time
+
+SUITES = {}
+
+
+def suite(name):
+    """Register a benchmark function under a name usable on the command line."""
+    def register(func):
+        SUITES[name] = func
+        return func
+    return register
+
+
+def measure(label, func, iterations, warmup=5):
+    """
+    Call func() `iterations` times and summarize the timings in milliseconds.
+    A few warm-up calls run first so one-off costs (imports, caches) don't skew results.
+    """
+    for _ in range(min(warmup, iterations)):
+        func()
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        'case': label,
+        'iterations': iterations,
+        'mean_ms': round(statistics.fmean(timings), 4),
+        'p50_ms': round(timings[len(timings) // 2], 4),
+        'p95_ms': round(timings[int(len(timings) * 0.95) - 1], 4),
+    }
+
+
+# ============================================================
+# CONNECTIONS - cost of getting a database connection per request
+# ============================================================
+@suite('connections')
+def bench_connections(iterations):
+    """
+    Per-request database connection overhead: new vs persistent vs pooled.
+
+    Simulates the database part of a request cycle:
+        request_started → SELECT 1 → request_finished
+
+    The request signals are what make Django close or keep connections,
+    so this measures exactly the per-request connection overhead of
+    each configuration against the configured DATABASE_URL.
+    """
+    from django.core.signals import request_started, request_finished
+    from django.db import connection
+    from django.conf import settings
+    from plottwist.dbconfig import pool_available, pool_options
+
+    def fake_request():
+        request_started.send(sender=__name__)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        request_finished.send(sender=__name__)
+
+    settings_dict = connection.settings_dict
+    original_max_age = settings_dict['CONN_MAX_AGE']
+    original_pool = settings_dict['OPTIONS'].get('pool')
+
+    variants = [
+        ('new connection per request (CONN_MAX_AGE=0)', 0, None),
+        ('persistent connection (CONN_MAX_AGE=600)', 600, None),
+    ]
+    if connection.vendor == 'postgresql' and pool_available():
+        pool = original_pool or pool_options(settings.GUNICORN_WORKER_CLASS, settings.GUNICORN_THREADS)
+        variants.append(('connection pool (psycopg_pool)', 0, pool))
+
+    results = []
+    try:
+        for label, max_age, pool in variants:
+            connection.close()
+            if hasattr(connection, 'close_pool'):
+                connection.close_pool()
+            settings_dict['CONN_MAX_AGE'] = max_age
+            if pool:
+                settings_dict['OPTIONS']['pool'] = pool
+            else:
+                settings_dict['OPTIONS'].pop('pool', None)
+            results.append(measure(label, fake_request, iterations))
+    finally:
+        connection.close()
+        if hasattr(connection, 'close_pool'):
+            connection.close_pool()
+        settings_dict['CONN_MAX_AGE'] = original_max_age
+        if original_pool:
+            settings_dict['OPTIONS']['pool'] = original_pool
+        else:
+            settings_dict['OPTIONS'].pop('pool', None)
+    return results
+
+
+# ============================================================
+# SERIALIZERS - DRF ModelSerializer vs the compact fast path
+# ============================================================
+@suite('serializers')
+def bench_serializers(iterations):
+    """
+    List endpoints: ModelSerializer + JSONRenderer vs CompactReader + FastJSONRenderer.
+
+    First checks PARITY: both paths must produce byte-for-byte identical JSON
+    for every project and pledge in the database (seed some with
+    `python manage.py seed_demo`). Then times both.
+    """
+    from django.core.management.base import CommandError
+    from rest_framework.renderers import JSONRenderer
+    from .compact import CompactReader
+    from .models import Project, Pledge
+    from .renderers import FastJSONRenderer
+    from .serializers import ProjectSerializer, PledgeSerializer
+
+    results = []
+    for label, queryset, serializer_class in (
+        ('projects', Project.objects.all(), ProjectSerializer),
+        ('pledges', Pledge.objects.all(), PledgeSerializer),
+    ):
+        reader = CompactReader(serializer_class)
+
+        def drf_path():
+            return JSONRenderer().render(serializer_class(queryset.all(), many=True).data)
+
+        def compact_path():
+            return FastJSONRenderer().render(reader.data(queryset.all()))
+
+        if drf_path() != compact_path():
+            raise CommandError(f'{label}: compact output differs from {serializer_class.__name__}')
+
+        rows = queryset.count()
+        results.append(dict(measure(f'{label} ({rows} rows) ModelSerializer', drf_path, iterations), parity='ok'))
+        results.append(dict(measure(f'{label} ({rows} rows) compact', compact_path, iterations), parity='ok'))
+    return results
+
+
+# ============================================================
+# THROTTLE - a pledge flood vs. everyone else's reads
+# ============================================================
+@suite('throttle')
+def bench_throttle(iterations):
+    """
+    One client floods a project with pledges while reads continue.
+
+    Each of the `iterations` rounds sends one pledge POST and then times
+    one GET of the same project. Run once with throttling switched off and
+    once with WRITE_THROTTLE_RATES. With throttling, most POSTs end in a
+    cheap 429 (no story rewrite), so reads stay fast. Everything happens
+    inside a transaction that is rolled back - the database is left as it was.
+    """
+    from django.conf import settings
+    from django.contrib.auth import get_user_model
+    from django.db import transaction
+    from rest_framework.test import APIRequestFactory, force_authenticate
+    from .models import Project
+    from .views import PledgeList, ProjectDetail
+
+    factory = APIRequestFactory()
+    pledge_view = PledgeList.as_view()
+    detail_view = ProjectDetail.as_view()
+    original_rates = settings.WRITE_THROTTLE_RATES
+
+    class Rollback(Exception):
+        pass
+
+    def flood(label, rates):
+        settings.WRITE_THROTTLE_RATES = rates
+        statuses, read_timings = {}, []
+        start = time.perf_counter()
+        try:
+            with transaction.atomic():
+                user = get_user_model().objects.create_user(username='benchmark-flooder', password='x')
+                project = Project.objects.create(
+                    title='Benchmark flood', description='', goal=iterations, is_open=True,
+                    owner=user, starting_content='', current_content='', content_type='story', genre='Benchmark',
+                )
+                for number in range(iterations):
+                    request = factory.post('/projects/pledges/', {
+                        'amount': 1, 'project': project.pk, 'anonymous': False, 'comment': 'benchmark',
+                        'add_content': f'Pledge number {number}. ' * 20,
+                    }, format='json')
+                    force_authenticate(request, user=user)
+                    code = pledge_view(request).status_code
+                    statuses[code] = statuses.get(code, 0) + 1
+
+                    read_start = time.perf_counter()
+                    detail_view(factory.get(f'/projects/{project.pk}/'), pk=project.pk).render()
+                    read_timings.append((time.perf_counter() - read_start) * 1000)
+                raise Rollback
+        except Rollback:
+            pass
+        finally:
+            settings.WRITE_THROTTLE_RATES = original_rates
+        read_timings.sort()
+        return {
+            'case': label,
+            'posts': iterations,
+            'accepted_201': statuses.get(201, 0),
+            'throttled_429': statuses.get(429, 0),
+            'total_ms': round((time.perf_counter() - start) * 1000, 1),
+            'read_mean_ms': round(statistics.fmean(read_timings), 4),
+            'read_p95_ms': round(read_timings[int(len(read_timings) * 0.95) - 1], 4),
+        }
+
+    return [
+        flood('no throttling', {}),
+        flood('WRITE_THROTTLE_RATES', original_rates),
+    ]
+
+
+# ============================================================
+# ADMIN - changelist pages of the big tables
+# ============================================================
+@suite('admin')
+def bench_admin(iterations):
+    """
+    Admin changelists for projects and pledges: time and SQL queries per page.
+
+    The query count should stay the same however many rows the tables
+    hold (no query per row). Runs as a throwaway superuser inside a
+    transaction that is rolled back.
+    """
+    from django.contrib.auth import get_user_model
+    from django.db import connection, transaction
+    from django.test import Client
+
+    class Rollback(Exception):
+        pass
+
+    results = []
+    try:
+        with transaction.atomic():
+            admin_user = get_user_model().objects.create_superuser('benchmark-admin', 'admin@example.com', 'x')
+            client = Client()
+            client.force_login(admin_user)
+            for label, url in (
+                ('projects changelist', '/admin/projects/project/'),
+                ('projects changelist ?is_open=1', '/admin/projects/project/?is_open__exact=1'),
+                ('pledges changelist', '/admin/projects/pledge/'),
+                ('pledges changelist ?anonymous=1', '/admin/projects/pledge/?anonymous__exact=1'),
+            ):
+                queries = []
+
+                def count_query(execute, sql, params, many, context):
+                    queries.append(sql)
+                    return execute(sql, params, many, context)
+
+                with connection.execute_wrapper(count_query):
+                    status_code = client.get(url).status_code
+                row = measure(label, lambda: client.get(url), iterations)
+                row.update(status=status_code, queries=len(queries))
+                results.append(row)
+            raise Rollback
+    except Rollback:
+        pass
+    return results
+
+
+# ============================================================
+# ROLLUPS - /stats/ from DailyStats vs counting the pledge table
+# ============================================================
+@suite('rollups')
+def bench_rollups(iterations):
+    """
+    The last 30 days of site-wide numbers: read from the DailyStats rollups
+    vs counted live from the pledge and project tables.
+
+    Rebuilds the rollups first (inside a transaction that is rolled back)
+    and checks both give the same numbers for every day.
+    """
+    from datetime import timedelta
+    from django.core.management.base import CommandError
+    from django.db import transaction
+    from django.db.models import Count, Sum
+    from django.db.models.functions import TruncDate
+    from django.utils import timezone
+    from . import rollups
+    from .models import APPROVED, Pledge, Project
+
+    class Rollback(Exception):
+        pass
+
+    last = timezone.localdate()
+    first = last - timedelta(days=29)
+    since = rollups._day_start(first)
+
+    def live():
+        days = {}
+        for values in (
+            Pledge.objects.filter(status=APPROVED, date_created__gte=since)
+            .annotate(day=TruncDate('date_created')).values('day')
+            .annotate(n=Count('id'), verses=Sum('amount'), people=Count('supporter', distinct=True))
+        ):
+            days[values['day']] = [values['n'], values['verses'], values['people'], 0]
+        for values in Project.objects.filter(date_created__gte=since).annotate(day=TruncDate('date_created')).values('day').annotate(n=Count('id')):
+            days.setdefault(values['day'], [0, 0, 0, 0])[3] = values['n']
+        return days
+
+    def from_rollups():
+        return rollups.daily(first, last)
+
+    results = []
+    try:
+        with transaction.atomic():
+            start = time.perf_counter()
+            built = rollups.build(rebuild=True)
+            build_ms = round((time.perf_counter() - start) * 1000, 4)
+            expected = {day.isoformat(): counts for day, counts in live().items()}
+            for entry in from_rollups()['days']:
+                counts = [entry['pledges'], entry['verses'], entry['contributors'], entry['new_projects']]
+                if counts != expected.get(entry['day'], [0, 0, 0, 0]):
+                    raise CommandError(f"rollups differ from a live count on {entry['day']}")
+            results.append({'case': f"build_rollups --rebuild ({built['rows']} rows)", 'iterations': 1,
+                            'mean_ms': build_ms, 'p50_ms': build_ms, 'p95_ms': build_ms, 'parity': 'ok'})
+            results.append(dict(measure('30 days, live count', live, iterations), parity='ok'))
+            results.append(dict(measure('30 days, rollups', from_rollups, iterations), parity='ok'))
+            raise Rollback
+    except Rollback:
+        pass
+    return results
+
+
+# ============================================================
+# GUNICORN - worker profiles under concurrent load
+# ============================================================
+@suite('gunicorn')
+def bench_gunicorn(iterations):
+    """
+    Start gunicorn with each worker profile and load it with concurrent reads.
+
+    Profiles: sync, gthread and (if installed) uvicorn, each sized for
+    this machine by plottwist/serverconfig.py, plus the profile the
+    current environment would pick. Each one serves `iterations`
+    requests from 16 concurrent clients against the local (seeded) data:
+    project list, trending, the pledge list and a project detail page.
+    The fastest is marked as the recommendation.
+    """
+    import os
+    import socket
+    import subprocess
+    import sys
+    import urllib.request
+    from concurrent.futures import ThreadPoolExecutor
+    from django.conf import settings
+    from plottwist import serverconfig
+    from .models import Project
+
+    concurrency = 16
+    project_id = Project.objects.values_list('id', flat=True).first()
+    paths = ['/projects/', '/projects/trending/', '/projects/pledges/'] + ([f'/projects/{project_id}/'] if project_id else [])
+
+    # Each class sized for this machine (WEB_CONCURRENCY would force them all to one size)
+    base_env = {key: value for key, value in os.environ.items() if key not in ('WEB_CONCURRENCY', 'GUNICORN_THREADS')}
+    names = ['sync', 'gthread'] + (['uvicorn'] if serverconfig.uvicorn_available() else [])
+    profiles = [(name, dict(base_env, GUNICORN_WORKER_CLASS=name)) for name in names]
+    current = serverconfig.profile()
+    profiles.append((f"current env ({current['name']})", dict(os.environ)))
+
+    def free_port():
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            return sock.getsockname()[1]
+
+    def wait_until_listening(port, server):
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                return False
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+                return True
+            except OSError:
+                time.sleep(0.1)
+        return False
+
+    results = []
+    for label, env in profiles:
+        sized = serverconfig.profile(env)
+        port = free_port()
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}', '--log-level', 'warning'],
+            cwd=settings.BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            if not wait_until_listening(port, server):
+                results.append({'case': label, 'workers': '', 'threads': '', 'iterations': 0, 'req_per_s': 0,
+                                'p50_ms': '', 'p95_ms': '', 'errors': 'did not start', 'recommended': ''})
+                continue
+
+            def fetch(number):
+                start = time.perf_counter()
+                try:
+                    with urllib.request.urlopen(f'http://127.0.0.1:{port}{paths[number % len(paths)]}', timeout=30) as response:
+                        response.read()
+                        ok = response.status == 200
+                except OSError:
+                    ok = False
+                return (time.perf_counter() - start) * 1000, ok
+
+            with ThreadPoolExecutor(concurrency) as pool:
+                list(pool.map(fetch, range(concurrency * 2)))  # warm every worker
+                start = time.perf_counter()
+                timings = list(pool.map(fetch, range(iterations)))
+                elapsed = time.perf_counter() - start
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+        latencies = sorted(ms for ms, _ in timings)
+        results.append({
+            'case': label,
+            'workers': sized['workers'],
+            'threads': sized['threads'],
+            'iterations': iterations,
+            'req_per_s': round(iterations / elapsed, 1),
+            'p50_ms': round(latencies[len(latencies) // 2], 2),
+            'p95_ms': round(latencies[max(int(len(latencies) * 0.95) - 1, 0)], 2),
+            'errors': sum(1 for _, ok in timings if not ok),
+            'recommended': '',
+        })
+
+    ran = [row for row in results if row['iterations'] and not row['errors']]
+    if ran:
+        best = max(ran, key=lambda row: row['req_per_s'])
+        best['recommended'] = (
+            f"<- GUNICORN_WORKER_CLASS={serverconfig.profile(dict(profiles)[best['case']])['name']} "
+            f"WEB_CONCURRENCY={best['workers']}" + (f" GUNICORN_THREADS={best['threads']}" if best['threads'] > 1 else '')
+        )
+    return results
+
+
+# ============================================================
+# MEDIA - serving uploads from MEDIA_ROOT (no Cloudinary)
+# ============================================================
+@suite('media')
+def bench_media(iterations):
+    """
+    Time a Django worker spends on one 2 MB image (plottwist/media.py):
+    sending it whole, sending a 64 KB range, answering a revalidation
+    with 304, and handing it to nginx with X-Accel-Redirect.
+
+    Uses a temporary MEDIA_ROOT; checks every answer has the right bytes.
+    """
+    import os
+    import shutil
+    import tempfile
+    from django.core.files.base import ContentFile
+    from django.core.management.base import CommandError
+    from django.test import Client, override_settings
+    from plottwist.media import HashedMediaStorage
+
+    root = tempfile.mkdtemp()
+    data = os.urandom(2 * 1024 * 1024)
+    client = Client()
+    try:
+        with override_settings(MEDIA_ROOT=root, ALLOWED_HOSTS=['*']):
+            url = '/media/' + HashedMediaStorage(location=root).save('project_images/bench.jpg', ContentFile(data))
+            etag = client.get(url)['ETag']
+
+            def body(response, status, expected):
+                content = b''.join(response.streaming_content) if response.streaming else response.content
+                if response.status_code != status or content != expected:
+                    raise CommandError(f'{url} answered {response.status_code} with the wrong bytes')
+
+            cases = [
+                ('whole file, sent by Django', lambda: body(client.get(url), 200, data)),
+                ('64 KB range', lambda: body(client.get(url, HTTP_RANGE='bytes=65536-131071'), 206, data[65536:131072])),
+                ('304 revalidation', lambda: body(client.get(url, HTTP_IF_NONE_MATCH=etag), 304, b'')),
+            ]
+            results = [dict(measure(label, func, iterations), parity='ok') for label, func in cases]
+            with override_settings(MEDIA_ACCEL='nginx'):
+                results.append(dict(measure('X-Accel-Redirect to nginx', lambda: body(client.get(url), 200, b''), iterations), parity='ok'))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    return results
+
+
+# ============================================================
+# LOGGING - cost of the per-pledge log lines
+# ============================================================
+@suite('logging')
+def bench_logging(iterations):
+    """
+    What logging "Added pledge" costs for 100 pledges of 2,000 characters,
+    written through the console handler from settings.LOGGING (into memory):
+
+    - before: the old f-strings - the whole pledge text in every line,
+      every pledge, put together even when the line is thrown away
+    - after: one line with lazy arguments and the text's length, written
+      for every pledge (LOG_SAMPLE_RATE=1), for 1 in 100 (the default),
+      and with INFO turned off (LOG_LEVEL=WARNING)
+
+    bytes_per_pledge is how much log output each pledge produces.
+    """
+    import io
+    import logging
+    from plottwist.log import SampleFilter
+
+    handler = logging.getLogger('projects').handlers[0]
+    signals_logger = logging.getLogger('projects.signals')
+    sample = next(f for f in signals_logger.filters if isinstance(f, SampleFilter))
+    pledge_id, project_id, add_content = 812, 14, 'The dragon roared. ' * 105
+    batch = 100
+
+    def before():
+        for _ in range(batch):
+            signals_logger.info(f"""
+                    Processing pledge:
+                    ID: {pledge_id}
+                    Project ID: {project_id}
+                    Added Content: {add_content}
+                """)
+            signals_logger.info(f"Added new line to project {project_id}")
+            signals_logger.info(f"Successfully updated project {project_id}")
+
+    def after():
+        for _ in range(batch):
+            signals_logger.info(
+                'Added pledge %s to project %s', pledge_id, project_id,
+                extra={'pledge_id': pledge_id, 'project_id': project_id, 'content_length': len(add_content)},
+            )
+
+    cases = [
+        ('before: f-strings with the text, every pledge', before, 1.0, logging.INFO),
+        ('after: lazy, length only, every pledge', after, 1.0, logging.INFO),
+        ('after: 1 in 100 sampled (default rate)', after, 0.01, logging.INFO),
+        ('after: LOG_LEVEL=WARNING', after, 0.01, logging.WARNING),
+    ]
+    results = []
+    old_stream, old_rate, old_level = handler.stream, sample.rate, signals_logger.level
+    try:
+        for label, func, rate, level in cases:
+            sample.rate = rate
+            signals_logger.setLevel(level)
+            stream = io.StringIO()
+            handler.setStream(stream)
+            row = measure(f'{label} ({batch} pledges)', func, iterations)
+            written = len(stream.getvalue().encode()) / (batch * (iterations + min(5, iterations)))
+            results.append(dict(row, bytes_per_pledge=round(written, 1)))
+    finally:
+        handler.setStream(old_stream)
+        sample.rate = old_rate
+        signals_logger.setLevel(old_level)
+    return results
+
+
+# ============================================================
+# ASSEMBLY - a story's text from its pledges, in SQL vs in Python
+# ============================================================
+@suite('assembly')
+def bench_assembly(iterations):
+    """
+    The text of 50 stories (the ones with the most pledges), three ways:
+    - read the stored current_content
+    - assembled by the database: string_agg / group_concat (assembly.py)
+    - assembled in Python: load each story's pledges and join them
+
+    Checks the database and Python give the same text for the stories it
+    times (projects/tests.py checks the edge cases); `same_as_stored` says
+    how many also equal the stored current_content (owners' hand edits
+    are the usual difference - `python manage.py check_stories` lists them).
+    """
+    from django.core.management.base import CommandError
+    from . import assembly
+    from .models import Project
+
+    if not assembly.available():
+        raise CommandError('this database has no string_agg / group_concat - assembly needs PostgreSQL or SQLite')
+
+    live = Project.objects.filter(archived_at__isnull=True)
+    ids = list(live.order_by('-pledge_count', 'id').values_list('id', flat=True)[:50])
+
+    def python():
+        return {project.pk: assembly.assemble_in_python(project) for project in Project.objects.filter(pk__in=ids)}
+
+    assembled = assembly.assembled_stories(ids)
+    if assembled != python():
+        raise CommandError('the database and Python assemble different text')
+    stored = dict(Project.objects.filter(pk__in=ids).values_list('id', 'current_content'))
+    same = sum(1 for project_id, text in assembled.items() if text == stored[project_id])
+
+    cases = [
+        ('stored current_content', lambda: dict(Project.objects.filter(pk__in=ids).values_list('id', 'current_content'))),
+        ('assembled by the database', lambda: assembly.assembled_stories(ids)),
+        ('assembled in Python', python),
+    ]
+    return [
+        dict(measure(f'{label} ({len(ids)} stories)', func, iterations), parity='ok', same_as_stored=f'{same}/{len(ids)}')
+        for label, func in cases
+    ]
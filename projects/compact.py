@@ -0,0 +1,131 @@
+'''
+compact.py - a fast, read-only path for LIST endpoints.
+
+Serializing hundreds of rows with a ModelSerializer creates a model
+object per row and runs every field's to_representation(). For list
+pages that is most of the request time.
+
+CompactReader looks at a serializer ONCE, works out which database
+column feeds each output key, and from then on fetches plain tuples with
+.values_list() and turns them into dicts directly. Only the few fields
+that really need converting (dates, floats, image URLs) are converted.
+
+If a serializer gains a field this module can't reproduce exactly
+(e.g. a SerializerMethodField), data() falls back to the normal
+serializer - and logs a WARNING naming the field, because the list
+endpoint has just lost its fast path. projects/tests.py fails in that
+case too.
+
+The output is identical to the serializer's - projects/tests.py checks
+that, and `python manage.py benchmark serializers` checks it again
+before timing both paths.
+'''
+
+import logging
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.relations import PrimaryKeyRelatedField
+
+# Fields whose database value IS already the JSON value
+_PASSTHROUGH_FIELDS = (
+    serializers.ReadOnlyField,
+    serializers.CharField,
+    serializers.IntegerField,
+    serializers.BooleanField,
+    serializers.ChoiceField,
+    PrimaryKeyRelatedField,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class CompactUnsupported(Exception):
+    """The serializer has a field the compact path can't reproduce exactly."""
+
+
+class CompactReader:
+    """
+    USAGE:
+        compact_projects = CompactReader(ProjectSerializer)
+        data = compact_projects.data(Project.objects.all())
+
+    data() returns the same list of dicts as
+        ProjectSerializer(queryset, many=True).data
+    """
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+        self._plan = None
+
+    @property
+    def plan(self):
+        # Built on first use (the app registry must be ready).
+        # False = this serializer can't use the fast path.
+        if self._plan is None:
+            try:
+                self._plan = self._compile()
+            except CompactUnsupported as unsupported:
+                logger.warning(
+                    '%s falls back to the slow serializer path: unsupported field %s',
+                    self.serializer_class.__name__, unsupported,
+                )
+                self._plan = False
+        return self._plan
+
+    def _compile(self):
+        model = self.serializer_class.Meta.model
+        keys, paths, converters = [], [], []
+        for key, field in self.serializer_class().fields.items():
+            if field.write_only:
+                continue
+            self._check_column(model, field)
+            keys.append(key)
+            paths.append('__'.join(field.source_attrs))
+            converter = self._converter(model, field)
+            if converter is not None:
+                converters.append((len(keys) - 1, key, converter))
+        return keys, paths, converters
+
+    @staticmethod
+    def _check_column(model, field):
+        """Every source must be a real (possibly related) column - not a property or method."""
+        current = model
+        for attr in field.source_attrs:
+            if current is None:
+                raise CompactUnsupported(field.field_name)
+            try:
+                model_field = current._meta.get_field(attr)
+            except FieldDoesNotExist:
+                raise CompactUnsupported(field.field_name)
+            if model_field.many_to_many or model_field.one_to_many:
+                raise CompactUnsupported(field.field_name)
+            current = model_field.related_model
+
+    @staticmethod
+    def _converter(model, field):
+        if isinstance(field, (serializers.DateTimeField, serializers.FloatField)):
+            return field.to_representation
+        if isinstance(field, serializers.FileField):
+            # The DB stores the file NAME; the API returns its URL
+            storage = model._meta.get_field(field.source).storage
+            return lambda name: storage.url(name) if name else None
+        if isinstance(field, _PASSTHROUGH_FIELDS):
+            return None
+        raise CompactUnsupported(f"{type(field).__name__} '{field.field_name}'")
+
+    def data(self, queryset):
+        if not self.plan:
+            return self.serializer_class(queryset, many=True).data
+        keys, paths, converters = self.plan
+        rows = queryset.values_list(*paths)
+        if not converters:
+            return [dict(zip(keys, row)) for row in rows]
+        results = []
+        for row in rows:
+            item = dict(zip(keys, row))
+            for index, key, convert in converters:
+                value = row[index]
+                if value is not None:
+                    item[key] = convert(value)
+            results.append(item)
+        return results
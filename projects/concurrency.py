@@ -0,0 +1,97 @@
+'''
+concurrency.py - stops two people's saves from silently overwriting each other.
+
+Projects and pledges carry a `version` number that goes up by one on
+every change. GET responses send it as an ETag header:
+
+    ETag: "v7"
+
+To update safely, send it back with the PUT:
+
+    If-Match: "v7"
+
+- still version 7 → the update goes through, version becomes 8
+- someone else saved in between (a pledge added to the story, another
+  editor) → 412 Precondition Failed, nothing is changed. Reload and retry.
+
+HOW (optimistic locking):
+Instead of locking the row while the user edits, the save starts with
+
+    UPDATE ... SET version = version + 1 WHERE id = 5 AND version = 7
+
+If that touches 0 rows, the version moved on and we stop. It's one
+cheap UPDATE, and it holds the row for the length of one transaction,
+not the length of an edit.
+
+A PUT without If-Match is still checked against the version loaded at
+the start of the same request - it just can't catch edits made
+between the client's GET and its PUT.
+'''
+
+from django.db.models import F
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def etag(instance):
+    return f'"v{instance.version}"'
+
+
+def if_match_version(request):
+    """
+    The version the client says it's editing, from If-Match.
+    None = no header (or "*", which means "any version").
+    Raises ValueError for a header we don't understand.
+    """
+    header = request.headers.get('If-Match', '').strip()
+    if not header or header == '*':
+        return None
+    # Compressed responses carry a weak ETag (W/"v7") - it names the same version
+    tag = header.split(',')[0].strip().removeprefix('W/').strip('"')
+    if not tag.startswith('v'):
+        raise ValueError(header)
+    return int(tag[1:])
+
+
+def claim_version(instance, expected):
+    """
+    Bump the row's version only if it is still `expected`.
+    Call inside transaction.atomic(), before saving the changes.
+    Returns False if someone else got there first.
+    """
+    claimed = type(instance).objects.filter(pk=instance.pk, version=expected).update(version=F('version') + 1)
+    if claimed:
+        instance.version = expected + 1
+    return bool(claimed)
+
+
+def expected_version(request, instance):
+    """
+    (version to claim, error response or None) for a PUT/DELETE.
+    The If-Match version if sent, otherwise the one just loaded.
+    """
+    try:
+        expected = if_match_version(request)
+    except ValueError:
+        return None, Response(
+            {"error": 'If-Match must be an ETag from this API, e.g. "v7".'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    if expected is None:
+        expected = instance.version
+    if expected != instance.version:
+        return None, conflict(instance)
+    return expected, None
+
+
+def conflict(instance):
+    """412 response telling the client to reload (the header has the version to reload to)."""
+    current = type(instance).objects.filter(pk=instance.pk).values_list('version', flat=True).first()
+    response = Response(
+        {"error": "This was changed by someone else since you loaded it. Reload and try again.",
+         "current_version": current},
+        status=status.HTTP_412_PRECONDITION_FAILED,
+    )
+    if current is not None:
+        response['ETag'] = f'"v{current}"'
+    return response
@@ -0,0 +1,297 @@
+'''
+content.py - keeps the story text in step with its pledges.
+
+Each project stores its story twice, already glued together:
+- starting_content: the opening + every pledge, joined with "\n"
+- current_content:  the opening + every pledge, joined with "\n\n"
+
+THE SEGMENT MODEL:
+When a pledge is appended we remember WHERE its text landed in each of
+those two strings (Pledge.starting_offset / current_offset) and how long
+it is (segment_length). Editing or deleting a pledge can then splice
+just that stretch of text:
+
+    "Once upon a time.\n\nA dragon appeared!\n\nThe hero ran."
+                          ^ current_offset=19, segment_length=18
+
+Replacing "A dragon appeared!" = text[:19] + new + text[37:], and every
+later pledge's offset moves by (new length - old length) in ONE UPDATE.
+No re-reading and re-joining every pledge of the story.
+
+If the owner has hand-edited the story since (PUT /projects/1/), the text
+may no longer sit at the stored offset. We check first; if it moved we
+look for it NEAR where it was (a line repeated elsewhere in the story is
+a different pledge), and if it isn't there we treat it as no longer in
+the story and leave the text alone rather than cut out the wrong words.
+
+All changes lock the project row (select_for_update), so two pledges
+saved at the same moment can't overwrite each other's text, and bump
+the project's version, so an editor holding the old text can't either
+(see concurrency.py).
+
+The story's word_count / char_count are kept up to date the same way:
+each pledge counts its own words once when it is saved, and we add or
+subtract that - the story itself is never counted word by word again.
+'''
+
+from django.db import transaction
+from django.db.models import F, Max
+
+from .models import Project, Pledge, text_counts
+from .revisions import note_change
+from . import archive
+
+# story field → (separator between pieces, Pledge field holding the segment's offset)
+STORY_FIELDS = {
+    'starting_content': ('\n', 'starting_offset'),
+    'current_content': ('\n\n', 'current_offset'),
+}
+
+
+def segment_text(add_content):
+    """The exact text a pledge contributes to the story."""
+    return (add_content or '').strip()
+
+
+# How far (in characters) from its stored offset a segment may have moved and still be found
+NEARBY = 500
+
+
+def _is_whole_piece(text, at, length, separator):
+    """True if text[at:at + length] is a whole piece of the story, not part of a longer line."""
+    before = at == 0 or text[at - len(separator):at] == separator
+    after = at + length == len(text) or text[at + length:at + length + len(separator)] == separator
+    return before and after
+
+
+def _locate(text, offset, segment, separator):
+    """
+    Where the segment really is: its stored offset if it still matches,
+    else the closest whole-piece match within NEARBY characters of it,
+    else None (= not in the story any more).
+    """
+    if not segment or offset is None:
+        return None
+    if text[offset:offset + len(segment)] == segment:
+        return offset
+    start = max(offset - NEARBY, 0)
+    end = offset + NEARBY + len(segment)
+    matches = []
+    found = text.find(segment, start, end)
+    while found >= 0:
+        if _is_whole_piece(text, found, len(segment), separator):
+            matches.append(found)
+        found = text.find(segment, found + 1, end)
+    return min(matches, key=lambda at: abs(at - offset)) if matches else None
+
+
+def _shift_later_segments(project_id, pledge_id, offset_field, after, delta):
+    """Move the offsets of every segment that comes after `after` by delta characters."""
+    if delta:
+        later = Pledge.objects.filter(project_id=project_id, **{f'{offset_field}__gt': after})
+        if pledge_id is not None:
+            later = later.exclude(pk=pledge_id)
+        later.update(**{offset_field: F(offset_field) + delta})
+
+
+def _save_offsets(pledge, **values):
+    Pledge.objects.filter(pk=pledge.pk).update(**values)
+    for name, value in values.items():
+        setattr(pledge, name, value)
+
+
+def _recount(project, words_added):
+    """
+    Update the story's counts after a change that added words_added words
+    (negative = removed). Characters are just the new text's length.
+    Only a story that is back to its bare opening is counted afresh.
+    """
+    current = project.current_content or ''
+    if current and not current.isspace():
+        project.word_count = max(project.word_count + words_added, 0)
+        project.char_count = len(current)
+    else:
+        project.word_count, project.char_count = text_counts(project.starting_content)
+
+
+def _locked_project(project_id):
+    """The project row, locked for this transaction - with its text back in place if it was archived."""
+    project = Project.objects.select_for_update().filter(pk=project_id).first()
+    if project is not None and project.archived_at is not None:
+        archive.unarchive(project_id)
+        project = Project.objects.select_for_update().get(pk=project_id)
+        project._was_archived = True  # pledge objects loaded before this still have empty text
+    return project
+
+
+def append_pledge(pledge, project_id=None):
+    """Add one pledge's text to the end of its project's story."""
+    return append_pledges(project_id or pledge.project_id, [pledge])
+
+
+def append_pledges(project_id, pledges, user_id=None):
+    """
+    Add several pledges' text to the end of a project's story, in id order,
+    with ONE write of the story however many there are (e.g. a batch of
+    approvals from the moderation queue).
+
+    The first pledge of a story with an empty current_content starts it
+    from the opening (starting_content), as the frontend expects.
+    """
+    pledges = sorted(pledges, key=lambda pledge: pledge.pk)
+    with transaction.atomic():
+        project = _locked_project(project_id)
+        ids = [pledge.pk for pledge in pledges]
+        if getattr(project, '_was_archived', False):
+            texts = dict(Pledge.objects.filter(pk__in=ids).values_list('id', 'add_content'))
+            for pledge in pledges:
+                pledge.add_content = texts.get(pledge.pk, pledge.add_content)
+        last = Pledge.objects.filter(project_id=project_id).exclude(pk__in=ids).aggregate(last=Max('position'))['last'] or 0
+
+        opening = (project.starting_content or '').rstrip()
+        story = project.current_content or ''
+        # The story so far: current_content, or just the opening if no one has added to it yet
+        base = story.rstrip() if story.strip() else opening
+        starting_parts, starting_length = [opening], len(opening)
+        current_parts, current_length = [base], len(base)
+        for position, pledge in enumerate(pledges, start=last + 1):
+            segment = segment_text(pledge.add_content)
+            pledge.position, pledge.segment_length = position, len(segment)
+            pledge.starting_offset = pledge.current_offset = None
+            if not segment:
+                continue
+            pledge.starting_offset = starting_length + 1
+            starting_parts += ['\n', segment]
+            starting_length += 1 + len(segment)
+            if current_length:
+                pledge.current_offset = current_length + 2
+                current_parts += ['\n\n', segment]
+                current_length += 2 + len(segment)
+            else:
+                pledge.current_offset = 0
+                current_parts, current_length = [segment], len(segment)
+
+        if any(pledge.segment_length for pledge in pledges):
+            project.starting_content = ''.join(starting_parts)
+            project.current_content = ''.join(current_parts)
+            _recount(project, sum(pledge.word_count for pledge in pledges if pledge.segment_length))
+            if user_id is None and len(pledges) == 1:
+                user_id = pledges[0].supporter_id
+            # Both fields keep their old text up to where the new pieces start - revisions.py stores just the rest
+            kept = {'starting_content': len(opening), 'current_content': len(base) if story.strip() else 0}
+            note_change(project, 'pledge_added', user_id, appended={
+                field: (keep, getattr(project, field)[keep:]) for field, keep in kept.items()
+            })
+            project.version += 1  # an owner editing the old text now gets a 412 instead of erasing this pledge
+            project.save(update_fields=['starting_content', 'current_content', 'version', 'word_count', 'char_count'])
+        Pledge.objects.bulk_update(pledges, ['position', 'segment_length', 'starting_offset', 'current_offset'])
+    return project
+
+
+def replace_pledge(pledge, old_content):
+    """
+    The pledge's add_content changed from old_content: swap its segment
+    in both story fields for the new text.
+    """
+    old, new = segment_text(old_content), segment_text(pledge.add_content)
+    if old == new:
+        return
+    if not new:
+        return remove_pledge(pledge, old_content)
+    with transaction.atomic():
+        project = _locked_project(pledge.project_id)
+        stored = Pledge.objects.filter(pk=pledge.pk).values('starting_offset', 'current_offset').first() or {}
+        offsets = {'segment_length': len(new)}
+        changed = []
+        for field, (separator, offset_field) in STORY_FIELDS.items():
+            text = getattr(project, field) or ''
+            at = _locate(text, stored.get(offset_field), old, separator)
+            offsets[offset_field] = at
+            if at is None:
+                continue  # not found - leave the story as the owner left it
+            setattr(project, field, text[:at] + new + text[at + len(old):])
+            _shift_later_segments(project.pk, pledge.pk, offset_field, at, len(new) - len(old))
+            changed.append(field)
+        if changed:
+            if 'current_content' in changed:
+                _recount(project, text_counts(new)[0] - text_counts(old)[0])
+            note_change(project, 'pledge_edited', pledge.supporter_id)
+            project.version += 1
+            project.save(update_fields=[*changed, 'version', 'word_count', 'char_count'])
+        _save_offsets(pledge, **offsets)
+
+
+def remove_pledge(pledge, content=None, project_id=None):
+    """
+    Cut one pledge's segment out of the story. `content` is the text as it
+    was appended, if it has changed since; `project_id` the project it was
+    appended to.
+    """
+    texts = {pledge.pk: content} if content is not None else {pledge.pk: pledge.add_content}
+    remove_pledges(project_id or pledge.project_id, [pledge], texts)
+
+
+def remove_pledges(project_id, pledges, texts=None, user_id=None):
+    """
+    Cut several pledges' segments (and the separators that joined them on)
+    out of both story fields, with ONE write of the story.
+
+    texts = {pledge id: text as appended}; by default the text is read
+    from the database.
+    """
+    ids = [pledge.pk for pledge in pledges]
+    with transaction.atomic():
+        project = _locked_project(project_id)
+        if project is None:
+            return
+        stored = {row['id']: row for row in Pledge.objects.filter(pk__in=ids).values('id', 'add_content', 'starting_offset', 'current_offset')}
+        segments = {pledge_id: segment_text((texts or {}).get(pledge_id, row['add_content'])) for pledge_id, row in stored.items()}
+        changed, cuts, words_removed = [], {}, 0
+        for field, (separator, offset_field) in STORY_FIELDS.items():
+            text = getattr(project, field) or ''
+            cuts[offset_field] = []
+            # Last segment first, so cutting one never moves the ones still to be cut
+            ordered = sorted(stored.values(), key=lambda row: -1 if row[offset_field] is None else row[offset_field], reverse=True)
+            for row in ordered:
+                segment = segments[row['id']]
+                at = _locate(text, row[offset_field], segment, separator)
+                if at is None:
+                    continue
+                start, end = at, at + len(segment)
+                if text[start - len(separator):start] == separator:
+                    start -= len(separator)  # "...before\n\nTHIS" → "...before"
+                elif text[end:end + len(separator)] == separator:
+                    end += len(separator)  # "THIS\n\nafter..." → "after..."
+                text = text[:start] + text[end:]
+                cuts[offset_field].append((at, start - end))
+                if field == 'current_content':
+                    words_removed += text_counts(segment)[0]
+            if cuts[offset_field]:
+                setattr(project, field, text)
+                changed.append(field)
+        if changed:
+            if user_id is None and len(pledges) == 1:
+                user_id = pledges[0].supporter_id
+            _recount(project, -words_removed)
+            note_change(project, 'pledge_removed', user_id)
+            project.version += 1
+            project.save(update_fields=[*changed, 'version', 'word_count', 'char_count'])
+            _shift_after_cuts(project_id, ids, cuts)
+        Pledge.objects.filter(pk__in=ids).update(starting_offset=None, current_offset=None)
+
+
+def _shift_after_cuts(project_id, removed_ids, cuts):
+    """Move the remaining segments back by the text cut out before them."""
+    for offset_field, field_cuts in cuts.items():
+        if len(field_cuts) == 1:
+            (at, delta), = field_cuts
+            _shift_later_segments(project_id, None, offset_field, at, delta)
+        elif field_cuts:
+            later = list(
+                Pledge.objects.filter(project_id=project_id, **{f'{offset_field}__gt': min(at for at, _ in field_cuts)})
+                .exclude(pk__in=removed_ids).only('id', offset_field)
+            )
+            for pledge in later:
+                offset = getattr(pledge, offset_field)
+                setattr(pledge, offset_field, offset + sum(delta for at, delta in field_cuts if at < offset))
+            Pledge.objects.bulk_update(later, [offset_field], batch_size=500)
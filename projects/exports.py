@@ -0,0 +1,174 @@
+'''
+exports.py builds downloadable archives of finished (closed) stories.
+
+Each story becomes one text or Markdown file, and a manifest.json lists
+every story together with its contributors. The archive is produced as a
+stream of byte chunks, so neither the HTTP view nor the management command
+ever holds the whole archive in memory.
+'''
+
+import io
+import json
+import tarfile
+import time
+import zipfile
+
+from django.db.models import Prefetch
+from django.utils.text import slugify
+
+from .models import APPROVED, Project, Pledge
+from . import archive
+
+ARCHIVE_FORMATS = ('tar.gz', 'zip')
+TEXT_FORMATS = ('md', 'txt')
+
+# How many projects are pulled from the database per round trip
+EXPORT_CHUNK_SIZE = 100
+
+
+class _ChunkSink:
+    """
+    A write-only "file" that the tar/zip writers write into.
+
+    Instead of keeping everything, we hand the written bytes back out with
+    drain() after every story, so memory use stays at roughly one story.
+    """
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def closed_projects(ids=None):
+    """
+    The projects that can be exported: only finished (is_open=False) stories.
+
+    Pledges are prefetched with just the columns the manifest needs,
+    so the (large) add_content text is never loaded twice.
+    """
+    projects = (
+        Project.objects.filter(is_open=False)
+        .select_related('owner')
+        .prefetch_related(Prefetch(
+            'pledges',
+            queryset=Pledge.objects.filter(status=APPROVED).select_related('supporter')
+            .only('project', 'amount', 'anonymous', 'supporter__username')
+            .order_by('id'),
+        ))
+        .order_by('id')
+    )
+    if ids:
+        projects = projects.filter(pk__in=ids)
+    return projects
+
+
+def story_text(project):
+    """The full story: the grown current_content, or the opening if nobody contributed."""
+    # Archived stories keep their text in a ProjectArchive - unpack it, but don't
+    # fill the cache with a whole library's worth of stories nobody is reading
+    archive.hydrate(project, with_pledges=False, remember=False)
+    return project.current_content or project.starting_content or ''
+
+
+def story_filename(project, text_format):
+    slug = slugify(project.title) or 'untitled'
+    return f"stories/{project.pk}-{slug}.{text_format}"
+
+
+def render_story(project, text_format):
+    text = story_text(project).strip()
+    if text_format == 'txt':
+        return f"{project.title}\n\n{text}\n"
+    return (
+        f"# {project.title}\n\n"
+        f"*{project.genre} · {project.content_type} · by {project.owner.username}*\n\n"
+        f"> {project.description.strip()}\n\n"
+        f"---\n\n"
+        f"{text}\n"
+    )
+
+
+def manifest_entry(project, filename):
+    """
+    One manifest record. Contributors are grouped by username and
+    anonymous pledges are reported together under "Anonymous".
+    """
+    contributors = {}
+    pledges = list(project.pledges.all())
+    for pledge in pledges:
+        name = 'Anonymous' if pledge.anonymous else pledge.supporter.username
+        entry = contributors.setdefault(name, {'username': name, 'pledges': 0, 'verses': 0})
+        entry['pledges'] += 1
+        entry['verses'] += pledge.amount
+    return {
+        'id': project.pk,
+        'title': project.title,
+        'genre': project.genre,
+        'content_type': project.content_type,
+        'owner': project.owner.username,
+        'date_created': project.date_created.isoformat(),
+        'file': filename,
+        'pledge_count': len(pledges),
+        'contributors': list(contributors.values()),
+    }
+
+
+def iter_story_archive(projects, archive_format='tar.gz', text_format='md'):
+    """
+    Yields the archive as byte chunks, one (or a few) per story.
+
+    projects is a queryset (usually closed_projects()); it is walked with
+    iterator() so only EXPORT_CHUNK_SIZE projects are in memory at a time.
+    """
+    if archive_format not in ARCHIVE_FORMATS:
+        raise ValueError(f"Unknown archive format: {archive_format}")
+    if text_format not in TEXT_FORMATS:
+        raise ValueError(f"Unknown text format: {text_format}")
+
+    sink = _ChunkSink()
+    if archive_format == 'zip':
+        archive = zipfile.ZipFile(sink, mode='w', compression=zipfile.ZIP_DEFLATED)
+
+        def add(name, data):
+            archive.writestr(name, data)
+    else:
+        # 'w|gz' = stream mode: tarfile never seeks backwards
+        archive = tarfile.open(fileobj=sink, mode='w|gz')
+
+        def add(name, data):
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = int(time.time())
+            archive.addfile(info, io.BytesIO(data))
+
+    manifest = []
+    for project in projects.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        filename = story_filename(project, text_format)
+        add(filename, render_story(project, text_format).encode('utf-8'))
+        manifest.append(manifest_entry(project, filename))
+        chunk = sink.drain()
+        if chunk:
+            yield chunk
+
+    add('manifest.json', json.dumps({'stories': manifest}, indent=2).encode('utf-8'))
+    archive.close()
+    yield sink.drain()
+
+
+def archive_content_type(archive_format):
+    return 'application/zip' if archive_format == 'zip' else 'application/gzip'
@@ -0,0 +1,108 @@
+'''
+facets.py - the maintained genre / content-type counters.
+
+WRITE SIDE: signals.py calls adjust() when a project is created, changes
+genre / content_type / is_open, or is deleted. It runs inside the same
+transaction as the project save, so counts and projects never disagree.
+
+READ SIDE: facet_counts() answers from a small in-memory copy of the
+GenreFacet table, reloaded every FACET_REFRESH_SECONDS. Browse pages
+therefore cost no database query at all for their facet block.
+'''
+
+import threading
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from .models import Genre, GenreFacet, Project, normalize_genre
+
+_lock = threading.Lock()
+_snapshot = None  # (loaded_at, rows) - rows = [(genre name, content_type, is_open, count)]
+
+
+def _genre(name):
+    """The Genre row for this (free-text) genre, created the first time it's seen."""
+    key = normalize_genre(name)
+    genre = Genre.objects.filter(key=key).first()
+    if genre is None:
+        try:
+            with transaction.atomic():
+                genre = Genre.objects.create(key=key, name=' '.join(name.split()))
+        except IntegrityError:
+            # Another request created it at the same moment
+            genre = Genre.objects.get(key=key)
+    return genre
+
+
+def adjust(genre, content_type, is_open, delta):
+    """Add delta (+1 / -1) to the counter for this genre/content type/open state."""
+    facet, _ = GenreFacet.objects.get_or_create(
+        genre=_genre(genre), content_type=content_type, is_open=is_open,
+    )
+    if delta < 0:
+        GenreFacet.objects.filter(pk=facet.pk, count__gte=-delta).update(count=F('count') + delta)
+    else:
+        GenreFacet.objects.filter(pk=facet.pk).update(count=F('count') + delta)
+
+
+def rebuild():
+    """
+    Recount everything from the project table (one GROUP BY).
+
+    For bulk imports that skip save() - e.g. seed_demo - or if the
+    counters ever drift. Normal saves keep them right by themselves.
+    """
+    rows = (
+        Project.objects.order_by()
+        .values_list('genre_key', 'content_type', 'is_open')
+        .annotate(total=Count('id'))
+    )
+    with transaction.atomic():
+        GenreFacet.objects.all().delete()
+        genres = {genre.key: genre for genre in Genre.objects.all()}
+        facets = []
+        for key, content_type, is_open, total in rows:
+            if key not in genres:
+                example = Project.objects.filter(genre_key=key).values_list('genre', flat=True).first()
+                genres[key] = _genre(example)
+            facets.append(GenreFacet(genre=genres[key], content_type=content_type, is_open=is_open, count=total))
+        GenreFacet.objects.bulk_create(facets)
+    invalidate()
+
+
+def invalidate():
+    """Forget this process's in-memory copy (it reloads on next use)."""
+    global _snapshot
+    _snapshot = None
+
+
+def _rows():
+    global _snapshot
+    snapshot = _snapshot
+    if snapshot is None or time.monotonic() - snapshot[0] > settings.FACET_REFRESH_SECONDS:
+        with _lock:
+            if _snapshot is snapshot:  # nobody reloaded while we waited
+                rows = list(
+                    GenreFacet.objects.filter(count__gt=0)
+                    .values_list('genre__name', 'content_type', 'is_open', 'count')
+                )
+                _snapshot = (time.monotonic(), rows)
+            snapshot = _snapshot
+    return snapshot[1]
+
+
+def facet_counts(is_open=None):
+    """
+    Counts per genre and per content type, optionally only open (True)
+    or only closed (False) projects. Same shape as filters.project_facets().
+    """
+    genres, content_types = {}, {}
+    for genre, content_type, facet_open, count in _rows():
+        if is_open is not None and facet_open != is_open:
+            continue
+        genres[genre] = genres.get(genre, 0) + count
+        content_types[content_type] = content_types.get(content_type, 0) + count
+    return {'genre': genres, 'content_type': content_types}
@@ -0,0 +1,101 @@
+'''
+feed.py - the per-user activity feed of new pledges on followed projects.
+
+TWO WAYS A PLEDGE REACHES A FEED:
+
+1. FAN-OUT ON WRITE (normal projects)
+   When a pledge is made, one FeedItem row is written for every follower.
+   Reading a feed is then just "my newest FeedItems" - one index scan.
+
+2. MERGE ON READ (very popular projects)
+   A project with more than FEED_FANOUT_LIMIT followers would need
+   thousands of rows written per pledge. For those we write nothing and,
+   when a feed is read, pull the newest pledges of the popular projects
+   the user follows and merge them in.
+
+Both sources are ordered by pledge id, so the pledge id doubles as the
+page cursor: "give me 20 items older than pledge 1234".
+'''
+
+from django.conf import settings
+from rest_framework import serializers
+
+from .models import APPROVED, FeedItem, Follow, Pledge, Project
+from . import archive
+
+FANOUT_BATCH_SIZE = 1000
+
+# Formats dates exactly like the rest of the API does
+_format_datetime = serializers.DateTimeField().to_representation
+
+
+def fan_out(pledge):
+    """Deliver a new pledge into its followers' feeds (skipped for popular projects)."""
+    return fan_out_many(pledge.project_id, [pledge])
+
+
+def fan_out_many(project_id, pledges):
+    """Deliver several new pledges of one project - one follower lookup for all of them."""
+    # Fresh from the database - the pledge's cached project may be minutes old
+    follower_count = Project.objects.filter(pk=project_id).values_list('follower_count', flat=True).first()
+    if not follower_count or follower_count > settings.FEED_FANOUT_LIMIT:
+        return 0
+    followers = list(Follow.objects.filter(project_id=project_id).values_list('user_id', flat=True))
+    items = [
+        FeedItem(user_id=user_id, pledge_id=pledge.pk)
+        for pledge in pledges
+        for user_id in followers
+        if user_id != pledge.supporter_id  # no need to tell people about their own pledge
+    ]
+    FeedItem.objects.bulk_create(items, batch_size=FANOUT_BATCH_SIZE, ignore_conflicts=True)
+    return len(items)
+
+
+def feed_page(user, before=None, limit=20):
+    """
+    One page of the user's feed, newest first.
+
+    Returns (items, next_cursor). Pass next_cursor back as `before` to get
+    the following page; it is None on the last page.
+    """
+    fanned_out = FeedItem.objects.filter(user=user)
+    if before is not None:
+        fanned_out = fanned_out.filter(pledge_id__lt=before)
+    pledge_ids = set(fanned_out.order_by('-pledge_id').values_list('pledge_id', flat=True)[:limit])
+
+    popular = list(
+        Follow.objects.filter(user=user, project__follower_count__gt=settings.FEED_FANOUT_LIMIT)
+        .values_list('project_id', flat=True)
+    )
+    if popular:
+        merged = Pledge.objects.filter(project_id__in=popular, status=APPROVED).exclude(supporter=user)
+        if before is not None:
+            merged = merged.filter(pk__lt=before)
+        pledge_ids.update(merged.order_by('-id').values_list('id', flat=True)[:limit])
+
+    page_ids = sorted(pledge_ids, reverse=True)[:limit]
+    rows = (
+        Pledge.objects.filter(pk__in=page_ids)
+        .order_by('-id')
+        .values(
+            'id', 'project_id', 'project__title', 'amount', 'add_content',
+            'anonymous', 'supporter__username', 'date_created',
+        )
+    )
+    items = [
+        {
+            'pledge': row['id'],
+            'project': row['project_id'],
+            'project_title': row['project__title'],
+            'amount': row['amount'],
+            'add_content': row['add_content'],
+            # Anonymous contributors stay anonymous in other people's feeds
+            'supporter_username': None if row['anonymous'] else row['supporter__username'],
+            'anonymous': row['anonymous'],
+            'date_created': _format_datetime(row['date_created']),
+        }
+        for row in rows
+    ]
+    archive.hydrate_rows(items, 'project', 'pledge')  # pledges of archived stories get their text back
+    next_cursor = page_ids[-1] if len(page_ids) == limit else None
+    return items, next_cursor
@@ -0,0 +1,156 @@
+'''
+filters.py - filtering, sorting and facet counts for GET /projects/.
+
+EXAMPLES:
+    /projects/?is_open=true&genre=Horror&content_type=poem&ordering=-date_created
+    /projects/?owner=3&created_after=2025-01-01
+    /projects/?min_progress=0.5&ordering=-completion
+    /projects/?is_open=true&facets=true
+
+Every filter maps to an indexed column (see Project.Meta.indexes), so
+the database never has to read the whole table to answer a browse page.
+'''
+
+from datetime import datetime, time, timedelta
+
+from django.db.models import Count, F, FloatField
+from django.db.models.functions import Cast, NullIf
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework import serializers
+
+from .models import CONTENT_TYPE_CHOICES, Genre, normalize_genre
+from . import facets
+
+# Query parameters that only narrow by is_open - the maintained counters can answer those
+COUNTER_FRIENDLY_PARAMS = {'is_open', 'ordering', 'facets'}
+
+# ?ordering=<key> (prefix with "-" for descending) → what we sort by
+ORDERING = {
+    'date_created': 'date_created',
+    'pledges': 'pledge_count',
+    'completion': 'completion',
+}
+
+BOOLEAN_VALUES = {'true': True, '1': True, 'false': False, '0': False}
+
+
+def _boolean(params, name):
+    value = params[name].lower()
+    if value not in BOOLEAN_VALUES:
+        raise serializers.ValidationError({name: 'Use true or false.'})
+    return BOOLEAN_VALUES[value]
+
+
+def _date(params, name):
+    """A date-time, or a plain date (→ that day's midnight, in TIME_ZONE)."""
+    value = params[name]
+    try:
+        parsed = parse_datetime(value)
+        day = None if parsed else parse_date(value)
+    except ValueError:  # well-formed but impossible, e.g. month 13
+        parsed = day = None
+    if parsed is None:
+        if day is None:
+            raise serializers.ValidationError({name: 'Use a date (2025-01-31) or date-time (2025-01-31T09:00:00Z).'})
+        return timezone.make_aware(datetime.combine(day, time.min)), True
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed, False
+
+
+def _number(params, name):
+    try:
+        return float(params[name])
+    except ValueError:
+        raise serializers.ValidationError({name: 'Must be a number.'})
+
+
+def with_completion(projects):
+    """Adds `completion` = pledges / goal (0.5 = halfway, 1.0 = goal reached)."""
+    return projects.annotate(
+        completion=Cast(F('pledge_count'), FloatField()) / NullIf(F('goal'), 0)
+    )
+
+
+def filter_projects(projects, params):
+    """
+    Narrow the project queryset using the request's query parameters.
+
+    Bad values raise serializers.ValidationError, which DRF turns into a
+    400 response listing what was wrong.
+    """
+    if 'is_open' in params:
+        projects = projects.filter(is_open=_boolean(params, 'is_open'))
+    if params.get('genre'):
+        # genre=horror matches "Horror", "HORROR", "horror " ... (see normalize_genre)
+        projects = projects.filter(genre_key__in=[normalize_genre(genre) for genre in params['genre'].split(',')])
+    if params.get('content_type'):
+        content_types = params['content_type'].split(',')
+        valid = {value for value, label in CONTENT_TYPE_CHOICES}
+        if not set(content_types) <= valid:
+            raise serializers.ValidationError({'content_type': f'Choose from {sorted(valid)}.'})
+        projects = projects.filter(content_type__in=content_types)
+    if params.get('owner'):
+        try:
+            projects = projects.filter(owner_id=int(params['owner']))
+        except ValueError:
+            raise serializers.ValidationError({'owner': 'Must be a user ID.'})
+    # Compare against real date-times (not date_created__date) so the index is used
+    if params.get('created_after'):
+        created_after, _ = _date(params, 'created_after')
+        projects = projects.filter(date_created__gte=created_after)
+    if params.get('created_before'):
+        created_before, whole_day = _date(params, 'created_before')
+        if whole_day:
+            # "before 2025-01-31" includes all of the 31st
+            projects = projects.filter(date_created__lt=created_before + timedelta(days=1))
+        else:
+            projects = projects.filter(date_created__lte=created_before)
+    if params.get('min_pledges'):
+        projects = projects.filter(pledge_count__gte=_number(params, 'min_pledges'))
+    if params.get('min_progress') or params.get('max_progress'):
+        projects = with_completion(projects)
+        if params.get('min_progress'):
+            projects = projects.filter(completion__gte=_number(params, 'min_progress'))
+        if params.get('max_progress'):
+            projects = projects.filter(completion__lte=_number(params, 'max_progress'))
+    return projects
+
+
+def order_projects(projects, params):
+    ordering = params.get('ordering')
+    if not ordering:
+        return projects
+    key = ordering.lstrip('-')
+    if key not in ORDERING:
+        raise serializers.ValidationError({'ordering': f'Choose from {sorted(ORDERING)} (prefix "-" for descending).'})
+    if key == 'completion' and 'completion' not in projects.query.annotations:
+        projects = with_completion(projects)
+    descending = ordering.startswith('-')
+    field = ORDERING[key]
+    # id as a tie-breaker keeps pages stable when many rows share a value
+    return projects.order_by(f'-{field}' if descending else field, '-id' if descending else 'id')
+
+
+def project_facets(projects, params):
+    """
+    Counts per genre and per content type for the (filtered) projects.
+    {"genre": {"Horror": 12, "Romance": 3}, "content_type": {"story": 11, "poem": 4}}
+
+    - No filters, or only is_open: straight from the maintained counters
+      (facets.py) - no database query.
+    - Any other filter: ONE grouped query, GROUP BY genre, content_type,
+      folded into two small dictionaries here.
+    """
+    if set(params) <= COUNTER_FRIENDLY_PARAMS:
+        return facets.facet_counts(_boolean(params, 'is_open') if 'is_open' in params else None)
+
+    by_key, content_types = {}, {}
+    rows = projects.order_by().values_list('genre_key', 'content_type').annotate(total=Count('id'))
+    for genre_key, content_type, total in rows:
+        by_key[genre_key] = by_key.get(genre_key, 0) + total
+        content_types[content_type] = content_types.get(content_type, 0) + total
+    names = dict(Genre.objects.filter(key__in=by_key).values_list('key', 'name'))
+    genres = {names.get(key, key): total for key, total in by_key.items()}
+    return {'genre': genres, 'content_type': content_types}
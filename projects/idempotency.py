@@ -0,0 +1,135 @@
+'''
+idempotency.py - makes retried POSTs safe with an Idempotency-Key header.
+
+A phone on a bad connection sends "POST /projects/5/pledges/", the
+pledge is created, but the response never arrives - so the app sends it
+again. Without protection that's two pledges and the story text appended
+twice. With it, the client sends a unique key with each NEW action:
+
+    Idempotency-Key: 6f1c0d2e-...   (any string up to 255 characters)
+
+and retries the SAME action with the SAME key:
+
+- first time: the view runs and its response is stored under the key
+- retry: the stored response comes back unchanged (with the header
+  Idempotent-Replayed: true) - nothing is created again
+- retry while the first request is still running: 409 Conflict
+- same key, different request body or URL: 422 (the key was reused by mistake)
+
+Keys belong to the logged-in user and are kept for IDEMPOTENCY_KEY_TTL_HOURS.
+Requests without the header work exactly as before.
+'''
+
+import functools
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyRecord
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+def fingerprint(request):
+    """Hash of what the request asks for - method, path and (canonical) body."""
+    try:
+        body = json.dumps(request.data, sort_keys=True, default=str)
+    except TypeError:
+        body = repr(sorted(request.data.lists())) if hasattr(request.data, 'lists') else repr(request.data)
+    return hashlib.sha256(f'{request.method} {request.path}\n{body}'.encode()).hexdigest()
+
+
+def expired_before():
+    return timezone.now() - timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS)
+
+
+def _claim(user, key, request_fingerprint):
+    """
+    Reserve the key for this request. Returns (record, created). The
+    unique constraint on (user, key) means only ONE of two simultaneous
+    requests can create the row - the other gets the existing one.
+    """
+    try:
+        with transaction.atomic():
+            return IdempotencyRecord.objects.create(user=user, key=key, fingerprint=request_fingerprint), True
+    except IntegrityError:
+        record = IdempotencyRecord.objects.filter(user=user, key=key).first()
+        if record is None:  # deleted (pruned / failed) in between - try once more
+            return _claim(user, key, request_fingerprint)
+        if record.date_created < expired_before():
+            # An old key that just hasn't been pruned yet counts as new
+            record.delete()
+            return _claim(user, key, request_fingerprint)
+        return record, False
+
+
+def idempotent(handler):
+    """
+    Decorator for an APIView's post() method.
+
+        @idempotent
+        def post(self, request, project_id):
+            ...
+    """
+    @functools.wraps(handler)
+    def wrapper(view, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None or not request.user.is_authenticated:
+            return handler(view, request, *args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {"error": f"{HEADER} must be 1 to {MAX_KEY_LENGTH} characters."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        request_fingerprint = fingerprint(request)
+        record, created = _claim(request.user, key, request_fingerprint)
+        if not created:
+            if record.fingerprint != request_fingerprint:
+                return Response(
+                    {"error": f"This {HEADER} was already used for a different request."},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                )
+            if record.status_code is None:
+                return Response(
+                    {"error": "A request with this Idempotency-Key is still being processed. Retry shortly."},
+                    status=status.HTTP_409_CONFLICT,
+                    headers={'Retry-After': '1'},
+                )
+            return Response(
+                record.response_body,
+                status=record.status_code,
+                headers={'Idempotent-Replayed': 'true'},
+            )
+
+        try:
+            response = handler(view, request, *args, **kwargs)
+        except Exception:
+            record.delete()  # nothing was stored - let the client retry
+            raise
+        if response.status_code >= 500:
+            record.delete()
+        else:
+            record.status_code = response.status_code
+            record.response_body = response.data
+            record.save(update_fields=['status_code', 'response_body'])
+        return response
+    return wrapper
+
+
+def prune(batch_size=1000):
+    """Delete expired keys in small batches. Returns how many were removed."""
+    removed = 0
+    old = IdempotencyRecord.objects.filter(date_created__lt=expired_before())
+    while True:
+        ids = list(old.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return removed
+        removed += IdempotencyRecord.objects.filter(id__in=ids).delete()[0]
@@ -0,0 +1,44 @@
+'''
+python manage.py archive_projects [--days 90] [--limit 500] [--dry-run]
+
+Moves the text of projects that have been closed for a while into
+compressed ProjectArchive rows (see projects/archive.py). The API keeps
+serving them unchanged. Run it on a schedule (e.g. Heroku Scheduler, nightly).
+
+On PostgreSQL, the space is given back to the tables by the next
+(auto)vacuum.
+'''
+
+from django.core.management.base import BaseCommand
+
+from projects import archive
+
+
+class Command(BaseCommand):
+    help = 'Archive the story text of projects closed for longer than ARCHIVE_AFTER_DAYS.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help='Closed for at least this many days (default: ARCHIVE_AFTER_DAYS)')
+        parser.add_argument('--limit', type=int, default=None, help='Archive at most this many projects')
+        parser.add_argument('--dry-run', action='store_true', help='Only list what would be archived')
+
+    def handle(self, *args, **options):
+        ids = archive.archivable_projects(options['days']).order_by('date_closed').values_list('id', flat=True)
+        if options['limit']:
+            ids = ids[:options['limit']]
+        ids = list(ids)
+        if options['dry_run']:
+            self.stdout.write(f"Would archive {len(ids)} projects: {ids}")
+            return
+
+        archived = raw = packed = 0
+        for project_id in ids:
+            # One transaction per project - a long run never holds many locks
+            result = archive.archive_project(project_id)
+            if result is not None:
+                archived += 1
+                raw += result.raw_size
+                packed += len(result.data)
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {archived} projects: {raw:,} bytes of text stored as {packed:,} bytes'
+        ))
@@ -0,0 +1,38 @@
+'''
+python manage.py benchmark <suite> [--iterations N]
+
+Runs one of the performance suites defined in projects/benchmarks.py
+and prints the timings as a table.
+'''
+
+from django.core.management.base import BaseCommand, CommandError
+
+from projects.benchmarks import SUITES
+
+
+class Command(BaseCommand):
+    help = 'Run a performance benchmark suite (see --list).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('suite', nargs='?', help='Name of the suite to run')
+        parser.add_argument('--iterations', type=int, default=200, help='Timed calls per case')
+        parser.add_argument('--list', action='store_true', help='List the available suites')
+
+    def handle(self, *args, **options):
+        if options['list'] or not options['suite']:
+            for name, func in sorted(SUITES.items()):
+                summary = (func.__doc__ or '').strip().splitlines()
+                self.stdout.write(f"{name:<14} {summary[0] if summary else ''}")
+            return
+
+        if options['suite'] not in SUITES:
+            raise CommandError(f"Unknown suite '{options['suite']}'. Use --list to see them all.")
+
+        rows = SUITES[options['suite']](options['iterations'])
+        if not rows:
+            return
+        columns = list(rows[0].keys())
+        widths = {col: max(len(col), *(len(str(row.get(col, ''))) for row in rows)) for col in columns}
+        self.stdout.write('  '.join(col.ljust(widths[col]) for col in columns))
+        for row in rows:
+            self.stdout.write('  '.join(str(row.get(col, '')).ljust(widths[col]) for col in columns))
@@ -0,0 +1,26 @@
+'''
+python manage.py build_rollups [--refresh-days 2] [--rebuild]
+
+Counts new pledges and projects into the DailyStats table that /stats/
+reads (see projects/rollups.py). Only days with new rows since the last
+run are recounted, so it's quick to run often (e.g. Heroku Scheduler,
+every 10 minutes). --rebuild recounts everything from the first day.
+'''
+
+from django.core.management.base import BaseCommand
+
+from projects import rollups
+
+
+class Command(BaseCommand):
+    help = 'Update the daily analytics rollups used by /stats/.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--refresh-days', type=int, default=None, help='Also recount the last N days (default: STATS_REFRESH_DAYS)')
+        parser.add_argument('--rebuild', action='store_true', help='Forget the watermarks and recount every day')
+
+    def handle(self, *args, **options):
+        result = rollups.build(refresh_days=options['refresh_days'], rebuild=options['rebuild'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Recounted {result['days']} days ({result['rows']} rollup rows)"
+        ))
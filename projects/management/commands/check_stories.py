@@ -0,0 +1,56 @@
+'''
+python manage.py check_stories [--project 3 7] [--rebuild]
+
+Compares each live story's current_content with the text its pledges
+assemble to (projects/assembly.py - one query per chunk of projects,
+no pledge is loaded) and lists the ones that differ. Usually that's an
+owner's hand edits; sometimes it's text that drifted out of step with
+its pledges.
+
+--rebuild replaces those stories' text with the assembled one and moves
+the pledges' offsets to match. Hand edits are lost from the live text,
+but the old text stays in the revision history.
+'''
+
+from django.core.management.base import BaseCommand, CommandError
+
+from projects import assembly
+from projects.models import Project
+
+
+class Command(BaseCommand):
+    help = "Find (and optionally rebuild) stories whose text differs from their pledges."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--project', type=int, nargs='+', help='Only these project ids')
+        parser.add_argument('--rebuild', action='store_true', help='Rewrite the stories that differ from their pledges')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Projects per query')
+
+    def handle(self, *args, **options):
+        if not assembly.available():
+            raise CommandError('This database has no string_agg / group_concat - check_stories needs PostgreSQL or SQLite.')
+        projects = Project.objects.filter(archived_at__isnull=True).order_by('id')
+        if options['project']:
+            projects = projects.filter(pk__in=options['project'])
+        ids = list(projects.values_list('id', flat=True))
+
+        checked, different, rebuilt = 0, [], 0
+        size = options['chunk_size']
+        for start in range(0, len(ids), size):
+            chunk = ids[start:start + size]
+            stored = dict(Project.objects.filter(pk__in=chunk).values_list('id', 'current_content'))
+            for project_id, text in assembly.assembled_stories(chunk).items():
+                checked += 1
+                if text != (stored[project_id] or '') and assembly.story_pledges(project_id).exists():
+                    different.append(project_id)
+
+        for project_id in different:
+            if options['rebuild'] and assembly.rebuild_story(project_id):
+                rebuilt += 1
+                self.stdout.write(f'project {project_id}: rebuilt from its pledges')
+            else:
+                self.stdout.write(f'project {project_id}: text differs from its pledges')
+        summary = f'Checked {checked} stories, {len(different)} differ from their pledges'
+        if options['rebuild']:
+            summary += f', {rebuilt} rebuilt'
+        self.stdout.write(self.style.SUCCESS(summary))
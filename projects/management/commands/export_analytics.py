@@ -0,0 +1,41 @@
+'''
+python manage.py export_analytics exports/ [--tables pledges users] [--format csv] [--full]
+
+Writes projects, pledges and users (public columns only) as monthly
+partitioned CSV and - when pyarrow is installed - Parquet files for
+offline analysis (see projects/analytics.py). Each run only adds the
+rows created since the last one, so it's cheap to run nightly.
+'''
+
+from django.core.management.base import BaseCommand, CommandError
+
+from projects import analytics
+
+
+class Command(BaseCommand):
+    help = 'Export projects, pledges and users as partitioned CSV / Parquet files.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Folder to write into, e.g. exports/')
+        parser.add_argument('--tables', nargs='+', choices=list(analytics.COLUMNS), default=list(analytics.COLUMNS))
+        parser.add_argument('--format', choices=['csv', 'parquet', 'both'], default='both',
+                            help='File formats (default: both, or just csv without pyarrow)')
+        parser.add_argument('--full', action='store_true', help='Ignore the watermarks and rewrite each table from scratch')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Rows fetched from the database per round trip')
+
+    def handle(self, *args, **options):
+        formats = analytics.FORMATS if options['format'] == 'both' else (options['format'],)
+        if 'parquet' in formats and not analytics.parquet_available():
+            if options['format'] == 'parquet':
+                raise CommandError('Parquet needs pyarrow: pip install pyarrow')
+            self.stderr.write('pyarrow is not installed - writing CSV only.')
+            formats = ('csv',)
+
+        for table in options['tables']:
+            result = analytics.export_table(
+                table, options['output'], formats=formats,
+                full=options['full'], chunk_size=options['chunk_size'],
+            )
+            self.stdout.write(self.style.SUCCESS(
+                f"{table}: {result['rows']} rows in {len(result['files'])} files"
+            ))
@@ -0,0 +1,37 @@
+'''
+python manage.py export_stories stories.tar.gz
+
+Writes every finished (closed) story to an archive on disk.
+The archive type is taken from the file name (.zip or .tar.gz).
+'''
+
+from django.core.management.base import BaseCommand, CommandError
+
+from projects.exports import closed_projects, iter_story_archive
+
+
+class Command(BaseCommand):
+    help = 'Export closed projects as a .tar.gz or .zip of stories plus a contributors manifest.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Where to write the archive, e.g. stories.tar.gz or stories.zip')
+        parser.add_argument('--ids', nargs='+', type=int, help='Only export these project IDs')
+        parser.add_argument('--text', choices=['md', 'txt'], default='md', help='Story file format')
+
+    def handle(self, *args, **options):
+        output = options['output']
+        if output.endswith('.zip'):
+            archive_format = 'zip'
+        elif output.endswith(('.tar.gz', '.tgz')):
+            archive_format = 'tar.gz'
+        else:
+            raise CommandError('Output must end in .zip, .tar.gz or .tgz')
+
+        written = 0
+        with open(output, 'wb') as archive:
+            # Chunks are written as they are produced - nothing is buffered here
+            for chunk in iter_story_archive(closed_projects(options['ids']), archive_format, options['text']):
+                archive.write(chunk)
+                written += len(chunk)
+
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} bytes to {output}'))
@@ -0,0 +1,22 @@
+'''
+python manage.py prune_idempotency_keys
+
+Deletes stored Idempotency-Key responses older than
+IDEMPOTENCY_KEY_TTL_HOURS so the table stays small. Run it on a
+schedule (e.g. Heroku Scheduler, hourly).
+'''
+
+from django.core.management.base import BaseCommand
+
+from projects import idempotency
+
+
+class Command(BaseCommand):
+    help = 'Delete expired Idempotency-Key records.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows deleted per query')
+
+    def handle(self, *args, **options):
+        removed = idempotency.prune(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Removed {removed} expired idempotency keys'))
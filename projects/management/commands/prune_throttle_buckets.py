@@ -0,0 +1,23 @@
+'''
+python manage.py prune_throttle_buckets
+
+Deletes write-throttle buckets that have filled up again (a missing
+bucket counts as a full one), so the table only holds the users, IPs
+and projects that wrote recently. Run it on a schedule (e.g. Heroku
+Scheduler, hourly).
+'''
+
+from django.core.management.base import BaseCommand
+
+from projects import throttling
+
+
+class Command(BaseCommand):
+    help = 'Delete write-throttle buckets that are full again.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows deleted per query')
+
+    def handle(self, *args, **options):
+        removed = throttling.prune(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Removed {removed} full throttle buckets'))
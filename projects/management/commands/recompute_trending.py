@@ -0,0 +1,23 @@
+'''
+python manage.py recompute_trending
+
+Rebuilds every project's trending score from its pledges.
+Scores are kept up to date on every pledge anyway; run this after
+migrating, after changing the TRENDING_* settings, or on a schedule
+(e.g. Heroku Scheduler, nightly) to wash out any drift.
+'''
+
+from django.core.management.base import BaseCommand
+
+from projects import trending
+
+
+class Command(BaseCommand):
+    help = 'Recompute the trending score of every project from its pledges.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Projects per batch')
+
+    def handle(self, *args, **options):
+        updated = trending.recompute(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Recomputed trending scores for {updated} projects'))
@@ -0,0 +1,112 @@
+'''
+python manage.py seed_demo --projects 300 --pledges 20
+
+Fills the database with fake users, projects and pledges so the
+benchmarks (python manage.py benchmark ...) have realistic data to chew on.
+
+Uses bulk_create, so it is fast - and it deliberately skips the pledge
+signal: the finished story text is written straight into the story fields,
+and the counters are recomputed once at the end.
+'''
+
+import random
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from projects import facets
+from projects.models import Project, Pledge, normalize_genre, story_text, text_counts
+
+GENRES = ['Horror', 'horror', 'Romance', 'Sci-Fi', 'Fantasy', 'Mystery', 'Comedy', 'Poetry']
+WORDS = (
+    'the lighthouse door creaked open and a cold wind carried whispers of '
+    'sailors long lost dragon ember moonlight café naïve — “quoted” lantern'
+).split() + ['line\u2028break']  # U+2028 exercises the JSON escaping
+
+
+class Command(BaseCommand):
+    help = 'Create fake users, projects and pledges for local benchmarking.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--projects', type=int, default=300)
+        parser.add_argument('--pledges', type=int, default=20, help='Pledges per project')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed (same seed = same data)')
+
+    def paragraph(self, rng, words):
+        return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        User = get_user_model()
+
+        prefix = f"seed{options['seed']}_"
+        existing = User.objects.filter(username__startswith=prefix).count()
+        new_users = []
+        for number in range(existing, options['users']):
+            user = User(username=f'{prefix}{number}', email=f'{prefix}{number}@example.com')
+            user.set_unusable_password()
+            new_users.append(user)
+        User.objects.bulk_create(new_users)
+        users = list(User.objects.filter(username__startswith=prefix))
+
+        projects = []
+        for number in range(options['projects']):
+            opening = self.paragraph(rng, 60)
+            genre = rng.choice(GENRES)
+            is_open = rng.random() > 0.3
+            projects.append(Project(
+                title=f'Seeded story #{number}',
+                description=self.paragraph(rng, 20),
+                goal=rng.randint(5, 40),
+                genre=genre,
+                genre_key=normalize_genre(genre),
+                content_type=rng.choice(['story', 'poem']),
+                owner=rng.choice(users),
+                starting_content=opening,
+                current_content=opening,
+                is_open=is_open,
+                # closed some time in the last year, so archive_projects has something to do
+                date_closed=None if is_open else timezone.now() - timedelta(days=rng.randint(0, 365)),
+            ))
+        Project.objects.bulk_create(projects)
+
+        pledges = []
+        for project in projects:
+            for _ in range(rng.randint(0, options['pledges'] * 2)):
+                content = self.paragraph(rng, rng.randint(10, 120))
+                # Same layout content.append_pledge() produces
+                starting_offset = len(project.starting_content) + 1
+                current_offset = len(project.current_content) + 2
+                project.starting_content += '\n' + content
+                project.current_content += '\n\n' + content
+                project.pledge_count += 1
+                pledges.append(Pledge(
+                    project=project,
+                    supporter=rng.choice(users),
+                    amount=rng.randint(1, 20),
+                    comment=self.paragraph(rng, 8),
+                    add_content=content,
+                    anonymous=rng.random() < 0.2,
+                    position=project.pledge_count,
+                    segment_length=len(content),
+                    word_count=len(content.split()),
+                    char_count=len(content),
+                    starting_offset=starting_offset,
+                    current_offset=current_offset,
+                ))
+        Pledge.objects.bulk_create(pledges, batch_size=1000)
+        for project in projects:
+            project.word_count, project.char_count = text_counts(story_text(project))
+        Project.objects.bulk_update(projects, ['starting_content', 'current_content', 'word_count', 'char_count'], batch_size=500)
+        # bulk_create skips save() and signals, so recount the facets and pledges
+        facets.rebuild()
+        Project.objects.bulk_update(projects, ['pledge_count'], batch_size=500)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {len(new_users)} users, {len(projects)} projects, {len(pledges)} pledges'
+        ))
@@ -0,0 +1,103 @@
+'''
+python manage.py startup_profile [--target wsgi] [--top 20] [--runs 3] [--by module]
+
+Starts a fresh Python process the way a dyno would and reports where its
+start-up time goes, using Python's own import timer (python -X importtime).
+
+Targets:
+    setup    django.setup() - settings and every installed app
+    wsgi     what `gunicorn plottwist.wsgi` loads before its first request
+    warm     wsgi + the warm-up gunicorn.conf.py runs (plottwist/warmup.py)
+    release  what the release step (`manage.py migrate`) loads
+
+--by package (default) adds up each top-level package's own import
+time (django, rest_framework, cloudinary...); --by module lists the
+slowest single modules, including everything they import.
+'''
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+TARGETS = {
+    'setup': 'import django; django.setup()',
+    'wsgi': 'from django.core.wsgi import get_wsgi_application; get_wsgi_application()',
+    'warm': (
+        'from django.core.wsgi import get_wsgi_application; get_wsgi_application(); '
+        'from plottwist import warmup; warmup.warm_up()'
+    ),
+    'release': (
+        'import django; django.setup(); '
+        "from django.core.management import load_command_class; load_command_class('django.core', 'migrate')"
+    ),
+}
+
+
+def parse_importtime(stderr):
+    """-X importtime lines → [(module, self µs, cumulative µs)]."""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        imports.append((name.strip(), int(self_us), int(cumulative_us)))
+    return imports
+
+
+class Command(BaseCommand):
+    help = 'Measure how long a fresh process takes to start, and which imports cost the most.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', choices=list(TARGETS), default='wsgi')
+        parser.add_argument('--top', type=int, default=20, help='How many rows to show')
+        parser.add_argument('--runs', type=int, default=3, help='Start this many processes and report the median')
+        parser.add_argument('--by', choices=['package', 'module'], default='package')
+
+    def run_once(self, code):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'plottwist.settings'))
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', code],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        elapsed = (time.perf_counter() - start) * 1000
+        if result.returncode != 0:
+            raise CommandError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'start-up failed')
+        return elapsed, parse_importtime(result.stderr)
+
+    def handle(self, *args, **options):
+        code = TARGETS[options['target']]
+        baseline = statistics.median(self.run_once('pass')[0] for _ in range(options['runs']))
+        runs = [self.run_once(code) for _ in range(max(options['runs'], 1))]
+        wall = statistics.median(elapsed for elapsed, _ in runs)
+        # The run with the median wall time is the one we break down
+        _, imports = sorted(runs, key=lambda run: run[0])[len(runs) // 2]
+
+        total_import_ms = sum(self_us for _, self_us, _ in imports) / 1000
+        self.stdout.write(
+            f"{options['target']}: {wall:.0f} ms to start "
+            f"({wall - baseline:.0f} ms more than a bare interpreter), "
+            f"{total_import_ms:.0f} ms importing {len(imports)} modules"
+        )
+
+        if options['by'] == 'package':
+            totals, counts = defaultdict(int), defaultdict(int)
+            for name, self_us, _ in imports:
+                package = name.split('.')[0]
+                totals[package] += self_us
+                counts[package] += 1
+            rows = sorted(((us, package, counts[package]) for package, us in totals.items()), reverse=True)
+            self.stdout.write(f"\n{'package':40} {'ms':>8} {'modules':>8}")
+            for us, package, count in rows[:options['top']]:
+                self.stdout.write(f'{package:40} {us / 1000:8.1f} {count:8}')
+        else:
+            rows = sorted(imports, key=lambda row: row[2], reverse=True)
+            self.stdout.write(f"\n{'module (incl. what it imports)':60} {'ms':>8} {'self ms':>8}")
+            for name, self_us, cumulative_us in rows[:options['top']]:
+                self.stdout.write(f'{name:60} {cumulative_us / 1000:8.1f} {self_us / 1000:8.1f}')
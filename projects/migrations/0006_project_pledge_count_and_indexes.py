@@ -0,0 +1,53 @@
+# Generated by Django 5.2.7 on 2026-10-19 17:56
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_existing_pledges(apps, schema_editor):
+    Project = apps.get_model('projects', 'Project')
+    Pledge = apps.get_model('projects', 'Pledge')
+    counts = (
+        Pledge.objects.filter(project=OuterRef('pk'))
+        .order_by().values('project').annotate(total=Count('id')).values('total')
+    )
+    Project.objects.update(pledge_count=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0005_pledge_anonymous'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='pledge_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_existing_pledges, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['is_open', '-date_created'], name='project_open_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['genre'], name='project_genre_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['content_type'], name='project_content_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['date_created'], name='project_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['pledge_count'], name='project_pledge_count_idx'),
+        ),
+    ]
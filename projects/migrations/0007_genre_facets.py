@@ -0,0 +1,81 @@
+# Generated by Django 5.2.7 on 2026-10-19 17:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_existing_projects(apps, schema_editor):
+    """Fill genre_key, the Genre table and the facet counters for existing projects."""
+    Project = apps.get_model('projects', 'Project')
+    Genre = apps.get_model('projects', 'Genre')
+    GenreFacet = apps.get_model('projects', 'GenreFacet')
+
+    genres = {}
+    for project in Project.objects.only('id', 'genre').iterator():
+        key = ' '.join((project.genre or '').split()).casefold()
+        if key not in genres:
+            genres[key] = Genre.objects.create(key=key, name=' '.join(project.genre.split()))
+        Project.objects.filter(pk=project.pk).update(genre_key=key)
+
+    rows = (
+        Project.objects.order_by()
+        .values_list('genre_key', 'content_type', 'is_open')
+        .annotate(total=Count('id'))
+    )
+    GenreFacet.objects.bulk_create([
+        GenreFacet(genre=genres[key], content_type=content_type, is_open=is_open, count=total)
+        for key, content_type, is_open, total in rows
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0006_project_pledge_count_and_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Genre',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=100, unique=True)),
+                ('name', models.CharField(max_length=100)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='GenreFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_type', models.CharField(choices=[('story', 'Story'), ('poem', 'Poem')], max_length=20)),
+                ('is_open', models.BooleanField()),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='project',
+            name='project_genre_idx',
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='genre_key',
+            field=models.CharField(default='', editable=False, max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['genre_key'], name='project_genre_key_idx'),
+        ),
+        migrations.AddField(
+            model_name='genrefacet',
+            name='genre',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facets', to='projects.genre'),
+        ),
+        migrations.AddConstraint(
+            model_name='genrefacet',
+            constraint=models.UniqueConstraint(fields=('genre', 'content_type', 'is_open'), name='unique_genre_facet'),
+        ),
+        migrations.RunPython(count_existing_projects, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.7 on 2026-10-19 18:10
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def date_existing_pledges(apps, schema_editor):
+    """
+    Old pledges have no date. Use their project's creation date rather than
+    "now", so they don't all look brand new to the trending ranking.
+    Run `python manage.py recompute_trending` after migrating.
+    """
+    Project = apps.get_model('projects', 'Project')
+    Pledge = apps.get_model('projects', 'Pledge')
+    Pledge.objects.update(
+        date_created=Subquery(Project.objects.filter(pk=OuterRef('project_id')).values('date_created')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0007_genre_facets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pledge',
+            name='date_created',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(date_existing_pledges, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='project',
+            name='trending_score',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='trending_velocity',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['is_open', '-trending_score'], name='project_trending_idx'),
+        ),
+    ]
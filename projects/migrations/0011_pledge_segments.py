@@ -0,0 +1,65 @@
+# Generated by Django 5.2.7 on 2026-10-19 18:06
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def locate_existing_segments(apps, schema_editor):
+    """
+    Number each project's pledges in the order they were made, and find
+    where each one's text sits in the two story fields. Searching moves
+    forward through the text, so a repeated sentence is matched to the
+    right pledge. Text that can't be found (edited by hand) stays empty.
+    """
+    Project = apps.get_model('projects', 'Project')
+    Pledge = apps.get_model('projects', 'Pledge')
+    projects = Project.objects.filter(pledges__isnull=False).distinct().only('starting_content', 'current_content')
+    for project in projects.iterator(chunk_size=200):
+        cursors = {'starting_content': 0, 'current_content': 0}
+        pledges = list(Pledge.objects.filter(project_id=project.pk).order_by('id').only('add_content'))
+        for position, pledge in enumerate(pledges, start=1):
+            segment = (pledge.add_content or '').strip()
+            pledge.position = position
+            pledge.segment_length = len(segment)
+            for field, offset_field in (('starting_content', 'starting_offset'), ('current_content', 'current_offset')):
+                found = getattr(project, field).find(segment, cursors[field]) if segment else -1
+                setattr(pledge, offset_field, found if found >= 0 else None)
+                if found >= 0:
+                    cursors[field] = found + len(segment)
+        Pledge.objects.bulk_update(pledges, ['position', 'segment_length', 'starting_offset', 'current_offset'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0010_idempotency_records'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pledge',
+            name='current_offset',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='pledge',
+            name='position',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='pledge',
+            name='segment_length',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='pledge',
+            name='starting_offset',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='pledge',
+            index=models.Index(fields=['project', 'position'], name='pledge_project_position_idx'),
+        ),
+        migrations.RunPython(locate_existing_segments, migrations.RunPython.noop),
+    ]
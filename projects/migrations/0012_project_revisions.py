@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-19 18:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0011_pledge_segments'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectRevision',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField()),
+                ('is_snapshot', models.BooleanField(default=False)),
+                ('data', models.BinaryField()),
+                ('checksum', models.CharField(max_length=32)),
+                ('reason', models.CharField(choices=[('created', 'Project created'), ('original', 'Text before history began'), ('edit', 'Edited by owner'), ('pledge_added', 'Pledge added'), ('pledge_edited', 'Pledge edited'), ('pledge_removed', 'Pledge removed'), ('restore', 'Restored an older revision')], default='edit', max_length=20)),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revisions', to='projects.project')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('project', 'number'), name='unique_project_revision')],
+            },
+        ),
+    ]
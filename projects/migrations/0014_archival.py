@@ -0,0 +1,44 @@
+# Generated by Django 5.2.7 on 2026-10-19 18:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models.functions import Now
+
+
+def start_closed_clock(apps, schema_editor):
+    """
+    We don't know when already-closed projects were closed. Count from
+    today, so nothing is archived the moment this migration runs.
+    """
+    Project = apps.get_model('projects', 'Project')
+    Project.objects.filter(is_open=False).update(date_closed=Now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0013_versions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectArchive',
+            fields=[
+                ('project', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='archive', serialize=False, to='projects.project')),
+                ('data', models.BinaryField()),
+                ('raw_size', models.PositiveIntegerField()),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='archived_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='date_closed',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(start_closed_clock, migrations.RunPython.noop),
+    ]
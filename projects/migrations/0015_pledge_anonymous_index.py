@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-19 18:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0014_archival'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pledge',
+            index=models.Index(fields=['anonymous', '-id'], name='pledge_anonymous_idx'),
+        ),
+    ]
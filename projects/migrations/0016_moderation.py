@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-19 18:14
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0015_pledge_anonymous_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pledge',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Waiting for review'), ('approved', 'Part of the story'), ('rejected', 'Rejected')], default='approved', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='moderation',
+            field=models.CharField(choices=[('open', 'Publish pledges immediately'), ('new_contributors', "Hold pledges from people who haven't contributed here before"), ('all', 'Hold every pledge for review')], default='open', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='pledge',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['project', 'id'], name='pledge_pending_idx'),
+        ),
+    ]
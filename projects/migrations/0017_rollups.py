@@ -0,0 +1,44 @@
+# Generated by Django 5.2.7 on 2026-10-19 18:19
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0016_moderation'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('genre_key', models.CharField(blank=True, default='', max_length=100)),
+                ('content_type', models.CharField(blank=True, default='', max_length=20)),
+                ('pledges', models.PositiveIntegerField(default=0)),
+                ('verses', models.PositiveIntegerField(default=0)),
+                ('contributors', models.PositiveIntegerField(default=0)),
+                ('new_projects', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Watermark',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('value', models.BigIntegerField(default=0)),
+                ('date_updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='pledge',
+            index=models.Index(fields=['date_created'], name='pledge_created_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailystats',
+            constraint=models.UniqueConstraint(fields=('genre_key', 'content_type', 'day'), name='unique_daily_stats'),
+        ),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 5.2.7 on 2026-10-19 18:23
+
+import json
+import zlib
+
+from django.db import migrations, models
+
+
+def count_existing_text(apps, schema_editor):
+    """
+    Count the words and characters of every pledge and story once.
+    Archived projects have empty text columns, so their text is read from
+    the archive instead. (Same rules as models.text_counts / story_text.)
+    """
+    Project = apps.get_model('projects', 'Project')
+    Pledge = apps.get_model('projects', 'Pledge')
+    ProjectArchive = apps.get_model('projects', 'ProjectArchive')
+
+    def counts(text):
+        text = text or ''
+        return len(text.split()), len(text)
+
+    def story(texts):
+        current = texts['current_content'] or ''
+        return current if current and not current.isspace() else texts['starting_content']
+
+    pledges = []
+    for pledge in Pledge.objects.filter(project__archived_at__isnull=True).only('add_content').iterator(chunk_size=2000):
+        pledge.word_count, pledge.char_count = counts((pledge.add_content or '').strip())
+        pledges.append(pledge)
+        if len(pledges) == 2000:
+            Pledge.objects.bulk_update(pledges, ['word_count', 'char_count'])
+            pledges = []
+    Pledge.objects.bulk_update(pledges, ['word_count', 'char_count'])
+
+    projects = []
+    for project in Project.objects.filter(archived_at__isnull=True).only('starting_content', 'current_content').iterator(chunk_size=200):
+        project.word_count, project.char_count = counts(story({
+            'starting_content': project.starting_content, 'current_content': project.current_content,
+        }))
+        projects.append(project)
+    Project.objects.bulk_update(projects, ['word_count', 'char_count'], batch_size=500)
+
+    # One archive at a time, so memory holds one story
+    for project_id, data in ProjectArchive.objects.values_list('project_id', 'data').iterator(chunk_size=20):
+        payload = json.loads(zlib.decompress(bytes(data)))
+        words, chars = counts(story(payload))
+        Project.objects.filter(pk=project_id).update(word_count=words, char_count=chars)
+        pledges = list(Pledge.objects.filter(project_id=project_id).only('id'))
+        for pledge in pledges:
+            text = payload['pledges'].get(str(pledge.pk), {}).get('add_content', '')
+            pledge.word_count, pledge.char_count = counts((text or '').strip())
+        Pledge.objects.bulk_update(pledges, ['word_count', 'char_count'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0017_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pledge',
+            name='char_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='pledge',
+            name='word_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='char_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='word_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_existing_text, migrations.RunPython.noop),
+    ]
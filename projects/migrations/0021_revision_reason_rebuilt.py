@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 18:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0020_throttle_buckets'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='projectrevision',
+            name='reason',
+            field=models.CharField(choices=[('created', 'Project created'), ('original', 'Text before history began'), ('edit', 'Edited by owner'), ('pledge_added', 'Pledge added'), ('pledge_edited', 'Pledge edited'), ('pledge_removed', 'Pledge removed'), ('restore', 'Restored an older revision'), ('rebuilt', 'Rebuilt from its pledges')], default='edit', max_length=20),
+        ),
+    ]
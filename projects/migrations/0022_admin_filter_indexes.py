@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-19 19:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0021_revision_reason_rebuilt'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pledge',
+            index=models.Index(fields=['status', '-id'], name='pledge_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['moderation', '-id'], name='project_moderation_idx'),
+        ),
+    ]
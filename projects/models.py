@@ -2,9 +2,11 @@
 Database modelblueprint for projects.
 '''
 
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
 
 # ============================================================
 # CHOICES - Predefined options for dropdown fields
@@ -15,6 +17,44 @@ CONTENT_TYPE_CHOICES = [
     ('poem', 'Poem'),
 ]
 
+MODERATION_CHOICES = [
+    ('open', 'Publish pledges immediately'),
+    ('new_contributors', "Hold pledges from people who haven't contributed here before"),
+    ('all', 'Hold every pledge for review'),
+]
+
+PENDING, APPROVED, REJECTED = 'pending', 'approved', 'rejected'
+PLEDGE_STATUS_CHOICES = [
+    (PENDING, 'Waiting for review'),
+    (APPROVED, 'Part of the story'),
+    (REJECTED, 'Rejected'),
+]
+
+
+def normalize_genre(name):
+    """
+    "  Sci-Fi " → "sci-fi", "HORROR" → "horror"
+
+    casefold() is lower() that also handles letters like the German ß.
+    Runs of spaces are squashed to one.
+    """
+    return ' '.join((name or '').split()).casefold()
+
+
+def text_counts(text):
+    """
+    (words, characters) of a piece of text.
+    A word is anything between whitespace - "it's" and "sci-fi" are one word each.
+    """
+    text = text or ''
+    return len(text.split()), len(text)
+
+
+def story_text(project):
+    """The text a reader sees: the story, or just the opening until someone has added to it."""
+    current = project.current_content or ''
+    return current if current and not current.isspace() else (project.starting_content or '')
+
 # ============================================================
 # PROJECT MODEL - A collaborative writing project
 # ============================================================
@@ -54,6 +94,9 @@ class Project(models.Model):
         # The database only stores the URL, and images are served directly from Cloudinary's global CDN for fast loading. 🎉
     genre = models.CharField(max_length=100)
     # The category: "Horror", "Romance", "Sci-Fi", etc.
+    genre_key = models.CharField(max_length=100, editable=False, default='')
+    # The genre NORMALIZED: "  Horror ", "horror" and "HORROR" all become "horror"
+    # Set automatically in save() - used for filtering and facet counts
     content_type = models.CharField(max_length=20, choices=CONTENT_TYPE_CHOICES, default='story') 
     # choices=CONTENT_TYPE_CHOICES = dropdown limited to 'story' or 'poem'
     # default='story' = if not specified, defaults to 'story'
@@ -92,10 +135,95 @@ class Project(models.Model):
     # BooleanField = True or False
     # True = project is accepting new contributions
     # False = project is closed/completed
+    moderation = models.CharField(max_length=20, choices=MODERATION_CHOICES, default='open')
+    # Which new pledges wait for the owner's approval before joining the story (see moderation.py)
     date_created = models.DateTimeField(auto_now_add=True)
     # DateTimeField = stores date AND time
     # auto_now_add=True = automatically set to NOW when created
     # This NEVER changes after creation
+    date_closed = models.DateTimeField(null=True, blank=True, editable=False)
+    # When is_open last became False (empty while open) - set in save()
+    archived_at = models.DateTimeField(null=True, blank=True, editable=False)
+    # Set once the story text has been moved to a ProjectArchive (see archive.py)
+    # ---- COUNTERS ----
+    pledge_count = models.PositiveIntegerField(default=0, editable=False)
+    # How many pledges this project has - kept up to date by signals.py
+    # Stored (instead of counted each time) so the project list can
+    # filter and sort by it without joining every pledge.
+    # editable=False = read-only in the API and admin
+    # ---- TRENDING (see trending.py) ----
+    trending_velocity = models.FloatField(default=0, editable=False)
+    # Time-decayed pledge activity, stored as a logarithm so it never overflows
+    trending_score = models.FloatField(default=0, editable=False)
+    # velocity + a boost for progress toward the goal - what /projects/trending/ sorts by
+    follower_count = models.PositiveIntegerField(default=0, editable=False)
+    # How many users follow this project (see Follow below) - kept up to date by signals.py
+    word_count = models.PositiveIntegerField(default=0, editable=False)
+    char_count = models.PositiveIntegerField(default=0, editable=False)
+    # Size of the story as read (see story_text) - content.py adds each pledge's own
+    # counts as it appends it, so the story is never re-counted word by word
+    version = models.PositiveIntegerField(default=1, editable=False)
+    # Goes up by one on every edit of the project or its story - sent as the ETag,
+    # so two editors can't overwrite each other (see concurrency.py)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_open', '-trending_score', '-id'], name='project_trending_idx'),
+            # One index per supported list filter (see filters.py)
+            models.Index(fields=['is_open', '-date_created'], name='project_open_created_idx'),
+            models.Index(fields=['genre_key'], name='project_genre_key_idx'),
+            models.Index(fields=['content_type'], name='project_content_type_idx'),
+            models.Index(fields=['date_created'], name='project_created_idx'),
+            models.Index(fields=['pledge_count'], name='project_pledge_count_idx'),
+            # the admin's "moderation" filter, newest first
+            models.Index(fields=['moderation', '-id'], name='project_moderation_idx'),
+        ]
+
+    # The fields the genre facet counters (GenreFacet) are grouped by
+    FACET_FIELDS = ('genre', 'content_type', 'is_open')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Runs whenever Django loads a project from the database.
+        We remember its facet values so signals.py can tell what changed on save...
+        """
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_facet = instance.facet_key() if set(cls.FACET_FIELDS) <= set(field_names) else None
+        # ...and its text, so the revision history can store just what changed
+        instance._loaded_content = (
+            {'starting_content': instance.starting_content or '', 'current_content': instance.current_content or ''}
+            if {'starting_content', 'current_content'} <= set(field_names) else None
+        )
+        return instance
+
+    def facet_key(self):
+        return (normalize_genre(self.genre), self.content_type, self.is_open)
+
+    def save(self, *args, **kwargs):
+        self.genre_key = normalize_genre(self.genre)
+        # Closing starts the archive countdown (archive.py); reopening stops it
+        if self.is_open:
+            self.date_closed = None
+        elif self.date_closed is None:
+            self.date_closed = timezone.now()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'genre' in update_fields:
+            kwargs['update_fields'] = update_fields = {*update_fields, 'genre_key'}
+        if update_fields is not None and 'is_open' in update_fields:
+            kwargs['update_fields'] = update_fields = {*update_fields, 'date_closed'}
+        # Text changed by something other than content.py (an owner edit, a restore, a new
+        # project)? Count it once here. content.py keeps the counts itself and saves them.
+        text_saved = update_fields is None or {'starting_content', 'current_content'} & set(update_fields)
+        if text_saved and not (update_fields and 'word_count' in update_fields):
+            loaded = getattr(self, '_loaded_content', None)
+            if loaded is None or loaded != {'starting_content': self.starting_content or '', 'current_content': self.current_content or ''}:
+                self.word_count, self.char_count = text_counts(story_text(self))
+                if update_fields is not None:
+                    kwargs['update_fields'] = {*update_fields, 'word_count', 'char_count'}
+        # atomic = the project row AND its facet counter (signals.py) are saved together, or not at all
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
 
     def __str__(self):
         # What shows in Django Admin and when you print a project
@@ -169,6 +297,335 @@ class Pledge(models.Model):
     # Example: "The dragon roared and flames lit up the night sky..."
     anonymous = models.BooleanField(default=False)
     # If True, the supporter's name is hidden from public view
+    status = models.CharField(max_length=10, choices=PLEDGE_STATUS_CHOICES, default=APPROVED)
+    # Only APPROVED pledges are in the story text, the counters and feeds.
+    # PENDING ones wait in the owner's moderation queue (see moderation.py)
+    date_created = models.DateTimeField(auto_now_add=True)
+    # When the contribution was made - recent pledges count more for trending
+    # ---- WHERE THIS PLEDGE SITS IN THE STORY (see content.py) ----
+    position = models.PositiveIntegerField(default=0, editable=False)
+    # 1 for the project's first pledge, 2 for the second, ...
+    segment_length = models.PositiveIntegerField(default=0, editable=False)
+    # Length of the text this pledge added to the story
+    starting_offset = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    current_offset = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    # Where that text starts inside project.starting_content / current_content
+    # (empty = not in the story, e.g. the owner rewrote that part)
+    version = models.PositiveIntegerField(default=1, editable=False)
+    # Goes up by one on every edit - see concurrency.py
+    word_count = models.PositiveIntegerField(default=0, editable=False)
+    char_count = models.PositiveIntegerField(default=0, editable=False)
+    # Size of add_content as it appears in the story - counted once, when it's saved
+
+    class Meta:
+        indexes = [
+            # "newest pledges of these projects" - used by the activity feed
+            models.Index(fields=['project', '-id'], name='pledge_project_newest_idx'),
+            # the story's pledges in reading order
+            models.Index(fields=['project', 'position'], name='pledge_project_position_idx'),
+            # the admin's "anonymous" filter, newest first
+            models.Index(fields=['anonymous', '-id'], name='pledge_anonymous_idx'),
+            # the admin's "status" filter, newest first (approved / rejected too, not just pending)
+            models.Index(fields=['status', '-id'], name='pledge_status_idx'),
+            # the moderation queue - only pending pledges are in this index, so it stays tiny
+            models.Index(fields=['project', 'id'], name='pledge_pending_idx', condition=models.Q(status=PENDING)),
+            # one day's pledges, for the analytics rollups (rollups.py)
+            models.Index(fields=['date_created'], name='pledge_created_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Remember the text and project the pledge was loaded with, so
+        signals.py can patch the story when either changes on save.
+        """
+        instance = super().from_db(db, field_names, values)
+        loaded = {name: value for name, value in zip(field_names, values) if value is not models.DEFERRED}
+        instance._loaded_content = loaded.get('add_content')
+        instance._loaded_project_id = loaded.get('project_id')
+        return instance
+
+    def save(self, *args, **kwargs):
+        self.word_count, self.char_count = text_counts((self.add_content or '').strip())
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'add_content' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'word_count', 'char_count'}
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.supporter} contributed {self.amount} to {self.project}"
+
+
+# ============================================================
+# GENRE - the normalized genre "dimension"
+# ============================================================
+class Genre(models.Model):
+    """
+    One row per DISTINCT genre, however people typed it.
+
+    Project.genre is free text, so "Horror", "horror " and "HORROR" are
+    all the same genre with key "horror". `name` keeps the first spelling
+    we saw, for display.
+    """
+    key = models.CharField(max_length=100, unique=True)
+    name = models.CharField(max_length=100)
+
+    def __str__(self):
+        return self.name
+
+
+# ============================================================
+# GENRE FACET - maintained counts for browse pages
+# ============================================================
+class GenreFacet(models.Model):
+    """
+    How many projects exist for each (genre, content_type, is_open).
+
+    EXAMPLE ROWS:
+        horror  story  open    → 18
+        horror  poem   closed  → 3
+
+    Kept up to date by signals.py whenever a project is created, edited
+    or deleted, so "open horror poems: 12" never needs a GROUP BY over
+    the whole project table. facets.py serves these from memory.
+    """
+    genre = models.ForeignKey(Genre, on_delete=models.CASCADE, related_name='facets')
+    content_type = models.CharField(max_length=20, choices=CONTENT_TYPE_CHOICES)
+    is_open = models.BooleanField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['genre', 'content_type', 'is_open'], name='unique_genre_facet'),
+        ]
+
+    def __str__(self):
+        state = 'open' if self.is_open else 'closed'
+        return f"{self.genre} {self.content_type} ({state}): {self.count}"
+
+
+# ============================================================
+# FOLLOW - a user keeping an eye on a project
+# ============================================================
+class Follow(models.Model):
+    """
+    "Tell me when someone adds to this story."
+
+    Following a project puts its new pledges into the user's activity
+    feed at /users/me/feed/ (see feed.py).
+    """
+    user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE, related_name='follows')
+    project = models.ForeignKey('Project', on_delete=models.CASCADE, related_name='follows')
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'project'], name='unique_follow'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} follows {self.project}"
+
+
+# ============================================================
+# FEED ITEM - one pledge delivered into one user's feed
+# ============================================================
+class FeedItem(models.Model):
+    """
+    A copy of "pledge X happened" in the feed of each follower.
+
+    Written ONCE when the pledge is made ("fan-out on write"), so reading
+    a feed is a single index scan of the user's own rows - no matter how
+    many projects they follow or how many pledges those projects have.
+    Very popular projects are the exception: see feed.py.
+    """
+    user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE, related_name='feed_items')
+    pledge = models.ForeignKey('Pledge', on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        constraints = [
+            # Also the index feed reads use: WHERE user = ? AND pledge < cursor ORDER BY pledge DESC
+            models.UniqueConstraint(fields=['user', 'pledge'], name='unique_feed_item'),
+        ]
+
+    def __str__(self):
+        return f"Pledge {self.pledge_id} in {self.user}'s feed"
+
+
+# ============================================================
+# IDEMPOTENCY RECORD - remembers the answer to a retried POST
+# ============================================================
+class IdempotencyRecord(models.Model):
+    """
+    One row per Idempotency-Key a user has sent with a POST (see idempotency.py).
+
+    - fingerprint: hash of method + path + body, so the same key can't be
+      reused for a DIFFERENT request
+    - status_code / response_body: the response we sent the first time,
+      replayed to any retry. status_code is empty while the first request
+      is still running.
+
+    Rows older than IDEMPOTENCY_KEY_TTL_HOURS are deleted by
+    `python manage.py prune_idempotency_keys`.
+    """
+    user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE, related_name='+')
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    date_created = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}:{self.key} → {self.status_code or 'in progress'}"
+
+
+# ============================================================
+# PROJECT REVISION - one version of a project's story text
+# ============================================================
+REVISION_REASON_CHOICES = [
+    ('created', 'Project created'),
+    ('original', 'Text before history began'),
+    ('edit', 'Edited by owner'),
+    ('pledge_added', 'Pledge added'),
+    ('pledge_edited', 'Pledge edited'),
+    ('pledge_removed', 'Pledge removed'),
+    ('restore', 'Restored an older revision'),
+    ('rebuilt', 'Rebuilt from its pledges'),
+]
+
+
+class ProjectRevision(models.Model):
+    """
+    A saved version of starting_content + current_content (see revisions.py).
+
+    number counts up from 1 per project. `data` is zlib-compressed JSON:
+    the full text for a snapshot, only the changed lines for a delta.
+    """
+    project = models.ForeignKey('Project', on_delete=models.CASCADE, related_name='revisions')
+    number = models.PositiveIntegerField()
+    is_snapshot = models.BooleanField(default=False)
+    data = models.BinaryField()
+    checksum = models.CharField(max_length=32)
+    # Of the full text this revision describes - lets us notice text changed behind our back
+    reason = models.CharField(max_length=20, choices=REVISION_REASON_CHOICES, default='edit')
+    user = models.ForeignKey(get_user_model(), on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    # Who made the change (the owner, a supporter) - empty if unknown
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            # Also the index every revision lookup uses: WHERE project = ? AND number ...
+            models.UniqueConstraint(fields=['project', 'number'], name='unique_project_revision'),
+        ]
+
+    def __str__(self):
+        return f"{self.project_id} r{self.number} ({self.reason})"
+
+
+# ============================================================
+# PROJECT ARCHIVE - the packed-away text of a finished story
+# ============================================================
+class ProjectArchive(models.Model):
+    """
+    The story text and pledge texts of an archived project, as one
+    zlib-compressed JSON blob (see archive.py). While this row exists the
+    project's own text columns are empty.
+    """
+    project = models.OneToOneField('Project', on_delete=models.CASCADE, primary_key=True, related_name='archive')
+    data = models.BinaryField()
+    raw_size = models.PositiveIntegerField()
+    # Bytes before compression - compare with len(data) to see what archiving saved
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Archive of project {self.project_id}"
+
+
+# ============================================================
+# WATERMARK - how far a background job has got
+# ============================================================
+class Watermark(models.Model):
+    """
+    The last row id a batch job has processed, so its next run only reads
+    what's new (WHERE id > value) instead of the whole table.
+
+    EXAMPLE ROWS:
+        rollups.pledges   → 48211
+        rollups.projects  → 1930
+    """
+    name = models.CharField(max_length=100, primary_key=True)
+    value = models.BigIntegerField(default=0)
+    date_updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} = {self.value}"
+
+
+# ============================================================
+# DAILY STATS - pre-counted numbers for the /stats/ endpoint
+# ============================================================
+class DailyStats(models.Model):
+    """
+    One day's activity, counted once by `python manage.py build_rollups`
+    (see rollups.py) so /stats/ never has to scan the pledge table.
+
+    Each day has a row for every (genre, content_type) plus the totals,
+    where an empty genre / content_type means "all of them":
+
+        2025-03-01  horror  poem   → 12 pledges, 30 verses, 5 contributors, 1 new project
+        2025-03-01  horror  ''     → every horror project that day
+        2025-03-01  ''      ''     → the whole site that day
+
+    Contributors are counted DISTINCT per row, which is why the totals are
+    rows of their own rather than sums (one person pledging to a horror
+    story and a poem is still one contributor).
+    """
+    day = models.DateField()
+    genre_key = models.CharField(max_length=100, blank=True, default='')
+    content_type = models.CharField(max_length=20, blank=True, default='')
+    pledges = models.PositiveIntegerField(default=0)
+    verses = models.PositiveIntegerField(default=0)
+    # Sum of Pledge.amount
+    contributors = models.PositiveIntegerField(default=0)
+    new_projects = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['genre_key', 'content_type', 'day'], name='unique_daily_stats'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.genre_key or '*'}/{self.content_type or '*'}: {self.pledges} pledges"
+
+
+# ============================================================
+# THROTTLE BUCKET - one write-rate token bucket (see throttling.py)
+# ============================================================
+class ThrottleBucket(models.Model):
+    """
+    How many write tokens one user / IP address / project has left.
+
+    Kept in the database (not the cache) so every worker shares the same
+    buckets and a token is taken with one conditional UPDATE - two
+    workers can never both spend the last one.
+
+    EXAMPLE ROW:
+        throttle:pledge:user:5  tokens=3.5  updated=1740925000.2  full_at=1740925049.7
+
+    A bucket that is full again is the same as no bucket at all, so rows
+    past full_at are deleted by `python manage.py prune_throttle_buckets`.
+    """
+    key = models.CharField(max_length=200, primary_key=True)
+    tokens = models.FloatField()
+    updated = models.FloatField()
+    # Unix time of the last token taken
+    full_at = models.FloatField(db_index=True)
+    # Unix time the bucket will have refilled completely
 
     def __str__(self):
-        return f"{self.supporter} contributed {self.amount} to {self.project}"
\ No newline at end of file
+        return f"{self.key}: {self.tokens:.1f} tokens"
@@ -0,0 +1,106 @@
+'''
+moderation.py - lets project owners review pledges before they join the story.
+
+Each project picks a policy (Project.moderation):
+- 'open'              every pledge goes straight into the story (the default)
+- 'new_contributors'  a supporter's FIRST pledge on the project waits for
+                      review; once one is approved, later ones go straight in
+- 'all'               every pledge waits for review
+
+A waiting pledge has status PENDING: it is saved, but it is not in the
+story text, the pledge count, trending or anyone's feed. Public pledge
+lists don't show it.
+
+APPROVING sends the pledge down the same "pledge accepted" path a
+normally published pledge takes (signals.pledge_accepted): story text,
+counters, trending, feeds. A batch is handled ONE PROJECT AT A TIME, in
+one transaction each, with one write of the story per project - not one
+per pledge.
+
+REJECTING a pending pledge just marks it. Rejecting an already-approved
+pledge (spam found later) also cuts it back out of the story, counters,
+trending score and feeds - again one story write per project.
+'''
+
+from itertools import groupby
+
+from django.db import transaction
+from django.db.models import F
+
+from .models import APPROVED, PENDING, REJECTED, FeedItem, Pledge, Project
+from .signals import pledge_accepted
+from . import content, trending
+
+
+def initial_status(project, supporter):
+    """PENDING or APPROVED for a new pledge, following the project's policy."""
+    if project.moderation == 'all':
+        return PENDING
+    if project.moderation == 'new_contributors':
+        trusted = project.owner_id == supporter.pk or Pledge.objects.filter(
+            project=project, supporter=supporter, status=APPROVED,
+        ).exists()
+        return APPROVED if trusted else PENDING
+    return APPROVED
+
+
+def moderated_by(user):
+    """The pledges this user may approve or reject: on projects they own (staff: all)."""
+    pledges = Pledge.objects.all()
+    return pledges if user.is_staff else pledges.filter(project__owner=user)
+
+
+def pending_queue(user, project_id=None):
+    """Pending pledges waiting for this user, oldest first (uses the small pledge_pending_idx)."""
+    pending = moderated_by(user).filter(status=PENDING)
+    if project_id is not None:
+        pending = pending.filter(project_id=project_id)
+    return pending.order_by('id')
+
+
+def _by_project(pledges):
+    pledges = sorted(pledges, key=lambda pledge: (pledge.project_id, pledge.pk))
+    return groupby(pledges, key=lambda pledge: pledge.project_id)
+
+
+def approve(pledges, moderator=None):
+    """Publish pending pledges. Returns the ids approved (ones no longer pending are left alone)."""
+    approved = []
+    for project_id, group in _by_project(pledges):
+        ids = [pledge.pk for pledge in group]
+        with transaction.atomic():
+            # Re-read under lock: only pledges still pending are approved (no double-appends)
+            batch = list(Pledge.objects.select_for_update().filter(pk__in=ids, status=PENDING).order_by('id'))
+            if not batch:
+                continue
+            Pledge.objects.filter(pk__in=[pledge.pk for pledge in batch]).update(status=APPROVED)
+            for pledge in batch:
+                pledge.status = APPROVED
+            pledge_accepted.send(
+                sender=Pledge, project_id=project_id, pledges=batch,
+                user_id=moderator.pk if moderator else None,
+            )
+            approved += [pledge.pk for pledge in batch]
+    return approved
+
+
+def reject(pledges, moderator=None):
+    """Reject pledges; approved ones are taken back out of the story. Returns the ids rejected."""
+    rejected = []
+    for project_id, group in _by_project(pledges):
+        ids = [pledge.pk for pledge in group]
+        with transaction.atomic():
+            batch = list(Pledge.objects.select_for_update().filter(pk__in=ids).exclude(status=REJECTED))
+            if not batch:
+                continue
+            published = [pledge for pledge in batch if pledge.status == APPROVED]
+            Pledge.objects.filter(pk__in=[pledge.pk for pledge in batch]).update(status=REJECTED)
+            if published:
+                content.remove_pledges(project_id, published, user_id=moderator.pk if moderator else None)
+                Project.objects.filter(pk=project_id, pledge_count__gte=len(published)).update(
+                    pledge_count=F('pledge_count') - len(published)
+                )
+                FeedItem.objects.filter(pledge__in=published).delete()
+                trending.recompute(project_ids=[project_id])  # a score can't be "un-added", so rebuild this one
+            rejected += [pledge.pk for pledge in batch]
+    return rejected
@@ -0,0 +1,40 @@
+'''
+renderers.py - how response data is turned into JSON bytes.
+
+FastJSONRenderer produces exactly the same bytes as DRF's JSONRenderer,
+but uses orjson (a JSON library written in Rust) when it is installed.
+orjson is OPTIONAL: pip install orjson. Without it, nothing changes.
+'''
+
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # optional speed-up
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    Drop-in replacement for JSONRenderer.
+
+    orjson is only used for the plain compact output the API returns by
+    default. Pretty-printed output (the browsable API, `; indent=4`) and
+    anything orjson can't encode go through the normal DRF renderer.
+    """
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or data is None
+            or self.ensure_ascii
+            or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data)
+        except TypeError:
+            # e.g. Decimal, lazy translation strings - DRF's encoder knows those
+            return super().render(data, accepted_media_type, renderer_context)
+        # Same JavaScript-safety escaping as JSONRenderer (U+2028 / U+2029)
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
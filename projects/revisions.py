@@ -0,0 +1,235 @@
+'''
+revisions.py - the version history of a project's story text.
+
+Every time starting_content or current_content changes (an owner edit,
+a pledge added / edited / deleted, a restore) a ProjectRevision is saved.
+
+STORING CHANGES, NOT COPIES:
+Most revisions are DELTAS - only the lines that changed since the
+previous revision:
+
+    [[12, 12, "\n\nA dragon appeared!"]]   ← "at line 12, insert this"
+
+compressed with zlib. A story of 5,000 lines that gets one new pledge
+costs a few hundred bytes, not another 5,000 lines.
+
+APPENDS:
+A new pledge only adds text at the end, and content.py knows exactly
+where. It hands that over (note_change(..., appended=...)), and the
+delta is just
+
+    [1843, "\n\nA dragon appeared!"]   ← "keep the first 1843 characters, add this"
+
+- no line diff of the whole story at all.
+
+Every REVISION_SNAPSHOT_EVERY revisions we store a full SNAPSHOT
+instead. Rebuilding any revision = start at the snapshot at or before it
+and apply at most REVISION_SNAPSHOT_EVERY - 1 deltas, so fetching an old
+revision takes the same (short) time however long the history is.
+
+Each revision also keeps a checksum of the text it describes. If the
+story was changed without going through save() (a bulk update, seed
+data), the checksum won't match and we write a snapshot instead of a
+delta that would be applied to the wrong text. For an append, the
+checksums of the text before and after are worked out in ONE pass.
+'''
+
+import difflib
+import hashlib
+import json
+import zlib
+
+from django.conf import settings
+
+from .models import ProjectRevision
+
+CONTENT_FIELDS = ('starting_content', 'current_content')
+
+
+def _hasher(data=b''):
+    return hashlib.blake2b(data, digest_size=16)
+
+
+def checksum(state):
+    """A hash of each field's text, hashed together."""
+    digest = _hasher()
+    for field in CONTENT_FIELDS:
+        digest.update(_hasher(state[field].encode()).digest())
+    return digest.hexdigest()
+
+
+def _append_checksums(previous, appended):
+    """
+    (checksum of `previous`, checksum after `appended`) - reading the
+    text they share only once: the hash of the kept part is copied and
+    finished both ways.
+    """
+    before, after = _hasher(), _hasher()
+    for field in CONTENT_FIELDS:
+        keep, added = appended[field]
+        text = previous[field]
+        kept = _hasher(text[:keep].encode())
+        old = kept.copy()
+        old.update(text[keep:].encode())
+        kept.update(added.encode())
+        before.update(old.digest())
+        after.update(kept.digest())
+    return before.hexdigest(), after.hexdigest()
+
+
+def _state(project):
+    return {field: getattr(project, field) or '' for field in CONTENT_FIELDS}
+
+
+# ============================================================
+# DELTAS - line-based diff / patch
+# ============================================================
+def diff(old, new):
+    """
+    The edits that turn text `old` into `new`, as [[from_line, to_line, replacement], ...].
+
+    The unchanged start and end are skipped before diffing, so the common
+    case - text added at the end - costs one pass over the lines.
+    """
+    old_lines, new_lines = old.splitlines(keepends=True), new.splitlines(keepends=True)
+    start = 0
+    limit = min(len(old_lines), len(new_lines))
+    while start < limit and old_lines[start] == new_lines[start]:
+        start += 1
+    end = 0
+    while end < limit - start and old_lines[-1 - end] == new_lines[-1 - end]:
+        end += 1
+    old_middle = old_lines[start:len(old_lines) - end]
+    new_middle = new_lines[start:len(new_lines) - end]
+
+    matcher = difflib.SequenceMatcher(None, old_middle, new_middle, autojunk=False)
+    return [
+        [start + i1, start + i2, ''.join(new_middle[j1:j2])]
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+        if tag != 'equal'
+    ]
+
+
+def patch(text, edits):
+    """Apply diff() output - or an append, [keep, added] - to `text`."""
+    if edits and not isinstance(edits[0], list):
+        keep, added = edits
+        return text[:keep] + added
+    lines = text.splitlines(keepends=True)
+    pieces, position = [], 0
+    for from_line, to_line, replacement in edits:
+        pieces.extend(lines[position:from_line])
+        pieces.append(replacement)
+        position = to_line
+    pieces.extend(lines[position:])
+    return ''.join(pieces)
+
+
+def _pack(payload):
+    return zlib.compress(json.dumps(payload, separators=(',', ':')).encode(), 6)
+
+
+def _unpack(data):
+    return json.loads(zlib.decompress(bytes(data)))
+
+
+# ============================================================
+# WRITING
+# ============================================================
+def note_change(project, reason, user_id=None, appended=None):
+    """
+    Say why (and by whom) the next save() of this project changes its text.
+    appended = {field: (characters kept, text added after them)} when the
+    change only adds to the end (see content.append_pledges).
+    """
+    project._revision_reason = reason
+    project._revision_user_id = user_id
+    project._revision_appended = appended
+
+
+def record(project, previous):
+    """
+    Save a revision for the project's current text. `previous` is the
+    text it had before ({'starting_content': ..., 'current_content': ...})
+    or None if unknown. Returns the new revision, or None if nothing changed.
+    """
+    state = _state(project)
+    if previous is not None and previous == state:
+        return None
+    reason = getattr(project, '_revision_reason', None) or 'edit'
+    user_id = getattr(project, '_revision_user_id', None)
+    appended = getattr(project, '_revision_appended', None)
+    project._revision_reason = project._revision_user_id = project._revision_appended = None
+
+    latest = ProjectRevision.objects.filter(project=project).order_by('-number').first()
+    if latest is None and previous is not None:
+        # History starts now: keep the text from BEFORE this change too
+        latest = _save(project, 1, state=previous, reason='original', user_id=None)
+
+    number = latest.number + 1 if latest else 1
+    last_snapshot = (
+        ProjectRevision.objects.filter(project=project, is_snapshot=True, number__lte=latest.number)
+        .order_by('-number').values_list('number', flat=True).first()
+        if latest else None
+    )
+    if not (
+        latest is not None
+        and previous is not None
+        and last_snapshot is not None
+        and number - last_snapshot < settings.REVISION_SNAPSHOT_EVERY
+    ):
+        return _save(project, number, state=state, reason=reason, user_id=user_id)
+
+    if appended is not None and not all(
+        keep <= len(previous[field]) and keep + len(added) == len(state[field])
+        for field, (keep, added) in appended.items()
+    ):
+        appended = None  # doesn't describe this change - diff it the ordinary way
+    if appended is not None:
+        previous_checksum, new_checksum = _append_checksums(previous, appended)
+        if latest.checksum == previous_checksum:
+            delta = {field: list(appended[field]) for field in CONTENT_FIELDS}
+            return _save(project, number, delta=delta, text_checksum=new_checksum, reason=reason, user_id=user_id)
+    elif latest.checksum == checksum(previous):
+        delta = {field: diff(previous[field], state[field]) for field in CONTENT_FIELDS}
+        return _save(project, number, delta=delta, text_checksum=checksum(state), reason=reason, user_id=user_id)
+    # The text changed behind our back since the latest revision: start again from a snapshot
+    return _save(project, number, state=state, reason=reason, user_id=user_id)
+
+
+def _save(project, number, reason, user_id, state=None, delta=None, text_checksum=None):
+    """A snapshot of `state`, or a `delta` leading to text whose checksum is `text_checksum`."""
+    return ProjectRevision.objects.create(
+        project=project,
+        number=number,
+        is_snapshot=delta is None,
+        data=_pack(state if delta is None else delta),
+        checksum=checksum(state) if delta is None else text_checksum,
+        reason=reason,
+        user_id=user_id,
+    )
+
+
+# ============================================================
+# READING
+# ============================================================
+def content_at(project_id, number):
+    """
+    The story text as of revision `number`: {'starting_content': ..., 'current_content': ...}.
+    Raises ProjectRevision.DoesNotExist for an unknown number.
+    """
+    snapshot = (
+        ProjectRevision.objects.filter(project_id=project_id, number__lte=number, is_snapshot=True)
+        .order_by('-number').only('number', 'data').first()
+    )
+    if snapshot is None or not ProjectRevision.objects.filter(project_id=project_id, number=number).exists():
+        raise ProjectRevision.DoesNotExist(f'Project {project_id} has no revision {number}.')
+    state = _unpack(snapshot.data)
+    deltas = (
+        ProjectRevision.objects.filter(project_id=project_id, number__gt=snapshot.number, number__lte=number)
+        .order_by('number').values_list('data', flat=True)
+    )
+    for data in deltas:
+        edits = _unpack(data)
+        state = {field: patch(state[field], edits[field]) for field in CONTENT_FIELDS}
+    return state
@@ -0,0 +1,162 @@
+'''
+rollups.py - daily analytics, counted ahead of time.
+
+Questions like "how many pledges did horror stories get each day last
+month?" used to mean downloading every pledge and counting. Now
+`python manage.py build_rollups` counts each day once into DailyStats,
+and /stats/ just reads those few rows back.
+
+INCREMENTAL:
+Watermarks (models.Watermark) remember the highest pledge and project id
+already counted. Each run only looks at rows above them to find which
+days have new activity, and recounts just those days - plus the last
+STATS_REFRESH_DAYS days, so recent changes that don't create a row are
+picked up too (a pledge approved from the moderation queue, deleted,
+or committed a moment after the previous run read the highest id).
+
+A day is always recounted from scratch, never added to, so running the
+command twice (or after a crash half-way) can't count anything twice.
+
+Only approved pledges are counted - pending and rejected ones aren't
+part of any story.
+'''
+
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Max, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import APPROVED, DailyStats, Pledge, Project, Watermark
+
+PLEDGE_WATERMARK = 'rollups.pledges'
+PROJECT_WATERMARK = 'rollups.projects'
+
+# Days are recounted in runs of at most this many, one transaction each
+MAX_SPAN_DAYS = 31
+
+# Every day gets one row per combination of these ('' = all)
+GROUPINGS = (
+    ('genre_key', 'content_type'),
+    ('genre_key',),
+    ('content_type',),
+    (),
+)
+
+COUNTERS = ('pledges', 'verses', 'contributors', 'new_projects')
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _new_days(queryset, after, upto):
+    """The days that rows with after < id <= upto were created on."""
+    return set(
+        queryset.filter(pk__gt=after, pk__lte=upto)
+        .annotate(day=TruncDate('date_created'))
+        .values_list('day', flat=True)
+        .distinct()
+    )
+
+
+def _spans(days):
+    """Sorted days → (first, last) runs of consecutive days, at most MAX_SPAN_DAYS long."""
+    spans = []
+    for day in sorted(days):
+        if spans and day - spans[-1][1] == timedelta(days=1) and (day - spans[-1][0]).days < MAX_SPAN_DAYS:
+            spans[-1][1] = day
+        else:
+            spans.append([day, day])
+    return spans
+
+
+def count_days(first, last):
+    """Recount DailyStats for every day from first to last (inclusive). Returns the rows written."""
+    start, end = _day_start(first), _day_start(last + timedelta(days=1))
+    pledges = (
+        Pledge.objects.filter(status=APPROVED, date_created__gte=start, date_created__lt=end)
+        .annotate(day=TruncDate('date_created'), genre_key=F('project__genre_key'), content_type=F('project__content_type'))
+    )
+    projects = (
+        Project.objects.filter(date_created__gte=start, date_created__lt=end)
+        .annotate(day=TruncDate('date_created'))
+    )
+    rows = {}
+
+    def row(values, group):
+        key = (values['day'], *(values[field] if field in group else '' for field in ('genre_key', 'content_type')))
+        if key not in rows:
+            rows[key] = DailyStats(day=key[0], genre_key=key[1], content_type=key[2])
+        return rows[key]
+
+    for group in GROUPINGS:
+        for values in pledges.values('day', *group).annotate(
+            n=Count('id'), verses_sum=Sum('amount'), people=Count('supporter', distinct=True),
+        ):
+            stats = row(values, group)
+            stats.pledges, stats.verses, stats.contributors = values['n'], values['verses_sum'] or 0, values['people']
+        for values in projects.values('day', *group).annotate(n=Count('id')):
+            row(values, group).new_projects = values['n']
+
+    with transaction.atomic():
+        DailyStats.objects.filter(day__gte=first, day__lte=last).delete()
+        DailyStats.objects.bulk_create(rows.values(), batch_size=500)
+    return len(rows)
+
+
+def build(refresh_days=None, rebuild=False):
+    """
+    Bring DailyStats up to date. rebuild=True recounts every day from the
+    beginning (e.g. after changing what is counted).
+    Returns {'days': days recounted, 'rows': DailyStats rows written}.
+    """
+    refresh_days = settings.STATS_REFRESH_DAYS if refresh_days is None else refresh_days
+    marks = {}
+    for name in (PLEDGE_WATERMARK, PROJECT_WATERMARK):
+        mark, _ = Watermark.objects.get_or_create(name=name)
+        marks[name] = 0 if rebuild else mark.value
+    # Read the tops FIRST: rows added while we count are left for the next run
+    pledge_top = Pledge.objects.aggregate(top=Max('id'))['top'] or 0
+    project_top = Project.objects.aggregate(top=Max('id'))['top'] or 0
+
+    days = _new_days(Pledge.objects.all(), marks[PLEDGE_WATERMARK], pledge_top)
+    days |= _new_days(Project.objects.all(), marks[PROJECT_WATERMARK], project_top)
+    today = timezone.localdate()
+    days |= {today - timedelta(days=n) for n in range(refresh_days)}
+    if rebuild:
+        DailyStats.objects.all().delete()
+
+    written = 0
+    for first, last in _spans(days):
+        written += count_days(first, last)
+    Watermark.objects.filter(name=PLEDGE_WATERMARK).update(value=pledge_top, date_updated=timezone.now())
+    Watermark.objects.filter(name=PROJECT_WATERMARK).update(value=project_top, date_updated=timezone.now())
+    return {'days': len(days), 'rows': written}
+
+
+def daily(first, last, genre_key='', content_type=''):
+    """
+    The rollup rows for first..last (inclusive), one per day - days with
+    no activity come back as zeros - plus totals and when they were counted.
+    """
+    found = {
+        stats.day: stats
+        for stats in DailyStats.objects.filter(
+            genre_key=genre_key, content_type=content_type, day__gte=first, day__lte=last,
+        )
+    }
+    days, totals = [], dict.fromkeys(('pledges', 'verses', 'new_projects'), 0)
+    day = first
+    while day <= last:
+        stats = found.get(day)
+        entry = {'day': day.isoformat(), **{name: getattr(stats, name, 0) for name in COUNTERS}}
+        for name in totals:
+            totals[name] += entry[name]
+        days.append(entry)
+        day += timedelta(days=1)
+    counted = Watermark.objects.filter(name=PLEDGE_WATERMARK).values_list('date_updated', flat=True).first()
+    # Contributors aren't totalled: the same person on several days is still one person
+    return {'days': days, 'totals': totals, 'counted_at': counted}
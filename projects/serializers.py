@@ -8,6 +8,9 @@ after first validating the incoming data.
 
 from rest_framework import serializers
 from django.apps import apps
+from django.db.models.manager import BaseManager
+from .models import APPROVED
+from .moderation import initial_status
 
 # ============================================================
 # PLEDGE SERIALIZER - Basic pledge data
@@ -20,30 +23,38 @@ class PledgeSerializer(serializers.ModelSerializer):
     class Meta:
         model = apps.get_model('projects.Pledge')
         fields = '__all__'
+        read_only_fields = ['status'] # set by the project's moderation policy, changed by the owner's review
     
     def create(self, validated_data):
         """
-        When a pledge is created, append its content to the project's current_content
-        with proper paragraph spacing (\n\n)
+        New pledges start APPROVED or PENDING, depending on the project's
+        moderation policy (moderation.py).
+
+        Appending the pledge's text to the project's story happens in
+        signals.py (append_pledge_to_project → content.py), so pledges made
+        anywhere - API, admin, shell - all update the story the same way.
         """
-        # Create the pledge first
-        pledge = super().create(validated_data)
-        
-        # Get the project and append the new content with spacing
-        project = pledge.project
-        
-        if project.current_content and project.current_content.strip():
-            # Add double newline for paragraph spacing
-            project.current_content = project.current_content.strip() + "\n\n" + pledge.add_content.strip()
-        else:
-            # If no current content yet, start with starting_content + new content
-            if project.starting_content and project.starting_content.strip():
-                project.current_content = project.starting_content.strip() + "\n\n" + pledge.add_content.strip()
-            else:
-                project.current_content = pledge.add_content.strip()
-        
-        project.save()
-        return pledge
+        validated_data['status'] = initial_status(validated_data['project'], validated_data['supporter'])
+        return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        """
+        Saves ONLY the fields the client sent (+ the version and counts that
+        go with them). A plain save() would also write back the position and
+        offsets loaded with the pledge - undoing the shift another pledge's
+        edit made to them in the meantime (content.py).
+        """
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        instance.save(update_fields=[*validated_data, 'version', 'word_count', 'char_count'])
+        return instance
+
+
+class ApprovedPledgeListSerializer(serializers.ListSerializer):
+    """A list of pledges without the ones still waiting for (or failed) moderation."""
+    def to_representation(self, data):
+        pledges = data.all() if isinstance(data, BaseManager) else data
+        return super().to_representation([pledge for pledge in pledges if pledge.status == APPROVED])
 
 
 # ============================================================
@@ -64,7 +75,8 @@ class ProjectSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = apps.get_model('projects.Project')
-        fields = '__all__'
+        exclude = ['trending_velocity', 'trending_score']
+        # Internal ranking numbers (trending.py) - /projects/trending/ is already sorted by them
 
 
 # ============================================================
@@ -79,7 +91,7 @@ class ProjectDetailSerializer(ProjectSerializer):
     
     USED FOR: Detail view (viewing one specific project)
     """
-    pledges = PledgeSerializer(many=True, read_only=True)
+    pledges = ApprovedPledgeListSerializer(child=PledgeSerializer(), read_only=True)
     owner_username = serializers.ReadOnlyField(source='owner.username')
     """
     NESTED SERIALIZER:
@@ -119,7 +131,11 @@ class ProjectDetailSerializer(ProjectSerializer):
         instance.starting_content = validated_data.get('starting_content', instance.starting_content)
         instance.current_content = validated_data.get('current_content', instance.current_content)
         instance.is_open = validated_data.get('is_open', instance.is_open)
-        instance.save()
+        instance.moderation = validated_data.get('moderation', instance.moderation)
+        instance.save(update_fields=[
+            'title', 'description', 'goal', 'image', 'genre',
+            'starting_content', 'current_content', 'is_open', 'moderation',
+        ]) # Counters like pledge_count are left to signals.py
         return instance
 
 
@@ -136,5 +152,20 @@ class PledgeDetailSerializer(PledgeSerializer):
         instance.add_content = validated_data.get('add_content', instance.add_content)
         instance.anonymous = validated_data.get('anonymous', instance.anonymous)
         instance.project = validated_data.get('project', instance.project)
-        instance.save()
-        return instance
\ No newline at end of file
+        # Never the position / offset columns - content.py moves those (see PledgeSerializer.update)
+        instance.save(update_fields=['amount', 'comment', 'add_content', 'anonymous', 'project', 'version'])
+        return instance
+
+# ============================================================
+# PROJECT REVISION SERIALIZER - one entry in a story's history
+# ============================================================
+class ProjectRevisionSerializer(serializers.ModelSerializer):
+    """
+    What changed, when and by whom - not the text itself (that's
+    GET /projects/1/revisions/<number>/, see revisions.py).
+    """
+    user_username = serializers.ReadOnlyField(source='user.username')
+
+    class Meta:
+        model = apps.get_model('projects.ProjectRevision')
+        fields = ['number', 'reason', 'user', 'user_username', 'is_snapshot', 'date_created']
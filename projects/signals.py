@@ -1,21 +1,33 @@
 '''
 signals.py is the automatic update mechanism for appending pledge 
-content to projects upon pledge creation.
+content to projects upon pledge creation (and patching it when a
+pledge is edited or deleted).
 
 Instead of manually updating the project in every view that creates a pledge, 
 the signal does it automatically. 
 
 '''
 
-from django.db.models.signals import post_save
-from django.dispatch import receiver
-from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.db.models import F, QuerySet
+from django.dispatch import Signal, receiver
 import logging
-import json
-from .models import Pledge
+from .models import APPROVED, Project, Pledge, Follow
+from . import content, facets, feed, revisions, trending
 
 logger = logging.getLogger(__name__)
 
+# ============================================================
+# PLEDGE ACCEPTED - one pipeline for every pledge that joins a story
+# ============================================================
+pledge_accepted = Signal()
+"""
+Sent with project_id=... and pledges=[...] (all of one project) when
+pledges become part of the story: straight away when created on an
+unmoderated project, or later in a batch by moderation.approve().
+Receivers below run in order: story text, pledge_count, trending, feeds.
+"""
+
 @receiver(post_save, sender=Pledge)
 def append_pledge_to_project(sender, instance, created, **kwargs):
 
@@ -35,14 +47,15 @@ def append_pledge_to_project(sender, instance, created, **kwargs):
     WHAT THIS DOES:
     ============================================================
     When someone creates a new pledge (contribution), this automatically
-    appends their content to the project's starting_content.
+    appends their content to the project's story - starting_content and
+    current_content - and records where it went (see content.py).
     
     FLOW:
     1. User submits pledge with add_content = "The dragon roared!"
     2. Pledge is saved to database
     3. This signal FIRES automatically
     4. It finds the project and appends the new content
-    5. Project.starting_content now includes the new contribution
+    5. Project.starting_content and current_content now include the new contribution
     
     ============================================================
     PARAMETERS EXPLAINED:
@@ -52,42 +65,143 @@ def append_pledge_to_project(sender, instance, created, **kwargs):
     created = True if this is a NEW pledge, False if it's an update
     **kwargs = Other stuff we don't need
     """
-    # Only run for NEW pledges (not updates)
-    if created and instance.project_id:
+    # Only run for NEW pledges (not updates) that are published straight away -
+    # pending ones wait for moderation.approve(), which sends the same signal
+    if created and instance.project_id and instance.status == APPROVED:
         try:
-            # transaction.atomic() = if anything fails, undo everything
-            # This prevents partial/broken updates
-            with transaction.atomic():
-                project = instance.project # Get the related project
-
-                if not project:
-                    logger.error("Project not found for pledge")
-                    return
-
-                # Log what we're doing (helpful for debugging)
-                logger.info(f"""
-                    Processing pledge:
-                    ID: {instance.id}
-                    Project ID: {project.id}
-                    Added Content: {instance.add_content}
-                """)
-
-                # Get the new content, strip whitespace
-                new_line = instance.add_content.strip() if instance.add_content else None
-
-                if new_line:
-                    # APPEND the new content to starting_content
-                    # (project.starting_content or '') handles if it's None
-                    project.starting_content = (project.starting_content or '').strip() + "\n" + new_line
-                    logger.info(f"Added new line to project {project.id}")
-
-                project.save() # Save the updated project
-                logger.info(f"Successfully updated project {project.id}")
-        except Exception as e:
-            logger.error(f"Error details: {str(e)}")
-            logger.error(f"Pledge data: {json.dumps({
-                'id': instance.id,
-                'project_id': instance.project_id,
-                'add_content': instance.add_content
-            }, indent=2)}")
+            pledge_accepted.send(sender=Pledge, project_id=instance.project_id, pledges=[instance])
+            logger.info(
+                'Added pledge %s to project %s', instance.id, instance.project_id,
+                extra={'pledge_id': instance.id, 'project_id': instance.project_id,
+                       'content_length': len(instance.add_content or '')},
+            )
+        except Exception:
+            # The length, not the text: a long contribution shouldn't flood the logs
+            logger.exception(
+                'Could not add pledge %s to project %s', instance.id, instance.project_id,
+                extra={'pledge_id': instance.id, 'project_id': instance.project_id,
+                       'content_length': len(instance.add_content or '')},
+            )
             raise # Re-raise the error so we know something failed
+
+
+@receiver(pledge_accepted)
+def add_to_story(sender, project_id, pledges, user_id=None, **kwargs):
+    """Appends to BOTH story fields and remembers where the text landed (content.py)."""
+    content.append_pledges(project_id, pledges, user_id=user_id)
+
+
+@receiver(post_save, sender=Pledge)
+def patch_story_on_edit(sender, instance, created, **kwargs):
+    """
+    An edited pledge: swap just its piece of the story (content.py).
+    Moved to another project: take it out of the old story, add it to the new one.
+    """
+    old_content = getattr(instance, '_loaded_content', None)
+    old_project_id = getattr(instance, '_loaded_project_id', None)
+    if not created and instance.status == APPROVED and old_content is not None and old_project_id is not None:
+        if old_project_id != instance.project_id:
+            content.remove_pledge(instance, content=old_content, project_id=old_project_id)
+            content.append_pledge(instance)
+        elif old_content != instance.add_content:
+            content.replace_pledge(instance, old_content)
+    instance._loaded_content = instance.add_content
+    instance._loaded_project_id = instance.project_id
+
+
+@receiver(pre_delete, sender=Pledge)
+def cut_from_story(sender, instance, origin=None, **kwargs):
+    """
+    A deleted pledge: cut its piece out of the story.
+
+    Skipped only when the pledge is going because its whole PROJECT is
+    being deleted - no point patching a story that's about to disappear.
+    Anything else (the pledge itself, its supporter's account) takes the
+    text out of the story.
+    """
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if instance.status == APPROVED and origin_model is not Project:
+        content.remove_pledge(instance)
+
+
+@receiver(pledge_accepted)
+def count_new_pledge(sender, project_id, pledges, **kwargs):
+    """
+    Keep Project.pledge_count up to date (approved pledges only).
+
+    F('pledge_count') + 1 makes the DATABASE do the adding, so two pledges
+    saved at the same moment can't both read "5" and both write "6".
+    """
+    Project.objects.filter(pk=project_id).update(pledge_count=F('pledge_count') + len(pledges))
+
+
+@receiver(post_delete, sender=Pledge)
+def uncount_deleted_pledge(sender, instance, **kwargs):
+    if instance.status == APPROVED:
+        Project.objects.filter(pk=instance.project_id, pledge_count__gt=0).update(pledge_count=F('pledge_count') - 1)
+
+
+@receiver(post_save, sender=Project)
+def update_genre_facets(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Keep the GenreFacet counters in step with the project table.
+
+    Project.save() wraps this in the same transaction as the project row.
+    Moving a project from (horror, story, open) to (horror, story, closed)
+    = -1 on the first counter, +1 on the second.
+    """
+    if update_fields is not None and not set(Project.FACET_FIELDS) & set(update_fields):
+        return  # e.g. only the story text changed
+    new = (instance.genre, instance.content_type, instance.is_open)
+    old = getattr(instance, '_loaded_facet', None)
+    if created:
+        facets.adjust(*new, 1)
+    elif old is not None and old != instance.facet_key():
+        facets.adjust(*old, -1)  # old[0] is already the normalized genre
+        facets.adjust(*new, 1)
+    instance._loaded_facet = instance.facet_key()
+
+
+@receiver(post_delete, sender=Project)
+def remove_from_genre_facets(sender, instance, **kwargs):
+    facets.adjust(instance.genre, instance.content_type, instance.is_open, -1)
+
+
+@receiver(post_save, sender=Project)
+def record_content_revision(sender, instance, created, update_fields=None, **kwargs):
+    """Save a revision whenever the story text changes (see revisions.py)."""
+    if update_fields is not None and not set(revisions.CONTENT_FIELDS) & set(update_fields):
+        return
+    if created:
+        revisions.note_change(instance, 'created', instance.owner_id)
+    revisions.record(instance, None if created else getattr(instance, '_loaded_content', None))
+    instance._loaded_content = {field: getattr(instance, field) or '' for field in revisions.CONTENT_FIELDS}
+
+
+@receiver(post_save, sender=Project)
+def start_trending(sender, instance, created, **kwargs):
+    if created:
+        trending.start_project(instance)
+
+
+@receiver(pledge_accepted)
+def update_trending(sender, project_id, pledges, **kwargs):
+    """Registered after count_new_pledge, so the project's pledge_count already includes these pledges."""
+    trending.record_pledges(project_id, pledges)
+
+
+@receiver(pledge_accepted)
+def deliver_to_feeds(sender, project_id, pledges, **kwargs):
+    """Put the new pledges into every follower's activity feed (see feed.py)."""
+    feed.fan_out_many(project_id, pledges)
+
+
+@receiver(post_save, sender=Follow)
+def count_new_follower(sender, instance, created, **kwargs):
+    if created:
+        Project.objects.filter(pk=instance.project_id).update(follower_count=F('follower_count') + 1)
+
+
+@receiver(post_delete, sender=Follow)
+def uncount_follower(sender, instance, **kwargs):
+    Project.objects.filter(pk=instance.project_id, follower_count__gt=0).update(follower_count=F('follower_count') - 1)
@@ -1,3 +1,757 @@
-from django.test import TestCase
+'''
+tests.py - checks for the projects app.
 
-# Create your tests here.
+Run them with:
+    python manage.py test projects
+
+The benchmark suites (benchmarks.py) time things; these tests check that
+they still BEHAVE: the fast list path gives the same JSON as the
+serializers, throttles really say no, and the story text stays in step
+with its pledges.
+'''
+
+import io
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone
+from unittest import mock
+
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+from rest_framework.views import APIView
+
+from plottwist import content_encoding
+
+from .compact import CompactReader
+from .models import PENDING, Follow, IdempotencyRecord, Pledge, Project, ProjectArchive, ProjectRevision, ThrottleBucket
+from .serializers import PledgeSerializer, ProjectSerializer
+from . import analytics, archive, assembly, content, feed, idempotency, moderation, revisions, throttling, views
+
+
+def make_user(username='writer'):
+    return get_user_model().objects.create_user(username=username, password='pass12345')
+
+
+def make_project(owner, **fields):
+    values = {
+        'title': 'Haunted Lighthouse', 'description': 'A story.', 'goal': 10,
+        'genre': 'Horror', 'content_type': 'story', 'starting_content': 'Once upon a time.',
+    }
+    values.update(fields)
+    return Project.objects.create(owner=owner, **values)
+
+
+def as_json(data):
+    """What the client receives - so dates, floats and None compare the way they're sent."""
+    return json.loads(JSONRenderer().render(data))
+
+
+# ============================================================
+# COMPACT LIST PATH (compact.py) - same JSON as the serializers
+# ============================================================
+class CompactParityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = make_user('owner')
+        cls.reader = make_user('reader')
+        for number in range(3):
+            project = make_project(cls.owner, title=f'Story {number}', is_open=number != 2)
+            Pledge.objects.create(project=project, supporter=cls.reader, amount=2, add_content=f'Pledge {number}.')
+            Pledge.objects.create(project=project, supporter=cls.owner, amount=1, add_content='The end.', anonymous=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_list_serializers_stay_on_the_fast_path(self):
+        # A field compact.py can't reproduce turns the plan off - every list endpoint gets slow
+        for serializer_class in (ProjectSerializer, PledgeSerializer):
+            self.assertTrue(CompactReader(serializer_class).plan, f'{serializer_class.__name__} lost the compact path')
+        self.assertTrue(views.compact_projects.plan)
+        self.assertTrue(views.compact_pledges.plan)
+
+    def test_compact_matches_serializer(self):
+        for reader, serializer_class, queryset in (
+            (views.compact_projects, ProjectSerializer, Project.objects.order_by('id')),
+            (views.compact_pledges, PledgeSerializer, Pledge.objects.order_by('id')),
+        ):
+            self.assertEqual(
+                as_json(reader.data(queryset)),
+                as_json(serializer_class(queryset, many=True).data),
+            )
+
+    def test_list_endpoints_match_serializer(self):
+        expected_projects = as_json(ProjectSerializer(Project.objects.order_by('-date_created', '-id'), many=True).data)
+        self.assertCountEqual(self.client.get('/projects/').json(), expected_projects)
+        self.assertCountEqual(
+            self.client.get('/projects/pledges/').json(),
+            as_json(PledgeSerializer(Pledge.objects.all(), many=True).data),
+        )
+        trending = self.client.get('/projects/trending/').json()
+        self.assertEqual({project['id'] for project in trending}, set(Project.objects.filter(is_open=True).values_list('id', flat=True)))
+        self.assertNotIn('trending_score', trending[0])
+
+
+# ============================================================
+# RESPONSE COMPRESSION (plottwist/content_encoding.py)
+# ============================================================
+class ChooseEncodingTests(TestCase):
+    codecs = {'br': None, 'zstd': None, 'gzip': None}  # our preference order
+
+    def test_client_weights_win(self):
+        with mock.patch.dict(content_encoding.CODECS, self.codecs, clear=True):
+            self.assertEqual(content_encoding.choose_encoding('gzip, deflate, br;q=0.9'), 'gzip')
+            self.assertEqual(content_encoding.choose_encoding('br;q=0.2, zstd;q=0.8'), 'zstd')
+
+    def test_ties_follow_server_preference(self):
+        with mock.patch.dict(content_encoding.CODECS, self.codecs, clear=True):
+            self.assertEqual(content_encoding.choose_encoding('gzip, zstd, br'), 'br')
+            self.assertEqual(content_encoding.choose_encoding('*;q=0.5'), 'br')
+
+    def test_q_zero_is_not_acceptable(self):
+        with mock.patch.dict(content_encoding.CODECS, self.codecs, clear=True):
+            self.assertEqual(content_encoding.choose_encoding('br;q=0, *'), 'zstd')
+            self.assertIsNone(content_encoding.choose_encoding('*;q=0'))
+            self.assertIsNone(content_encoding.choose_encoding('gzip;q=0, identity'))
+
+
+# ============================================================
+# WRITE THROTTLES (throttling.py)
+# ============================================================
+@override_settings(WRITE_THROTTLE_RATES={'pledge_user': '3/min', 'pledge_ip': '100/min', 'pledge_project': '100/min'})
+class ThrottleTests(TestCase):
+    def setUp(self):
+        # The clock stands still, so no token trickles back while a test runs
+        clock = mock.patch('projects.throttling.time')
+        clock.start().time.return_value = 1_000_000.0
+        self.addCleanup(clock.stop)
+        self.user = make_user()
+        self.project = make_project(self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def pledge(self, project=None):
+        return self.client.post('/projects/pledges/', {
+            'project': self.project.pk if project is None else project,
+            'amount': 1, 'add_content': 'A line.', 'anonymous': False, 'comment': 'Onward!',
+        }, format='json')
+
+    def test_burst_is_rejected_with_retry_after(self):
+        statuses = [self.pledge().status_code for _ in range(5)]
+        self.assertEqual(statuses, [201, 201, 201, 429, 429])
+        response = self.pledge()
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+        self.assertEqual(Pledge.objects.filter(project=self.project).count(), 3)
+
+    def test_rejected_request_spends_no_other_tokens(self):
+        for _ in range(5):
+            self.pledge()
+        project_bucket = ThrottleBucket.objects.get(key=f'throttle:pledge:project:{self.project.pk}')
+        # Only the three accepted pledges took a token from the project's bucket
+        self.assertEqual(project_bucket.tokens, 97)
+
+    def test_take_tokens_is_all_or_nothing(self):
+        buckets = [('a', 1, 0.001), ('b', 5, 0.001)]
+        self.assertEqual(throttling.take_tokens(buckets, now=1000.0), {})
+        waits = throttling.take_tokens(buckets, now=1000.0)
+        self.assertEqual(set(waits), {'a'})
+        self.assertAlmostEqual(waits['a'], 1000.0)
+        self.assertEqual(ThrottleBucket.objects.get(key='b').tokens, 4)
+        # Tokens trickle back: one a second at 1/s
+        self.assertEqual(throttling.take_tokens([('a', 1, 1.0)], now=1002.0), {})
+
+    def test_project_bucket_needs_a_real_project_id(self):
+        throttle = throttling.ProjectWriteThrottle()
+        view = mock.Mock(kwargs={})
+        for value in ('abc', '', None, -4, '1 OR 1'):
+            request = mock.Mock(data={'project': value})
+            self.assertIsNone(throttle.get_bucket_id(request, view), value)
+        self.assertEqual(throttle.get_bucket_id(mock.Mock(data={'project': '12'}), view), 12)
+
+    def test_spoofed_forwarded_for_keeps_the_same_ip_bucket(self):
+        # The router appends the real address; what comes before it is up to the client
+        for spoofed in ('1.1.1.1', '2.2.2.2, 3.3.3.3', 'made-up'):
+            request = mock.Mock(META={'HTTP_X_FORWARDED_FOR': f'{spoofed}, 203.0.113.9', 'REMOTE_ADDR': '10.0.0.1'})
+            self.assertEqual(throttling.IPWriteThrottle().get_bucket_id(request, None), '203.0.113.9')
+
+    @override_settings(WRITE_THROTTLE_RATES={'pledge_user': '100/min', 'pledge_ip': '2/min', 'pledge_project': '100/min'})
+    def test_changing_forwarded_for_does_not_reset_the_ip_limit(self):
+        statuses = [
+            self.client.post('/projects/pledges/', {
+                'project': self.project.pk, 'amount': 1, 'add_content': 'A line.', 'anonymous': False, 'comment': 'Onward!',
+            }, format='json', HTTP_X_FORWARDED_FOR=f'10.9.9.{number}, 203.0.113.9').status_code
+            for number in range(4)
+        ]
+        self.assertEqual(statuses, [201, 201, 429, 429])
+        self.assertEqual(ThrottleBucket.objects.filter(key__startswith='throttle:pledge:ip:').count(), 1)
+
+    def test_full_buckets_are_pruned(self):
+        throttling.take_tokens([('old', 5, 1.0)], now=1000.0)
+        throttling.take_tokens([('busy', 500, 0.001)], now=1000.0)
+        self.assertEqual(throttling.prune(now=1010.0), 1)
+        self.assertEqual(list(ThrottleBucket.objects.values_list('key', flat=True)), ['busy'])
+
+
+# ============================================================
+# STORY TEXT (content.py) - splicing pledges in and out
+# ============================================================
+class StoryContentTests(TestCase):
+    def setUp(self):
+        self.owner = make_user('owner')
+        self.supporter = make_user('supporter')
+        self.project = make_project(self.owner)
+
+    def add(self, text, supporter=None):
+        return Pledge.objects.create(project=self.project, supporter=supporter or self.supporter, amount=1, add_content=text)
+
+    def story(self):
+        self.project.refresh_from_db()
+        return self.project.current_content
+
+    def assert_offsets_match(self):
+        project = Project.objects.get(pk=self.project.pk)
+        for pledge in Pledge.objects.filter(project=project, current_offset__isnull=False):
+            segment = content.segment_text(pledge.add_content)
+            self.assertEqual(project.current_content[pledge.current_offset:][:pledge.segment_length], segment)
+            self.assertEqual(project.starting_content[pledge.starting_offset:][:pledge.segment_length], segment)
+
+    def test_append_records_offsets(self):
+        self.add('  A dragon appeared!  ')
+        self.add('The hero ran.')
+        self.assertEqual(self.story(), 'Once upon a time.\n\nA dragon appeared!\n\nThe hero ran.')
+        self.assertEqual(self.project.starting_content, 'Once upon a time.\nA dragon appeared!\nThe hero ran.')
+        self.assertEqual(self.project.word_count, 10)
+        self.assert_offsets_match()
+
+    def test_edit_splices_only_that_segment(self):
+        dragon, hero = self.add('A dragon appeared!'), self.add('The hero ran.')
+        dragon.add_content = 'A much bigger dragon appeared!'
+        dragon.save()
+        self.assertEqual(self.story(), 'Once upon a time.\n\nA much bigger dragon appeared!\n\nThe hero ran.')
+        hero.refresh_from_db()
+        self.assertEqual(hero.current_offset, len('Once upon a time.\n\nA much bigger dragon appeared!\n\n'))
+        self.assert_offsets_match()
+
+    def test_delete_cuts_segment_and_separator(self):
+        dragon, _ = self.add('A dragon appeared!'), self.add('The hero ran.')
+        dragon.delete()
+        self.assertEqual(self.story(), 'Once upon a time.\n\nThe hero ran.')
+        self.assertEqual(self.project.starting_content, 'Once upon a time.\nThe hero ran.')
+        self.assertEqual(self.project.word_count, 7)
+        self.assert_offsets_match()
+
+    def test_saving_a_pledge_keeps_offsets_shifted_meanwhile(self):
+        dragon, hero = self.add('A dragon appeared!'), self.add('The hero ran.')
+        loaded = Pledge.objects.get(pk=hero.pk)  # e.g. a PUT has just loaded it...
+        dragon.add_content = 'A much bigger dragon appeared!'
+        dragon.save()  # ...when an earlier pledge's edit moves it along
+        serializer = PledgeSerializer(instance=loaded, data={'anonymous': True}, partial=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        serializer.save()
+        hero.refresh_from_db()
+        self.assertTrue(hero.anonymous)
+        self.assertEqual(hero.current_offset, len('Once upon a time.\n\nA much bigger dragon appeared!\n\n'))
+        self.assert_offsets_match()
+
+    def test_repeated_line_is_not_mistaken_for_the_pledge(self):
+        ending = self.add('The end.')
+        # The owner rewrites the story by hand: the pledge's line is gone, an identical one is far away
+        Project.objects.filter(pk=self.project.pk).update(
+            current_content='Once upon a time.\n\n' + 'Filler. ' * 200 + '\n\nThe end.',
+        )
+        ending.delete()
+        self.assertTrue(self.story().endswith('\n\nThe end.'))
+
+    def test_locate_looks_only_near_the_stored_offset(self):
+        text = 'Intro.\n\nThe end.\n\n' + 'x' * 2000 + '\n\nThe end.'
+        self.assertEqual(content._locate(text, 8, 'The end.', '\n\n'), 8)
+        self.assertEqual(content._locate(text, 11, 'The end.', '\n\n'), 8)  # moved a little: found
+        self.assertIsNone(content._locate(text, 1000, 'The end.', '\n\n'))  # far from both copies
+        self.assertIsNone(content._locate('The end is near.', 3, 'The end', '\n\n'))  # only part of a longer line
+        self.assertIsNone(content._locate(text, None, 'The end.', '\n\n'))
+
+    def test_deleting_a_supporter_removes_their_text(self):
+        self.add('A dragon appeared!')
+        self.add('The hero ran.', supporter=self.owner)
+        self.supporter.delete()
+        self.assertEqual(self.story(), 'Once upon a time.\n\nThe hero ran.')
+        self.assert_offsets_match()
+
+    def test_deleting_an_owner_deletes_their_project(self):
+        self.add('A dragon appeared!', supporter=self.owner)
+        self.owner.delete()
+        self.assertFalse(Project.objects.filter(pk=self.project.pk).exists())
+
+
+# ============================================================
+# REVISION HISTORY (revisions.py)
+# ============================================================
+class RevisionTests(TestCase):
+    def setUp(self):
+        self.owner = make_user('owner')
+        self.project = make_project(self.owner)
+
+    def test_pledges_are_stored_as_appends(self):
+        texts = []
+        for number in range(4):
+            Pledge.objects.create(project=self.project, supporter=self.owner, amount=1, add_content=f'Line {number}.')
+            self.project.refresh_from_db()
+            texts.append({'starting_content': self.project.starting_content, 'current_content': self.project.current_content})
+        latest = ProjectRevision.objects.filter(project=self.project).order_by('-number').first()
+        self.assertFalse(latest.is_snapshot)
+        self.assertEqual(revisions._unpack(latest.data)['current_content'], [len(texts[2]['current_content']), '\n\nLine 3.'])
+        self.assertEqual(latest.checksum, revisions.checksum(texts[-1]))
+        for revision, text in zip(ProjectRevision.objects.filter(project=self.project, reason='pledge_added').order_by('number'), texts):
+            self.assertEqual(revisions.content_at(self.project.pk, revision.number), text)
+
+    def test_text_changed_behind_our_back_gets_a_snapshot(self):
+        Pledge.objects.create(project=self.project, supporter=self.owner, amount=1, add_content='First.')
+        Project.objects.filter(pk=self.project.pk).update(current_content='Rewritten.', starting_content='Rewritten.')
+        Pledge.objects.create(project=self.project, supporter=self.owner, amount=1, add_content='Second.')
+        latest = ProjectRevision.objects.filter(project=self.project).order_by('-number').first()
+        self.assertTrue(latest.is_snapshot)
+        self.assertEqual(revisions.content_at(self.project.pk, latest.number)['current_content'], 'Rewritten.\n\nSecond.')
+
+    def test_owner_edits_are_line_deltas(self):
+        Pledge.objects.create(project=self.project, supporter=self.owner, amount=1, add_content='First.')
+        project = Project.objects.get(pk=self.project.pk)
+        project.current_content = project.current_content.replace('First.', 'The first.')
+        project.save()
+        latest = ProjectRevision.objects.filter(project=project).order_by('-number').first()
+        self.assertFalse(latest.is_snapshot)
+        self.assertEqual(revisions.content_at(project.pk, latest.number)['current_content'], project.current_content)
+
+
+# ============================================================
+# ARCHIVED STORIES (archive.py) - lists still show their text
+# ============================================================
+class ArchivedListTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = make_user('owner')
+        self.reader = make_user('reader')
+        self.project = make_project(self.owner, moderation='all')
+        Follow.objects.create(user=self.reader, project=self.project)
+        self.published = Pledge.objects.create(project=self.project, supporter=self.owner, amount=1, add_content='The end.', comment='Bye!')
+        self.waiting = Pledge.objects.create(project=self.project, supporter=self.reader, amount=1, add_content='Or is it?', comment='Hi', status=PENDING)
+        self.project.is_open = False
+        self.project.save(update_fields=['is_open'])
+        self.assertIsNotNone(archive.archive_project(self.project.pk))
+        self.client = APIClient()
+
+    def test_project_list(self):
+        row, = [row for row in self.client.get('/projects/').json() if row['id'] == self.project.pk]
+        self.assertEqual(row['current_content'], 'Once upon a time.\n\nThe end.')
+        self.assertEqual(row['starting_content'], 'Once upon a time.\nThe end.')
+
+    def test_pledge_list(self):
+        row, = self.client.get('/projects/pledges/').json()
+        self.assertEqual((row['add_content'], row['comment']), ('The end.', 'Bye!'))
+
+    def test_feed(self):
+        items, _ = feed.feed_page(self.reader)
+        self.assertEqual([item['add_content'] for item in items], ['The end.'])
+
+    def test_moderation_queue(self):
+        self.client.force_authenticate(self.owner)
+        row, = self.client.get('/projects/moderation/').json()['results']
+        self.assertEqual((row['add_content'], row['comment']), ('Or is it?', 'Hi'))
+
+    def assert_still_archived(self):
+        self.assertTrue(ProjectArchive.objects.filter(project_id=self.project.pk).exists())
+        self.assertEqual(Project.objects.get(pk=self.project.pk).current_content, '')
+
+    def test_rejected_edits_leave_the_archive_alone(self):
+        self.client.force_authenticate(self.owner)
+        response = self.client.put(f'/projects/{self.project.pk}/', {'title': 'New'}, format='json', HTTP_IF_MATCH='"v1"')
+        self.assertEqual(response.status_code, 412)
+        response = self.client.put(f'/projects/{self.project.pk}/', {'goal': 'lots'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.put(f'/projects/pledges/{self.published.pk}/', {'amount': 'lots'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assert_still_archived()
+
+    def test_edit_unarchives_with_the_text_intact(self):
+        self.client.force_authenticate(self.owner)
+        response = self.client.put(f'/projects/{self.project.pk}/', {'title': 'New'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['current_content'], 'Once upon a time.\n\nThe end.')
+        project = Project.objects.get(pk=self.project.pk)
+        self.assertIsNone(project.archived_at)
+        self.assertEqual((project.title, project.current_content), ('New', 'Once upon a time.\n\nThe end.'))
+        self.assertEqual(Pledge.objects.get(pk=self.published.pk).comment, 'Bye!')
+
+    def test_pledge_edit_and_delete_unarchive(self):
+        self.client.force_authenticate(self.owner)
+        response = self.client.put(f'/projects/pledges/{self.published.pk}/', {'add_content': 'The real end.'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Project.objects.get(pk=self.project.pk).current_content, 'Once upon a time.\n\nThe real end.')
+        self.assertEqual(self.client.delete(f'/projects/pledges/{self.published.pk}/').status_code, 204)
+        self.assertEqual(Project.objects.get(pk=self.project.pk).current_content, 'Once upon a time.')
+
+    def admin_request(self):
+        request = APIRequestFactory().post('/')
+        request.user = get_user_model().objects.create_superuser('admin', password='pass12345')
+        return request
+
+    def admin_save(self, model_admin, request, obj, **changes):
+        """Submit the admin's own change form for obj with `changes`, the way the change page does."""
+        form_class = model_admin.get_form(request, obj, change=True)
+        form = form_class({**form_class(instance=obj).initial, **changes}, instance=obj)
+        self.assertTrue(form.is_valid(), form.errors)
+        model_admin.save_model(request, form.save(commit=False), form, change=True)
+
+    def test_admin_shows_and_saves_the_archived_text(self):
+        model_admin, request = admin.site._registry[Project], self.admin_request()
+        project = model_admin.get_object(request, str(self.project.pk))
+        self.assertEqual(project.current_content, 'Once upon a time.\n\nThe end.')
+        self.admin_save(model_admin, request, project, title='New')
+        project = Project.objects.get(pk=self.project.pk)
+        self.assertIsNone(project.archived_at)
+        self.assertEqual((project.title, project.current_content), ('New', 'Once upon a time.\n\nThe end.'))
+
+    def test_admin_pledge_edit_patches_the_archived_story(self):
+        model_admin, request = admin.site._registry[Pledge], self.admin_request()
+        pledge = model_admin.get_object(request, str(self.published.pk))
+        self.assertEqual(pledge.add_content, 'The end.')
+        self.admin_save(model_admin, request, pledge, add_content='The real end.')
+        self.assertEqual(Project.objects.get(pk=self.project.pk).current_content, 'Once upon a time.\n\nThe real end.')
+        self.assertEqual(Pledge.objects.get(pk=self.published.pk).comment, 'Bye!')
+
+    def test_rows_are_hydrated_with_two_queries(self):
+        rows = views.compact_pledges.data(Pledge.objects.all())
+        cache.clear()
+        with self.assertNumQueries(2):
+            archive.hydrate_rows(rows, 'project', 'id')
+        self.assertEqual(sorted(row['add_content'] for row in rows), ['Or is it?', 'The end.'])
+
+
+# ============================================================
+# MODERATION (moderation.py) - approving and rejecting in batches
+# ============================================================
+class ModerationTests(TestCase):
+    def setUp(self):
+        self.owner = make_user('owner')
+        self.supporter = make_user('supporter')
+        self.project = make_project(self.owner, moderation='all')
+        self.client = APIClient()
+
+    def submit(self, text):
+        self.client.force_authenticate(self.supporter)
+        response = self.client.post('/projects/pledges/', {
+            'project': self.project.pk, 'amount': 1, 'add_content': text, 'anonymous': False, 'comment': 'Please!',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return Pledge.objects.get(pk=response.json()['id'])
+
+    def decide(self, **decisions):
+        self.client.force_authenticate(self.owner)
+        return self.client.post('/projects/moderation/', decisions, format='json')
+
+    def project_now(self):
+        return Project.objects.get(pk=self.project.pk)
+
+    def test_pending_pledges_stay_out_of_the_story(self):
+        pledge = self.submit('A dragon appeared!')
+        self.assertEqual(pledge.status, PENDING)
+        project = self.project_now()
+        self.assertEqual((project.current_content, project.pledge_count), ('', 0))
+        self.assertEqual(self.client.get('/projects/pledges/').json(), [])
+
+    def test_approve_batch_appends_in_id_order(self):
+        first, second, third = self.submit('A dragon appeared!'), self.submit('The hero ran.'), self.submit('Spam!')
+        response = self.decide(approve=[second.pk, first.pk], reject=[third.pk])
+        self.assertEqual(response.json(), {'approved': 2, 'rejected': 1, 'skipped': []})
+        project = self.project_now()
+        self.assertEqual(project.current_content, 'Once upon a time.\n\nA dragon appeared!\n\nThe hero ran.')
+        self.assertEqual(project.pledge_count, 2)
+        for pledge in (first, second):
+            pledge.refresh_from_db()
+            self.assertEqual(project.current_content[pledge.current_offset:][:pledge.segment_length], pledge.add_content)
+            self.assertEqual(project.starting_content[pledge.starting_offset:][:pledge.segment_length], pledge.add_content)
+        third.refresh_from_db()
+        self.assertEqual((third.status, third.current_offset), (moderation.REJECTED, None))
+        # Approving again does nothing - the pledges aren't pending any more
+        self.assertEqual(self.decide(approve=[first.pk]).json()['skipped'], [first.pk])
+        self.assertEqual(self.project_now().current_content, project.current_content)
+
+    def test_rejecting_an_approved_pledge_cuts_it_out(self):
+        first, second, third = self.submit('One.'), self.submit('Two.'), self.submit('Three.')
+        self.decide(approve=[first.pk, second.pk, third.pk])
+        self.decide(reject=[second.pk])
+        project = self.project_now()
+        self.assertEqual(project.current_content, 'Once upon a time.\n\nOne.\n\nThree.')
+        self.assertEqual(project.starting_content, 'Once upon a time.\nOne.\nThree.')
+        self.assertEqual(project.pledge_count, 2)
+        third.refresh_from_db()
+        self.assertEqual(project.current_content[third.current_offset:], 'Three.')
+        self.assertEqual(project.starting_content[third.starting_offset:], 'Three.')
+
+    def test_only_the_owner_can_decide(self):
+        pledge = self.submit('A dragon appeared!')
+        self.client.force_authenticate(self.supporter)
+        response = self.client.post('/projects/moderation/', {'approve': [pledge.pk]}, format='json')
+        self.assertEqual(response.json(), {'approved': 0, 'rejected': 0, 'skipped': [pledge.pk]})
+        self.assertEqual(self.project_now().current_content, '')
+
+
+# ============================================================
+# ANALYTICS EXPORTS (analytics.py)
+# ============================================================
+class AnalyticsExportTests(TestCase):
+    def setUp(self):
+        self.output = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output)
+        owner = make_user('owner')
+        # Created in id order, except the last one - a late row for an earlier month
+        for month in (1, 1, 2, 3, 1):
+            project = make_project(owner)
+            Project.objects.filter(pk=project.pk).update(date_created=datetime(2025, month, 5, tzinfo=timezone.utc))
+
+    def files(self, extension):
+        return sorted(
+            os.path.relpath(os.path.join(folder, name), self.output)
+            for folder, _, names in os.walk(os.path.join(self.output, extension)) for name in names
+        )
+
+    def test_months_are_closed_as_rows_move_on(self):
+        with mock.patch.object(analytics._Partition, 'close', autospec=True, side_effect=analytics._Partition.close) as close:
+            result = analytics.export_table('projects', self.output, formats=('csv',))
+        # Each month was closed the moment a later month's row arrived, not all at the end
+        self.assertEqual([call.args[0].month for call in close.call_args_list], ['2025-01', '2025-02', '2025-03', '2025-01'])
+        self.assertEqual(result['rows'], 5)
+        stem = 'part-%012d-%012d' % (Project.objects.order_by('id')[0].pk, Project.objects.order_by('-id')[0].pk)
+        self.assertEqual(self.files('csv'), [
+            f'csv/projects/month=2025-01/{stem}-1.csv', f'csv/projects/month=2025-01/{stem}.csv',
+            f'csv/projects/month=2025-02/{stem}.csv', f'csv/projects/month=2025-03/{stem}.csv',
+        ])
+
+    def test_full_only_clears_the_formats_it_writes(self):
+        other = os.path.join(self.output, 'parquet', 'projects', 'month=2024-12')
+        os.makedirs(other)
+        open(os.path.join(other, 'part-old.parquet'), 'w').close()
+        analytics.export_table('projects', self.output, formats=('csv',), full=True)
+        self.assertEqual(self.files('parquet'), ['parquet/projects/month=2024-12/part-old.parquet'])
+        self.assertEqual(len(self.files('csv')), 4)
+
+
+# ============================================================
+# STORY STATS (/projects/1/stats/)
+# ============================================================
+class ProjectStatsTests(TestCase):
+    def test_words_cut_out_of_the_story_are_not_counted(self):
+        owner, supporter = make_user('owner'), make_user('supporter')
+        project = make_project(owner)
+        kept = Pledge.objects.create(project=project, supporter=supporter, amount=1, add_content='A dragon appeared!')
+        cut = Pledge.objects.create(project=project, supporter=supporter, amount=1, add_content='The hero ran away fast.')
+        # The owner rewrites the story without the second pledge
+        project = Project.objects.get(pk=project.pk)
+        project.current_content = project.current_content.replace('\n\nThe hero ran away fast.', '')
+        project.save()
+        cut.add_content = 'The hero ran away.'
+        cut.save()  # its text isn't in the story any more, so this finds nothing to replace
+        cut.refresh_from_db()
+        self.assertIsNone(cut.current_offset)
+
+        stats = APIClient().get(f'/projects/{project.pk}/stats/').json()
+        contributor, = stats['contributors']
+        self.assertEqual((contributor['pledges'], contributor['words']), (2, kept.word_count))
+        self.assertEqual(stats['word_count'], 7)
+        self.assertEqual(stats['other_words'], 4)
+
+
+# ============================================================
+# STORY ASSEMBLY (assembly.py, check_stories)
+# ============================================================
+class AssemblyTests(TestCase):
+    def setUp(self):
+        self.owner = make_user('owner')
+        self.supporter = make_user('supporter')
+
+    def add(self, project, text, **fields):
+        return Pledge.objects.create(project=project, supporter=self.supporter, amount=1, add_content=text, **fields)
+
+    def assert_same_as_python(self, *projects):
+        assembled = assembly.assembled_stories([project.pk for project in projects])
+        for project in projects:
+            project = Project.objects.get(pk=project.pk)
+            self.assertEqual(assembled[project.pk], assembly.assemble_in_python(project), project.title)
+
+    def test_database_and_python_agree(self):
+        plain = make_project(self.owner, title='plain')
+        self.add(plain, 'One.')
+        self.add(plain, '　 Two, in odd whitespace.\xa0\n')
+        edited = make_project(self.owner, title='edited')
+        first, second, _ = self.add(edited, 'Alpha.'), self.add(edited, 'Beta.'), self.add(edited, 'Gamma.')
+        first.add_content = 'Alpha, longer now.'
+        first.save()
+        second.delete()
+        self.add(edited, 'Waiting.', status=PENDING)
+        empty = make_project(self.owner, title='empty')
+        no_opening = make_project(self.owner, title='no opening', starting_content='')
+        self.add(no_opening, 'First words.')
+        self.assert_same_as_python(plain, edited, empty, no_opening)
+        self.assertEqual(assembly.assembled_story(edited.pk), 'Once upon a time.\n\nAlpha, longer now.\n\nGamma.')
+        self.assertEqual(assembly.assembled_story(empty.pk), 'Once upon a time.')
+
+    def test_archived_projects_are_left_out(self):
+        project = make_project(self.owner, is_open=False)
+        self.add(project, 'The end.')
+        archive.archive_project(project.pk)
+        self.assertEqual(assembly.assembled_stories([project.pk]), {})
+
+    def test_check_stories_rebuilds_drifted_text(self):
+        project = make_project(self.owner)
+        one, two = self.add(project, 'One.'), self.add(project, 'Two.')
+        # The story text loses a pledge behind content.py's back
+        Project.objects.filter(pk=project.pk).update(current_content='Once upon a time.\n\nTwo.')
+        output = io.StringIO()
+        call_command('check_stories', stdout=output)
+        self.assertIn(f'project {project.pk}: text differs from its pledges', output.getvalue())
+
+        call_command('check_stories', '--rebuild', stdout=io.StringIO())
+        project.refresh_from_db()
+        self.assertEqual(project.current_content, 'Once upon a time.\n\nOne.\n\nTwo.')
+        self.assertEqual(project.word_count, 6)
+        for pledge in (one, two):
+            pledge.refresh_from_db()
+            self.assertEqual(project.current_content[pledge.current_offset:][:pledge.segment_length], pledge.add_content)
+        self.assertEqual(ProjectRevision.objects.filter(project=project).latest('number').reason, 'rebuilt')
+        output = io.StringIO()
+        call_command('check_stories', stdout=output)
+        self.assertIn('0 differ', output.getvalue())
+
+
+# ============================================================
+# IDEMPOTENCY KEYS (idempotency.py)
+# ============================================================
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.project = make_project(self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.factory = APIRequestFactory()
+
+    def pledge(self, key, text='A line.'):
+        return self.client.post('/projects/pledges/', {
+            'project': self.project.pk, 'amount': 1, 'add_content': text, 'anonymous': False, 'comment': 'Onward!',
+        }, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def run_view(self, handler, key='key-1'):
+        """POST to a throwaway view whose post() is `handler`, wrapped in @idempotent."""
+        view = type('View', (APIView,), {'post': idempotency.idempotent(handler)}).as_view()
+        request = self.factory.post('/anything/', {'n': 1}, format='json', HTTP_IDEMPOTENCY_KEY=key)
+        force_authenticate(request, user=self.user)
+        return view(request)
+
+    def test_retry_replays_the_stored_response(self):
+        first = self.pledge('key-1')
+        self.assertEqual(first.status_code, 201)
+        retry = self.pledge('key-1')
+        self.assertEqual((retry.status_code, retry.json()), (201, first.json()))
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Pledge.objects.filter(project=self.project).count(), 1)
+        self.assertEqual(Project.objects.get(pk=self.project.pk).current_content, 'Once upon a time.\n\nA line.')
+
+    def test_same_key_different_body_is_rejected(self):
+        self.pledge('key-1')
+        response = self.pledge('key-1', text='Another line.')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Pledge.objects.filter(project=self.project).count(), 1)
+
+    def test_retry_while_still_running_gets_409(self):
+        retries = []
+
+        def handler(view, request):
+            retries.append(self.run_view(handler))  # the client retries before this one has answered
+            return Response({'ok': True}, status=201)
+        self.assertEqual(self.run_view(handler).status_code, 201)
+        self.assertEqual(retries[0].status_code, 409)
+        self.assertEqual(retries[0]['Retry-After'], '1')
+
+    def test_server_errors_are_not_stored(self):
+        calls = []
+
+        def failing(view, request):
+            calls.append(1)
+            return Response({'error': 'database down'}, status=503)
+        self.assertEqual(self.run_view(failing).status_code, 503)
+        self.assertFalse(IdempotencyRecord.objects.exists())
+        self.assertEqual(self.run_view(failing).status_code, 503)
+        self.assertEqual(len(calls), 2)  # the retry ran again
+
+    def test_exceptions_are_not_stored(self):
+        def crashing(view, request):
+            raise RuntimeError('boom')
+        with self.assertRaises(RuntimeError):
+            self.run_view(crashing)
+        self.assertFalse(IdempotencyRecord.objects.exists())
+        response = self.run_view(lambda view, request: Response({'ok': True}, status=201))
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', response)
+
+
+# ============================================================
+# IF-MATCH / ETAGS (concurrency.py)
+# ============================================================
+class ConcurrencyTests(TestCase):
+    def setUp(self):
+        self.owner = make_user('owner')
+        self.supporter = make_user('supporter')
+        self.project = make_project(self.owner)
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def edit(self, if_match=None, **data):
+        headers = {} if if_match is None else {'HTTP_IF_MATCH': if_match}
+        return self.client.put(f'/projects/{self.project.pk}/', data or {'title': 'New title'}, format='json', **headers)
+
+    def test_put_with_current_etag_bumps_it(self):
+        tag = self.client.get(f'/projects/{self.project.pk}/')['ETag']
+        response = self.edit(tag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], f'"v{Project.objects.get(pk=self.project.pk).version}"')
+        self.assertNotEqual(response['ETag'], tag)
+        self.assertEqual(response.json()['title'], 'New title')
+
+    def test_stale_etag_gets_412_with_the_current_one(self):
+        self.edit()  # v1 → v2
+        response = self.edit('"v1"', title='Lost update')
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(response['ETag'], '"v2"')
+        self.assertEqual(response.json()['current_version'], 2)
+        self.assertEqual(Project.objects.get(pk=self.project.pk).title, 'New title')
+
+    def test_malformed_if_match_is_400(self):
+        for header in ('"2"', 'nonsense', '"vx"'):
+            self.assertEqual(self.edit(header).status_code, 400, header)
+        self.assertEqual(self.edit('W/"v1"').status_code, 200)  # weak ETags from compressed responses name the same version
+
+    def test_pledge_between_get_and_put_stops_the_overwrite(self):
+        tag = self.client.get(f'/projects/{self.project.pk}/')['ETag']
+        Pledge.objects.create(project=self.project, supporter=self.supporter, amount=1, add_content='A dragon appeared!')
+        response = self.edit(tag, current_content='Once upon a time. The owner rewrote it.')
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(
+            Project.objects.get(pk=self.project.pk).current_content,
+            'Once upon a time.\n\nA dragon appeared!',
+        )
+
+    def test_pledge_etags(self):
+        pledge = Pledge.objects.create(project=self.project, supporter=self.owner, amount=1, add_content='Mine.')
+        url = f'/projects/pledges/{pledge.pk}/'
+        tag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.put(url, {'amount': 2}, format='json', HTTP_IF_MATCH=tag).status_code, 200)
+        self.assertEqual(self.client.put(url, {'amount': 3}, format='json', HTTP_IF_MATCH=tag).status_code, 412)
+        self.assertEqual(self.client.delete(url, HTTP_IF_MATCH=tag).status_code, 412)
+        self.assertTrue(Pledge.objects.filter(pk=pledge.pk, amount=2).exists())
@@ -0,0 +1,188 @@
+'''
+throttling.py - limits on how fast anyone can create projects and pledges.
+
+Every pledge rewrites its project's whole story text, so a script posting
+pledges in a loop slows the database down for everyone. These throttles
+give each user, each IP address and each project a "token bucket":
+
+- the bucket holds up to N tokens (the burst you're allowed)
+- every write takes one token
+- tokens trickle back at N per period (e.g. "20/min" = one every 3 seconds)
+- an empty bucket = 429 Too Many Requests, with a Retry-After header
+  saying how many seconds until the next token arrives
+
+Rates live in settings.WRITE_THROTTLE_RATES, keyed "<view scope>_<kind>",
+e.g. "pledge_user". Reads (GET) are never throttled.
+
+ALL OR NOTHING:
+A pledge is checked against its user's, its IP's and its project's
+bucket. Tokens are only taken if ALL of them have one - a request one
+bucket rejects doesn't use up the others.
+
+ATOMIC:
+Buckets are ThrottleBucket rows, shared by every worker. A token is
+taken with one conditional UPDATE (refill, then "tokens - 1 WHERE
+tokens >= 1"), and all of a request's buckets in one transaction. A
+flood arriving all at once can't spend the same token twice.
+'''
+
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest, Least
+from django.db.models.lookups import GreaterThanOrEqual
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.throttling import BaseThrottle
+
+from .models import ThrottleBucket
+
+PERIODS = {'s': 1, 'sec': 1, 'm': 60, 'min': 60, 'h': 3600, 'hour': 3600, 'd': 86400, 'day': 86400}
+
+
+def parse_rate(rate):
+    """'20/min' → (20 tokens, 20/60 tokens per second)"""
+    count, _, period = rate.partition('/')
+    capacity = int(count)
+    return capacity, capacity / PERIODS[period]
+
+
+def _available(capacity, refill_per_second, now):
+    """SQL for the tokens a bucket has at `now`: what was left + what has trickled back since."""
+    elapsed = Greatest(Value(now) - F('updated'), Value(0.0))
+    return Least(Value(float(capacity)), F('tokens') + elapsed * Value(refill_per_second))
+
+
+def take_tokens(buckets, now=None):
+    """
+    buckets = [(key, capacity, refill per second), ...]
+    Take one token from EVERY bucket, or from none of them.
+
+    Returns {} when the tokens were taken, otherwise {key: seconds until
+    it has a token again} for each bucket that is empty.
+    """
+    now = time.time() if now is None else now
+    with transaction.atomic():
+        # A new bucket starts full
+        ThrottleBucket.objects.bulk_create(
+            [ThrottleBucket(key=key, tokens=capacity, updated=now, full_at=now) for key, capacity, _ in buckets],
+            ignore_conflicts=True,
+        )
+        for key, capacity, refill_per_second in sorted(buckets):  # always the same order - no deadlocks
+            available = _available(capacity, refill_per_second, now)
+            taken = ThrottleBucket.objects.filter(GreaterThanOrEqual(available, 1), key=key).update(
+                tokens=available - 1,
+                updated=now,
+                full_at=Value(now) + (Value(float(capacity)) - (available - 1)) / Value(refill_per_second),
+            )
+            if not taken:
+                transaction.set_rollback(True)  # hands back the tokens already taken
+                break
+        else:
+            return {}
+
+    waits = {}
+    for key, capacity, refill_per_second in buckets:
+        tokens = (
+            ThrottleBucket.objects.filter(key=key)
+            .values_list(_available(capacity, refill_per_second, now), flat=True)
+            .first()
+        )
+        if tokens is not None and tokens < 1:
+            waits[key] = (1 - tokens) / refill_per_second
+    if not waits:
+        # Another worker gave a token back in between - too close to call, so: one token's wait
+        key, _, refill_per_second = buckets[0]
+        waits[key] = 1 / refill_per_second
+    return waits
+
+
+def prune(batch_size=1000, now=None):
+    """Delete the buckets that are full again (no bucket = a full one). Returns how many were removed."""
+    now = time.time() if now is None else now
+    removed = 0
+    full = ThrottleBucket.objects.filter(full_at__lt=now)
+    while True:
+        keys = list(full.values_list('key', flat=True)[:batch_size])
+        if not keys:
+            return removed
+        removed += ThrottleBucket.objects.filter(key__in=keys, full_at__lt=now).delete()[0]
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Base class - subclasses say WHAT to count per bucket (user, IP, project).
+    The view says which family of rates applies with `throttle_scope`.
+
+    The first of a view's token-bucket throttles takes the tokens for all
+    of them at once (take_tokens); the others read the answer it left on
+    the request.
+    """
+    kind = None
+
+    def get_bucket_id(self, request, view):
+        """Return the id of the bucket to use, or None to not throttle this request."""
+        raise NotImplementedError
+
+    def bucket(self, request, view):
+        """(key, capacity, refill per second) of this request's bucket, or None."""
+        scope = getattr(view, 'throttle_scope', None)
+        rate = settings.WRITE_THROTTLE_RATES.get(f'{scope}_{self.kind}')
+        bucket_id = self.get_bucket_id(request, view) if rate else None
+        if bucket_id is None:
+            return None
+        return (f'throttle:{scope}:{self.kind}:{bucket_id}', *parse_rate(rate))
+
+    def allow_request(self, request, view):
+        self.retry_after = None
+        if request.method in SAFE_METHODS:
+            return True
+        bucket = self.bucket(request, view)
+        if bucket is None:
+            return True
+        waits = getattr(request, '_throttle_waits', None)
+        if waits is None:
+            buckets = [
+                throttle.bucket(request, view) for throttle in view.get_throttles()
+                if isinstance(throttle, TokenBucketThrottle)
+            ]
+            waits = request._throttle_waits = take_tokens([b for b in buckets if b is not None])
+        self.retry_after = waits.get(bucket[0])
+        return self.retry_after is None
+
+    def wait(self):
+        # DRF puts this in the Retry-After header of the 429 response
+        return self.retry_after
+
+
+class UserWriteThrottle(TokenBucketThrottle):
+    """One bucket per logged-in user."""
+    kind = 'user'
+
+    def get_bucket_id(self, request, view):
+        return request.user.pk if request.user and request.user.is_authenticated else None
+
+
+class IPWriteThrottle(TokenBucketThrottle):
+    """One bucket per client IP address - catches many accounts run by one script."""
+    kind = 'ip'
+
+    def get_bucket_id(self, request, view):
+        return self.get_ident(request)
+
+
+class ProjectWriteThrottle(TokenBucketThrottle):
+    """One bucket per project - protects one story from being flooded by many clients."""
+    kind = 'project'
+
+    def get_bucket_id(self, request, view):
+        project_id = view.kwargs.get('project_id')
+        if project_id is None:
+            project_id = request.data.get('project') if hasattr(request.data, 'get') else None
+        # Only a real id names a bucket - otherwise a client could make up endless keys
+        try:
+            project_id = int(project_id)
+        except (TypeError, ValueError):
+            return None
+        return project_id if project_id > 0 else None
@@ -0,0 +1,131 @@
+'''
+trending.py - the "what's hot right now" ranking behind /projects/trending/.
+
+THE IDEA:
+Every pledge adds `amount` points to its project, and points fade away
+over time: after TRENDING_HALF_LIFE_HOURS a pledge is worth half as much,
+after two half-lives a quarter, and so on. Creating a project counts as
+one point, so brand-new stories get a moment in the spotlight too.
+
+THE TRICK (why one indexed column is enough):
+Fading every project's score every hour would mean rewriting the whole
+table. Instead, each pledge's points are measured against a FIXED moment
+(EPOCH): a pledge made later is simply worth more. All projects "fade"
+at the same rate, so comparing these numbers gives exactly the same order
+as comparing faded-to-now scores - and a score only changes when its
+project gets a pledge. The numbers grow very large over the years, so we
+store their logarithm (`trending_velocity`).
+
+    trending_score = trending_velocity + log(1 + TRENDING_PROGRESS_WEIGHT × progress)
+
+where progress = pledges / goal (capped at 1), so stories close to their
+goal get a push. `python manage.py recompute_trending` rebuilds every
+score from the pledge table (e.g. after changing the settings).
+'''
+
+import math
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import APPROVED, Project, Pledge
+
+EPOCH = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def _growth(when):
+    """log of how much a point earned at `when` is worth compared to one earned at EPOCH."""
+    hours = (when - EPOCH).total_seconds() / 3600
+    return math.log(2) * hours / settings.TRENDING_HALF_LIFE_HOURS
+
+
+def _log_add(a, b):
+    """log(e^a + e^b) without ever computing the (huge) e^a or e^b."""
+    if a is None:
+        return b
+    high, low = max(a, b), min(a, b)
+    return high + math.log1p(math.exp(low - high))
+
+
+def event_weight(amount, when):
+    return math.log(max(amount, 1)) + _growth(when)
+
+
+def score(velocity, pledge_count, goal):
+    progress = min(pledge_count / goal, 1.0) if goal and goal > 0 else 0.0
+    return velocity + math.log1p(settings.TRENDING_PROGRESS_WEIGHT * progress)
+
+
+def start_project(project):
+    """A new project starts with one point, earned when it was created."""
+    velocity = event_weight(1, project.date_created)
+    Project.objects.filter(pk=project.pk).update(
+        trending_velocity=velocity,
+        trending_score=score(velocity, 0, project.goal),
+    )
+
+
+def record_pledge(pledge):
+    """Add one pledge to its project's score - see record_pledges()."""
+    record_pledges(pledge.project_id, [pledge])
+
+
+def record_pledges(project_id, pledges):
+    """
+    Add pledges to a project's score - O(1) per pledge, no matter how many
+    pledges the project already has. The row is locked while we do the
+    maths so two pledges at the same moment can't lose each other.
+    """
+    with transaction.atomic():
+        project = (
+            Project.objects.select_for_update()
+            .only('trending_velocity', 'pledge_count', 'goal', 'date_created')
+            .get(pk=project_id)
+        )
+        velocity = project.trending_velocity or event_weight(1, project.date_created)
+        for pledge in pledges:
+            velocity = _log_add(velocity, event_weight(pledge.amount, pledge.date_created))
+        Project.objects.filter(pk=project.pk).update(
+            trending_velocity=velocity,
+            trending_score=score(velocity, project.pledge_count, project.goal),
+        )
+
+
+def recompute(chunk_size=500, project_ids=None):
+    """
+    Rebuild every project's score (or just those in project_ids) from
+    scratch. Reads pledges one chunk of projects at a time (only id,
+    amount and date - never the story text). Returns the number of
+    projects updated.
+    """
+    updated = 0
+    projects = Project.objects.only('id', 'goal', 'pledge_count', 'date_created').order_by('id')
+    if project_ids is not None:
+        projects = projects.filter(pk__in=project_ids)
+    last_id = 0
+    while True:
+        chunk = list(projects.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            return updated
+        velocities = {project.pk: event_weight(1, project.date_created) for project in chunk}
+        pledges = (
+            Pledge.objects.filter(project_id__in=velocities, status=APPROVED)
+            .values_list('project_id', 'amount', 'date_created')
+        )
+        for project_id, amount, date_created in pledges.iterator(chunk_size=2000):
+            velocities[project_id] = _log_add(velocities[project_id], event_weight(amount, date_created))
+        for project in chunk:
+            project.trending_velocity = velocities[project.pk]
+            project.trending_score = score(project.trending_velocity, project.pledge_count, project.goal)
+        Project.objects.bulk_update(chunk, ['trending_velocity', 'trending_score'])
+        updated += len(chunk)
+        last_id = chunk[-1].pk
+
+
+def trending_projects():
+    """
+    Open projects, hottest first - one range scan of project_trending_idx.
+    Equal scores are ordered newest first, so paging never repeats or skips one.
+    """
+    return Project.objects.filter(is_open=True).order_by('-trending_score', '-id')
@@ -3,7 +3,11 @@ urls.py - the address book for the projects app. It maps URL patterns to views.
 
 '''
 from django.urls import path
-from .views import ProjectList, ProjectDetail, PledgeList, PledgeDetail, PledgeListCreate
+from .views import (
+    ProjectList, ProjectDetail, PledgeList, PledgeDetail, PledgeListCreate, StoryExport, ProjectTrending, FollowProject,
+    ProjectRevisionList, ProjectRevisionDetail, ProjectRevisionRestore, ModerationQueue,
+    ProjectStats,
+)
 
 
 urlpatterns = [
@@ -16,6 +20,21 @@ urlpatterns = [
     path('<int:pk>/', ProjectDetail.as_view(), name='project-detail'),
     # GET  /projects/1/   → Get project #1
     # PUT  /projects/1/   → Update project #1
+    path('export/', StoryExport.as_view(), name='story-export'),
+    # GET  /projects/export/  → Download closed stories as .tar.gz / .zip
+    path('trending/', ProjectTrending.as_view(), name='project-trending'),
+    # GET  /projects/trending/ → Hottest open projects right now
+    path('<int:pk>/follow/', FollowProject.as_view(), name='project-follow'),
+    # POST   /projects/1/follow/ → Follow project #1
+    # DELETE /projects/1/follow/ → Unfollow project #1
+    path('<int:pk>/revisions/', ProjectRevisionList.as_view(), name='project-revision-list'),
+    # GET  /projects/1/revisions/ → History of project #1's story text
+    path('<int:pk>/revisions/<int:number>/', ProjectRevisionDetail.as_view(), name='project-revision-detail'),
+    # GET  /projects/1/revisions/7/ → The story as of revision 7
+    path('<int:pk>/revisions/<int:number>/restore/', ProjectRevisionRestore.as_view(), name='project-revision-restore'),
+    # POST /projects/1/revisions/7/restore/ → Put revision 7's text back (owner only)
+    path('<int:pk>/stats/', ProjectStats.as_view(), name='project-stats'),
+    # GET  /projects/1/stats/ → Word count, reading time and who wrote how much
     
     # ============================================================
     # PLEDGE URLS
@@ -29,4 +48,7 @@ urlpatterns = [
     path('pledges/<int:pk>/', PledgeDetail.as_view(), name='pledge-detail'),
     # GET  /projects/pledges/1/  → Get pledge #1
     # PUT  /projects/pledges/1/  → Update pledge #1
+    path('moderation/', ModerationQueue.as_view(), name='moderation-queue'),
+    # GET  /projects/moderation/ → Pledges waiting for your review
+    # POST /projects/moderation/ → Approve / reject a batch of them
 ]
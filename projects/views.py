@@ -10,9 +10,27 @@ from rest_framework import status, permissions
 from rest_framework.decorators import api_view
 from rest_framework.reverse import reverse
 from .permissions import IsOwnerOrReadOnly, IsSupporterOrReadOnly
-from django.http import Http404
-from .models import Project, Pledge
-from .serializers import ProjectSerializer, PledgeSerializer, ProjectDetailSerializer
+from .idempotency import idempotent
+from .throttling import UserWriteThrottle, IPWriteThrottle, ProjectWriteThrottle
+import math
+from datetime import date, timedelta
+from django.conf import settings
+from django.db.models import Count, Q, Sum
+from django.db import transaction
+from django.utils import timezone
+from django.http import Http404, StreamingHttpResponse
+from .models import APPROVED, CONTENT_TYPE_CHOICES, Project, Pledge, Follow, ProjectRevision, normalize_genre
+from .exports import ARCHIVE_FORMATS, TEXT_FORMATS, closed_projects, iter_story_archive, archive_content_type
+from .serializers import ProjectSerializer, PledgeSerializer, ProjectDetailSerializer, ProjectRevisionSerializer
+from .compact import CompactReader
+from .filters import filter_projects, order_projects, project_facets
+from .trending import trending_projects
+from . import archive, moderation, revisions, rollups
+from .concurrency import claim_version, conflict, etag, expected_version
+
+# Fast read-only versions of the list serializers (see compact.py)
+compact_projects = CompactReader(ProjectSerializer)
+compact_pledges = CompactReader(PledgeSerializer)
 
 # ============================================================
 # API ROOT - The "homepage" of your API
@@ -47,6 +65,8 @@ def api_root(request, format=None):
 
 class ProjectList(APIView):
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    throttle_classes = [UserWriteThrottle, IPWriteThrottle]
+    throttle_scope = 'project' # rates: WRITE_THROTTLE_RATES['project_user'] / ['project_ip']
     """
     PERMISSION EXPLAINED:
     IsAuthenticatedOrReadOnly means:
@@ -60,20 +80,44 @@ class ProjectList(APIView):
         """
         GET /projects/
         
-        Returns ALL projects
+        Returns ALL projects - or only the ones matching the filters
+        
+        USED BY: Homepage, project listing page, browse/search page
         
-        USED BY: Homepage, project listing page
+        FILTERS (all optional, combine freely - see filters.py):
+            ?is_open=true                 only open (or false = finished) projects
+            ?genre=Horror,Sci-Fi          one or more genres
+            ?content_type=poem            story or poem
+            ?owner=3                      projects by user #3
+            ?created_after=2025-01-01     date or date-time ranges
+            ?created_before=2025-06-30
+            ?min_pledges=5                at least 5 contributions
+            ?min_progress=0.5             at least halfway to the goal
+            ?ordering=-date_created       newest first (also: pledges, completion)
+            ?facets=true                  also return counts per genre/content type
         
-        RETURNS: List of all projects as JSON
+        RETURNS: List of projects as JSON
         [
             {"id": 1, "title": "Haunted Lighthouse", ...},
             {"id": 2, "title": "Space Adventure", ...}
         ]
+        With ?facets=true the list moves under "results":
+        {"count": 2, "results": [...], "facets": {"genre": {...}, "content_type": {...}}}
         """
-        projects = Project.objects.all()
-        serializer = ProjectSerializer(projects, many=True) # many=True for lists
-        return Response(serializer.data)
+        params = request.query_params
+        projects = filter_projects(Project.objects.all(), params)
+        # Same JSON as ProjectSerializer(projects, many=True).data, built from plain rows
+        data = compact_projects.data(order_projects(projects, params))
+        archive.hydrate_rows(data, 'id') # archived stories get their text back (archive.py)
+        if params.get('facets', '').lower() in ('true', '1'):
+            return Response({
+                'count': len(data),
+                'results': data,
+                'facets': project_facets(projects, params),
+            })
+        return Response(data)
 
+    @idempotent # safe to retry with the same Idempotency-Key header
     def post(self, request):
         """
         POST /projects/
@@ -140,9 +184,9 @@ class ProjectDetail(APIView):
         NOTE: Uses ProjectDetailSerializer (not ProjectSerializer)
         This includes the pledges nested inside!
         """
-        project = self.get_object(pk)
+        project = archive.hydrate(self.get_object(pk)) # unpacks archived stories (archive.py)
         serializer = ProjectDetailSerializer(project)
-        return Response(serializer.data)
+        return Response(serializer.data, headers={'ETag': etag(project)})
     
     def put(self, request, pk):
         """
@@ -155,15 +199,24 @@ class ProjectDetail(APIView):
         IMPORTANT: partial=True allows updating just SOME fields
         Without it, you'd have to send ALL fields every time.
         """
-        project = self.get_object(pk)
+        project = archive.hydrate(self.get_object(pk), with_pledges=False) # the real text, in memory only
+        # Send If-Match: "v7" (the ETag from GET) to make sure nobody changed it since
+        expected, error = expected_version(request, project)
+        if error:
+            return error
+        revisions.note_change(project, 'edit', request.user.pk) # if the text changes, the history says who did it
         serializer = ProjectDetailSerializer(
             instance=project, # The existing project to update
             data=request.data, # The new data from the request
             partial=True # Allow partial updates
             )
         if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data)
+            with transaction.atomic():
+                if not claim_version(project, expected):
+                    return conflict(project) # 412 - a pledge or another editor got there first
+                archive.unarchive(pk) # an edited story is a live story again - only once the edit is going through
+                serializer.save()
+            return Response(serializer.data, headers={'ETag': etag(project)})
         return Response(
             serializer.errors,
             status=status.HTTP_400_BAD_REQUEST
@@ -174,6 +227,8 @@ class ProjectDetail(APIView):
 # ============================================================    
 class PledgeList(APIView):
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    throttle_classes = [UserWriteThrottle, IPWriteThrottle, ProjectWriteThrottle]
+    throttle_scope = 'pledge' # rates: WRITE_THROTTLE_RATES['pledge_user'] / ['pledge_ip'] / ['pledge_project']
     
     def get(self, request):
         '''
@@ -182,10 +237,13 @@ class PledgeList(APIView):
         WHAT IT DOES: Returns ALL pledges across all projects
         USED BY admin dashboards or analytics.
         '''
-        pledges = Pledge.objects.all()
-        serializer = PledgeSerializer(pledges, many=True)
-        return Response(serializer.data)
+        pledges = Pledge.objects.filter(status=APPROVED) # pledges waiting for moderation aren't public
+        # Same JSON as PledgeSerializer(pledges, many=True).data, built from plain rows
+        data = compact_pledges.data(pledges)
+        archive.hydrate_rows(data, 'project', 'id') # pledges of archived stories get their text back (archive.py)
+        return Response(data)
 
+    @idempotent # safe to retry with the same Idempotency-Key header
     def post(self, request):
         """
         POST /projects/pledges/
@@ -206,6 +264,11 @@ class PledgeList(APIView):
             serializer.errors, 
             status=status.HTTP_400_BAD_REQUEST
             )
+def can_see_unpublished(user, pledge):
+    """A pending / rejected pledge is visible to its supporter, the project's owner and staff."""
+    if not user.is_authenticated:
+        return False
+    return user.is_staff or user.pk == pledge.supporter_id or Project.objects.filter(pk=pledge.project_id, owner=user).exists()
 # ============================================================
 # PLEDGE DETAIL - Handle /projects/pledges/1/
 # ============================================================   
@@ -226,25 +289,51 @@ class PledgeDetail(APIView):
 
     def get(self, request, pk):
         """GET /projects/pledges/1/ - Get one specific pledge"""
-        pledge = self.get_object(pk)
+        pledge = archive.hydrate_pledge(self.get_object(pk))
+        if pledge.status != APPROVED and not can_see_unpublished(request.user, pledge):
+            raise Http404 # only its supporter and the project owner know it exists yet
         serializer = PledgeSerializer(pledge)
-        return Response(serializer.data)
+        return Response(serializer.data, headers={'ETag': etag(pledge)})
     
     def put(self, request, pk):
-        """PUT /projects/pledges/1/ - Update a pledge"""
-        pledge = self.get_object(pk)
+        """PUT /projects/pledges/1/ - Update a pledge (If-Match supported, see concurrency.py)"""
+        pledge = archive.hydrate_pledge(self.get_object(pk)) # the real text, in memory only
+        expected, error = expected_version(request, pledge)
+        if error:
+            return error
         serializer = PledgeSerializer(
             instance=pledge,
             data=request.data,
             partial=True
             )
         if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data)
+            with transaction.atomic():
+                if not claim_version(pledge, expected):
+                    return conflict(pledge)
+                archive.unarchive(pledge.project_id) # its story is live again - only once the edit is going through
+                serializer.save() # signals.py swaps the edited text into the story
+            return Response(serializer.data, headers={'ETag': etag(pledge)})
         return Response(
             serializer.errors,
             status=status.HTTP_400_BAD_REQUEST
             )
+
+    def delete(self, request, pk):
+        """
+        DELETE /projects/pledges/1/ - Remove a pledge
+
+        Its text is cut out of the project's story too (signals.py → content.py).
+        """
+        pledge = archive.hydrate_pledge(self.get_object(pk)) # its text, to cut out of the story
+        expected, error = expected_version(request, pledge)
+        if error:
+            return error
+        with transaction.atomic():
+            if not claim_version(pledge, expected):
+                return conflict(pledge)
+            archive.unarchive(pledge.project_id)
+            pledge.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
 # ============================================================
 # PLEDGE LIST CREATE - Handle /projects/1/pledges/
 # ============================================================
@@ -259,7 +348,10 @@ class PledgeListCreate(APIView):
     This is cleaner and more RESTful.
     """
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    throttle_classes = [UserWriteThrottle, IPWriteThrottle, ProjectWriteThrottle]
+    throttle_scope = 'pledge' # shares its buckets with PledgeList
     
+    @idempotent # safe to retry with the same Idempotency-Key header
     def post(self, request, project_id):
         # Check if user is logged in
         if not request.user.is_authenticated:
@@ -282,3 +374,336 @@ class PledgeListCreate(APIView):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+# ============================================================
+# STORY EXPORT - Handle /projects/export/
+# ============================================================
+class StoryExport(APIView):
+    """
+    Download finished (closed) stories as one archive.
+
+    GET /projects/export/                       → every closed story as .tar.gz
+    GET /projects/export/?archive=zip           → same, as a .zip
+    GET /projects/export/?ids=1,4,9&text=txt    → only some stories, as plain text
+
+    The archive holds one file per story plus a manifest.json of contributors.
+    It is STREAMED to the client while it is being built, so even a
+    huge library never sits in server memory.
+    """
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+
+    def get(self, request):
+        archive_format = request.query_params.get('archive', 'tar.gz')
+        text_format = request.query_params.get('text', 'md')
+        if archive_format not in ARCHIVE_FORMATS or text_format not in TEXT_FORMATS:
+            return Response(
+                {"error": f"archive must be one of {ARCHIVE_FORMATS}, text one of {TEXT_FORMATS}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        ids = None
+        if request.query_params.get('ids'):
+            try:
+                ids = [int(pk) for pk in request.query_params['ids'].split(',')]
+            except ValueError:
+                return Response({"error": "ids must be a comma-separated list of numbers."}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = StreamingHttpResponse(
+            iter_story_archive(closed_projects(ids), archive_format, text_format),
+            content_type=archive_content_type(archive_format),
+        )
+        response['Content-Disposition'] = f'attachment; filename="plottwist-stories.{archive_format}"'
+        return response
+
+# ============================================================
+# TRENDING - Handle /projects/trending/
+# ============================================================
+class ProjectTrending(APIView):
+    """
+    GET /projects/trending/          → the 20 hottest open projects
+    GET /projects/trending/?limit=50 → up to 100
+
+    "Hot" = lots of recent pledges (recent ones count more) and close to
+    the goal. The score is kept up to date on every pledge (see trending.py),
+    so this is one quick walk down an index.
+    """
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+
+    def get(self, request):
+        try:
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), 100)
+        except ValueError:
+            return Response({"error": "limit must be a number."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(compact_projects.data(trending_projects()[:limit]))
+
+# ============================================================
+# FOLLOW - Handle /projects/1/follow/
+# ============================================================
+class FollowProject(APIView):
+    """
+    GET    /projects/1/follow/ → {"following": true/false}
+    POST   /projects/1/follow/ → follow project #1 (new pledges show up in /users/me/feed/)
+    DELETE /projects/1/follow/ → stop following
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_project(self, pk):
+        try:
+            return Project.objects.only('id').get(pk=pk)
+        except Project.DoesNotExist:
+            raise Http404
+
+    def get(self, request, pk):
+        following = Follow.objects.filter(user=request.user, project_id=pk).exists()
+        return Response({"following": following})
+
+    def post(self, request, pk):
+        project = self.get_project(pk)
+        follow, created = Follow.objects.get_or_create(user=request.user, project=project)
+        return Response(
+            {"following": True},
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        )
+
+    def delete(self, request, pk):
+        for follow in Follow.objects.filter(user=request.user, project_id=pk):
+            follow.delete() # one by one, so the follower counter signal runs
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+# ============================================================
+# REVISIONS - Handle /projects/1/revisions/
+# ============================================================
+class ProjectRevisionList(APIView):
+    """
+    GET /projects/1/revisions/                 → the 50 newest revisions of project #1's story
+    GET /projects/1/revisions/?before=120      → the ones older than revision 120
+    GET /projects/1/revisions/?limit=10        → up to 200
+
+    One entry per change to the story text: owner edits, pledges added /
+    edited / removed, and restores.
+    """
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+
+    def get(self, request, pk):
+        if not Project.objects.filter(pk=pk).exists():
+            raise Http404
+        try:
+            limit = min(max(int(request.query_params.get('limit', 50)), 1), 200)
+            before = request.query_params.get('before')
+            before = int(before) if before else None
+        except ValueError:
+            return Response({"error": "limit and before must be numbers."}, status=status.HTTP_400_BAD_REQUEST)
+        history = ProjectRevision.objects.filter(project_id=pk).select_related('user').order_by('-number')
+        if before is not None:
+            history = history.filter(number__lt=before)
+        return Response(ProjectRevisionSerializer(history.defer('data')[:limit], many=True).data)
+
+
+class ProjectRevisionDetail(APIView):
+    """
+    GET /projects/1/revisions/7/ → revision 7, with the story text as it was then
+
+    Rebuilt from the nearest full snapshot plus a few small changes
+    (revisions.py), so old revisions are as quick to fetch as new ones.
+    """
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+
+    def get(self, request, pk, number):
+        try:
+            revision = ProjectRevision.objects.select_related('user').defer('data').get(project_id=pk, number=number)
+        except ProjectRevision.DoesNotExist:
+            raise Http404
+        data = ProjectRevisionSerializer(revision).data
+        data.update(revisions.content_at(pk, number))
+        return Response(data)
+
+
+class ProjectRevisionRestore(APIView):
+    """
+    POST /projects/1/revisions/7/restore/ → put revision 7's text back (owner only)
+
+    Nothing is lost: the restore itself becomes a new revision, so it can
+    be undone by restoring the revision before it.
+    """
+    permission_classes = [
+        permissions.IsAuthenticatedOrReadOnly,
+        IsOwnerOrReadOnly
+    ]
+
+    def post(self, request, pk, number):
+        try:
+            project = Project.objects.get(pk=pk)
+        except Project.DoesNotExist:
+            raise Http404
+        self.check_object_permissions(request, project)
+        try:
+            content = revisions.content_at(pk, number)
+        except ProjectRevision.DoesNotExist:
+            raise Http404
+        archive.hydrate(project, with_pledges=False) # the history compares against the real text
+        expected, error = expected_version(request, project)
+        if error:
+            return error
+        project.starting_content = content['starting_content']
+        project.current_content = content['current_content']
+        revisions.note_change(project, 'restore', request.user.pk)
+        with transaction.atomic():
+            if not claim_version(project, expected):
+                return conflict(project)
+            archive.unarchive(pk)
+            project.save(update_fields=['starting_content', 'current_content'])
+        return Response(ProjectDetailSerializer(project).data, headers={'ETag': etag(project)})
+
+# ============================================================
+# MODERATION - Handle /projects/moderation/
+# ============================================================
+class ModerationQueue(APIView):
+    """
+    GET  /projects/moderation/               → pledges waiting for YOUR review, oldest first
+    GET  /projects/moderation/?project=1     → just project #1's
+    GET  /projects/moderation/?after=120     → the next page (use "next_cursor")
+    POST /projects/moderation/               → {"approve": [4, 5, 6], "reject": [7]}
+
+    Only pledges on projects you own can be reviewed (staff: any). A whole
+    batch of approvals is added to each story in one write (moderation.py).
+    Ids that aren't yours or aren't waiting any more come back in "skipped".
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        try:
+            limit = min(max(int(request.query_params.get('limit', 50)), 1), 200)
+            after = request.query_params.get('after')
+            after = int(after) if after else None
+            project_id = request.query_params.get('project')
+            project_id = int(project_id) if project_id else None
+        except ValueError:
+            return Response({"error": "limit, after and project must be numbers."}, status=status.HTTP_400_BAD_REQUEST)
+        queue = moderation.pending_queue(request.user, project_id).select_related('supporter')
+        if after is not None:
+            queue = queue.filter(pk__gt=after)
+        pledges = list(queue[:limit + 1])
+        more = len(pledges) > limit
+        pledges = archive.hydrate_pledges(pledges[:limit])
+        return Response({
+            "results": PledgeSerializer(pledges, many=True).data,
+            "next_cursor": pledges[-1].pk if more else None,
+        })
+
+    def post(self, request):
+        decisions = {}
+        for action in ('approve', 'reject'):
+            ids = request.data.get(action, [])
+            if not isinstance(ids, list) or not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in ids):
+                return Response({"error": f"{action} must be a list of pledge ids."}, status=status.HTTP_400_BAD_REQUEST)
+            decisions[action] = set(ids)
+        if decisions['approve'] & decisions['reject']:
+            return Response({"error": "A pledge can't be approved and rejected at once."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(decisions['approve']) + len(decisions['reject']) > 500:
+            return Response({"error": "At most 500 pledges per request."}, status=status.HTTP_400_BAD_REQUEST)
+
+        allowed = moderation.moderated_by(request.user).only('id', 'project_id', 'supporter_id')
+        to_approve = list(allowed.filter(pk__in=decisions['approve']))
+        to_reject = list(allowed.filter(pk__in=decisions['reject']))
+        approved = moderation.approve(to_approve, moderator=request.user)
+        rejected = moderation.reject(to_reject, moderator=request.user)
+        return Response({
+            "approved": len(approved),
+            "rejected": len(rejected),
+            "skipped": sorted((decisions['approve'] | decisions['reject']) - set(approved) - set(rejected)),
+        })
+
+# ============================================================
+# SITE STATS - Handle /stats/
+# ============================================================
+class SiteStats(APIView):
+    """
+    GET /stats/                                  → the last 30 days, whole site
+    GET /stats/?from=2025-03-01&to=2025-03-31    → a date range (up to 366 days)
+    GET /stats/?genre=horror&content_type=poem   → one genre and/or content type
+
+    Per day: pledges, verses (sum of pledge amounts), distinct contributors
+    and new projects. Answered from the DailyStats rollups
+    (`python manage.py build_rollups`, see rollups.py), never from the
+    pledge table - "counted_at" says how fresh they are.
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        try:
+            last = date.fromisoformat(request.query_params['to']) if request.query_params.get('to') else timezone.localdate()
+            first = date.fromisoformat(request.query_params['from']) if request.query_params.get('from') else last - timedelta(days=29)
+        except ValueError:
+            return Response({"error": "from and to must be dates like 2025-03-31."}, status=status.HTTP_400_BAD_REQUEST)
+        if first > last or (last - first).days >= 366:
+            return Response({"error": "from must be before to, and at most 366 days apart."}, status=status.HTTP_400_BAD_REQUEST)
+        content_type = request.query_params.get('content_type', '')
+        if content_type and content_type not in dict(CONTENT_TYPE_CHOICES):
+            return Response({"error": f"Unknown content_type: {content_type}"}, status=status.HTTP_400_BAD_REQUEST)
+        genre_key = normalize_genre(request.query_params.get('genre', ''))
+
+        data = rollups.daily(first, last, genre_key, content_type)
+        return Response({
+            "from": first.isoformat(),
+            "to": last.isoformat(),
+            "genre": genre_key or None,
+            "content_type": content_type or None,
+            **data,
+        })
+
+# ============================================================
+# PROJECT STATS - Handle /projects/1/stats/
+# ============================================================
+class ProjectStats(APIView):
+    """
+    GET /projects/1/stats/ → how long project #1's story is, and who wrote how much of it
+
+    {
+        "word_count": 12000, "char_count": 68000, "reading_minutes": 52,
+        "pledge_count": 40, "other_words": 900,
+        "contributors": [
+            {"supporter": 7, "username": "tim", "pledges": 12, "words": 4100, "share": 0.3417},
+            {"supporter": null, "username": "Anonymous", ...}
+        ]
+    }
+
+    All from stored counts - the story text isn't even loaded. Anonymous
+    pledges are added up together under "Anonymous". "other_words" is the
+    rest of the story: the opening and the owner's own edits. A pledge the
+    owner has cut out of the story still counts as a pledge, but its words
+    don't.
+    """
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+
+    def get(self, request, pk):
+        project = Project.objects.filter(pk=pk).values('word_count', 'char_count', 'pledge_count').first()
+        if project is None:
+            raise Http404
+        totals = (
+            Pledge.objects.filter(project_id=pk, status=APPROVED)
+            .values('anonymous', 'supporter_id', 'supporter__username')
+            .annotate(
+                pledges=Count('id'),
+                # Only words still IN the story - not a pledge the owner has since edited out
+                words=Sum('word_count', filter=Q(segment_length__gt=0, current_offset__isnull=False)),
+            )
+        )
+        contributors = {}
+        for row in totals:
+            key = None if row['anonymous'] else row['supporter_id']
+            entry = contributors.setdefault(key, {
+                "supporter": key,
+                "username": 'Anonymous' if key is None else row['supporter__username'],
+                "pledges": 0,
+                "words": 0,
+            })
+            entry['pledges'] += row['pledges']
+            entry['words'] += row['words'] or 0
+        words = project['word_count']
+        for entry in contributors.values():
+            entry['share'] = round(entry['words'] / words, 4) if words else 0
+        pledged = sum(entry['words'] for entry in contributors.values())
+        return Response({
+            **project,
+            "reading_minutes": math.ceil(words / settings.READING_WORDS_PER_MINUTE) if words else 0,
+            "other_words": max(words - pledged, 0),
+            "contributors": sorted(contributors.values(), key=lambda entry: (-entry['words'], entry['username'])),
+        })
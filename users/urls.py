@@ -11,6 +11,8 @@ urlpatterns = [
     path('', views.CustomUserList.as_view()),
     # /users/1/ → Go to CustomUserDetail view for user with ID 1 (pk1)
     path('<int:pk>/', views.CustomUserDetail.as_view()),
+    # /users/me/feed/ → New pledges on projects the logged-in user follows
+    path('me/feed/', views.UserFeed.as_view()),
 ]
 
 
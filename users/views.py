@@ -7,11 +7,12 @@ This file handles HTTP requests - what happens when someone visits /users/ or /u
 from django.http import Http404
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework import status
+from rest_framework import status, permissions
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.authtoken.models import Token
 from .models import CustomUser
 from .serializers import CustomUserSerializer
+from projects.feed import feed_page
 
 class CustomUserList(APIView):
     
@@ -137,3 +138,35 @@ class CustomAuthToken(ObtainAuthToken):
             'email': user.email
         })
 
+
+class UserFeed(APIView):
+    """
+    Handles /users/me/feed/ - the logged-in user's activity feed
+
+    Shows new pledges on projects the user follows, newest first.
+
+    API ENDPOINT: /users/me/feed/?limit=20&before=<next_cursor>
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        """
+        HTTP GET /users/me/feed/
+
+        RETURNS:
+        {
+            "results": [{"pledge": 42, "project": 1, "project_title": "...", ...}, ...],
+            "next_cursor": 17    ← send back as ?before=17 for the next page (null = no more)
+        }
+        """
+        try:
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), 100)
+            before = request.query_params.get('before')
+            before = int(before) if before else None
+        except ValueError:
+            return Response(
+                {"error": "limit and before must be numbers."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        items, next_cursor = feed_page(request.user, before=before, limit=limit)
+        return Response({"results": items, "next_cursor": next_cursor})